@@ -0,0 +1,138 @@
+"""
+Benchmark of forking and writing memory with many objects.
+Compares the memory with the objects in persistent maps (HAMT)
+with the previous memory that kept the objects in copy-on-write dicts
+and marked every object read-only on fork.
+
+Run from the root of the repository: python bench/memory-maps.py [N ...]
+"""
+
+import random
+from copy import copy
+from sys import argv, path as syspath
+from os.path import abspath, dirname, join as pathjoin
+from time import perf_counter
+
+syspath.insert(0, abspath(pathjoin(dirname(__file__), "..")))
+
+from slowbeast.core.callstack import CallStack
+from slowbeast.domains.concrete_bitvec import ConcreteBitVec
+from slowbeast.domains.pointer import Pointer
+from slowbeast.ir.instruction import GlobalVariable
+from slowbeast.ir.types import get_offset_type, get_size_type
+from slowbeast.symexe.memory import Memory
+from slowbeast.symexe.memoryobject import MemoryObject
+
+
+class COWDictMemory:
+    """
+    The previous memory with the objects in copy-on-write dicts (only
+    the parts used by the benchmark). It does not derive from Memory,
+    so it does none of the bookkeeping of the current memory.
+    """
+
+    def __init__(self) -> None:
+        self._objects = {}
+        self._objects_ro = False
+        self._glob_objects = {}
+        self._glob_objects_ro = False
+        self._glob_bindings = {}
+        self._glob_bindings_ro = False
+        self._cs = CallStack()
+
+    def copy(self) -> "COWDictMemory":
+        new = COWDictMemory()
+        new._objects = self._objects
+        new._objects_ro = self._objects_ro = True
+        new._glob_objects = self._glob_objects
+        new._glob_objects_ro = self._glob_objects_ro = True
+        new._glob_bindings = self._glob_bindings
+        new._glob_bindings_ro = self._glob_bindings_ro = True
+        for o in self._objects.values():
+            o._set_ro()
+        for o in self._glob_objects.values():
+            o._set_ro()
+        new._cs = self._cs.copy()
+        return new
+
+    def allocate_global(self, G) -> Pointer:
+        o = MemoryObject(G.size(), G.name(), None, False, True)
+        o.set_allocation(G)
+        if self._glob_objects_ro:
+            self._glob_objects = copy(self._glob_objects)
+            self._glob_objects_ro = False
+        self._glob_objects[o.get_id()] = o
+        if self._glob_bindings_ro:
+            self._glob_bindings = copy(self._glob_bindings)
+            self._glob_bindings_ro = False
+        ptr = Pointer(ConcreteBitVec(o.get_id(), get_size_type()))
+        self._glob_bindings[G] = ptr
+        return ptr
+
+    def write(self, ptr, x):
+        objid = ptr.object().value()
+        obj = self._objects.get(objid)
+        isglob = obj is None
+        if isglob:
+            obj = self._glob_objects.get(objid)
+            if self._glob_objects_ro:
+                self._glob_objects = copy(self._glob_objects)
+                self._glob_objects_ro = False
+        elif self._objects_ro:
+            self._objects = copy(self._objects)
+            self._objects_ro = False
+        if obj._is_ro():
+            obj = obj.writable_copy()
+            if isglob:
+                self._glob_objects[objid] = obj
+            else:
+                self._objects[objid] = obj
+        return obj.write(x, ptr.offset())
+
+
+def build(cls, nobjs: int):
+    mem = cls()
+    ptrs = [
+        mem.allocate_global(GlobalVariable(ConcreteBitVec(8, 64), f"g{i}"))
+        for i in range(nobjs)
+    ]
+    return mem, ptrs
+
+
+def run(cls, nobjs: int, forks: int, writes: int):
+    """Fork the memory and write to a few objects of the fork, then continue
+    with the fork (like DFS does). Return the time of forking
+    and the time of writing."""
+    rnd = random.Random(nobjs)
+    mem, ptrs = build(cls, nobjs)
+    val = ConcreteBitVec(1, 32)
+    off = ConcreteBitVec(0, get_offset_type())
+    fork_time, write_time = 0.0, 0.0
+    for _ in range(forks):
+        start = perf_counter()
+        mem = mem.copy()
+        fork_time += perf_counter() - start
+        start = perf_counter()
+        for _ in range(writes):
+            ptr = rnd.choice(ptrs)
+            mem.write(Pointer(ptr.object(), off), val)
+        write_time += perf_counter() - start
+    return fork_time, write_time
+
+
+def main():
+    forks, writes = 1000, 2
+    sizes = [int(n) for n in argv[1:]] or [10, 100, 1000, 10000]
+    print(f"{forks} forks, each followed by {writes} writes to random objects")
+    print(f"{'objects':>8} {'memory':>10} {'fork [us]':>10} {'write [us]':>11}")
+    for n in sizes:
+        for name, cls in (("cow-dict", COWDictMemory), ("hamt", Memory)):
+            fork_time, write_time = run(cls, n, forks, writes)
+            print(
+                f"{n:>8} {name:>10} {fork_time / forks * 1e6:>10.2f} "
+                f"{write_time / (forks * writes) * 1e6:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
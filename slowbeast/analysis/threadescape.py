@@ -0,0 +1,254 @@
+from slowbeast.ir.argument import Argument
+from slowbeast.ir.function import Function
+from slowbeast.ir.instruction import (
+    Alloc,
+    Call,
+    Cmp,
+    GlobalVariable,
+    Instruction,
+    Load,
+    Return,
+    Store,
+    Thread,
+    ThreadJoin,
+)
+from slowbeast.ir.program import Program
+
+# stands for an object that the analysis does not know
+UNKNOWN = None
+
+# undefined functions that do not make their arguments reachable
+# from anywhere else
+NON_CAPTURING_FUNS = (
+    "pthread_mutex_init",
+    "pthread_mutex_destroy",
+    "pthread_mutex_lock",
+    "pthread_mutex_unlock",
+)
+
+
+class ThreadEscape:
+    """
+    Flow- and context-insensitive analysis of which memory objects
+    (allocations and global variables) can be accessed by more than one
+    thread.
+
+    For every value, the analysis computes the set of objects it may point
+    to (in the style of Andersen's analysis) and for every object the set
+    of objects whose addresses it may contain. An object escapes if its
+    address is passed to a new thread, returned from a thread, stored into
+    escaping or unknown memory or passed to an unknown function. Global
+    variables escape unless they are used only by functions that are
+    reachable from the entry function and not from any thread.
+    Accesses via pointers that may point only to objects that do not
+    escape are invisible to other threads.
+    """
+
+    __slots__ = (
+        "_program",
+        "_pts",
+        "_contents",
+        "_rets",
+        "_roots",
+        "_thread_funs",
+        "_escaped",
+        "_local",
+    )
+
+    def __init__(self, P: Program) -> None:
+        self._program = P
+        # points-to sets of loads, calls and arguments, the points-to sets
+        # of other values are computed from their operands
+        self._pts = {}
+        # objects whose addresses an object may contain
+        self._contents = {}
+        # objects to which the return values of functions may point
+        self._rets = {}
+        # objects that escape directly
+        self._roots = set()
+        self._thread_funs = set()
+        self._escaped = set()
+        self._local = frozenset()
+
+        self._run()
+
+    def escapes(self, obj) -> bool:
+        """Can the object (Alloc or GlobalVariable) be accessed
+        by more threads?"""
+        return obj in self._escaped
+
+    def is_thread_local(self, ptr) -> bool:
+        """Does the pointer operand of a load or store point only
+        to objects that cannot be accessed by other threads?"""
+        return ptr in self._local
+
+    def thread_local_pointers(self) -> frozenset:
+        """Pointer operands of loads and stores that point only
+        to objects that cannot be accessed by other threads"""
+        return self._local
+
+    def _instructions(self):
+        for g in self._program.globals():
+            yield from g.init() or ()
+        for fun in self._program.funs():
+            for block in fun.bblocks():
+                yield from block.instructions()
+
+    def points_to(self, v) -> frozenset:
+        if isinstance(v, (Alloc, GlobalVariable)):
+            return frozenset((v,))
+        if isinstance(v, (Load, Call, ThreadJoin, Argument)):
+            return self._pts.get(v, frozenset())
+        if isinstance(v, Cmp) or not isinstance(v, Instruction):
+            return frozenset()
+        # arithmetic, casts, ... may point to what their operands point to
+        pts = frozenset()
+        for op in v.operands():
+            pts |= self.points_to(op)
+        return pts
+
+    def _add(self, mapping: dict, key, objs) -> bool:
+        old = mapping.get(key, frozenset())
+        new = old | objs
+        if new == old:
+            return False
+        mapping[key] = new
+        return True
+
+    def _escape(self, objs) -> bool:
+        objs = {o for o in objs if o is not UNKNOWN}
+        if objs <= self._roots:
+            return False
+        self._roots |= objs
+        return True
+
+    def _run(self) -> None:
+        P = self._program
+        unknown = frozenset((UNKNOWN,))
+        entry = P.entry()
+        address_taken = set()
+        for I in self._instructions():
+            if isinstance(I, Thread):
+                self._thread_funs.add(I.called_function())
+            for op in I.operands():
+                if isinstance(op, Function):
+                    address_taken.add(op)
+        # functions called from unknown places get unknown arguments
+        for fun in (entry, *self._thread_funs, *address_taken):
+            for arg in fun.arguments():
+                self._pts[arg] = unknown
+
+        changed = True
+        while changed:
+            changed = False
+            for I in self._instructions():
+                changed |= self._transfer(I, unknown)
+
+        self._escaped = self._compute_escaped(address_taken)
+        local = set()
+        for I in self._instructions():
+            if isinstance(I, (Load, Store)):
+                ptr = I.pointer_operand()
+                pts = self.points_to(ptr)
+                if pts and UNKNOWN not in pts and pts.isdisjoint(self._escaped):
+                    local.add(ptr)
+        self._local = frozenset(local)
+
+    def _transfer(self, I, unknown: frozenset) -> bool:
+        changed = False
+        if isinstance(I, Store):
+            val = self.points_to(I.value_operand())
+            for o in self.points_to(I.pointer_operand()):
+                if o is UNKNOWN:
+                    changed |= self._escape(val)
+                else:
+                    changed |= self._add(self._contents, o, val)
+        elif isinstance(I, Load):
+            pts = frozenset()
+            for o in self.points_to(I.pointer_operand()):
+                pts |= unknown if o is UNKNOWN else self._contents.get(o, pts)
+            changed |= self._add(self._pts, I, pts)
+        elif isinstance(I, Thread):
+            changed |= self._escape(self._operands_points_to(I))
+        elif isinstance(I, Call):
+            fun = I.called_function()
+            if isinstance(fun, Function) and not fun.is_undefined():
+                for arg, op in zip(fun.arguments(), I.operands()):
+                    changed |= self._add(self._pts, arg, self.points_to(op))
+                changed |= self._add(self._pts, I, self._rets.get(fun, frozenset()))
+            else:
+                if not (
+                    isinstance(fun, Function) and fun.name() in NON_CAPTURING_FUNS
+                ):
+                    changed |= self._escape(self._operands_points_to(I))
+                changed |= self._add(self._pts, I, unknown)
+        elif isinstance(I, ThreadJoin):
+            changed |= self._add(self._pts, I, unknown)
+        elif isinstance(I, Return) and I.operands():
+            fun = I.fun()
+            pts = self.points_to(I.operand(0))
+            changed |= self._add(self._rets, fun, pts)
+            if fun in self._thread_funs:
+                changed |= self._escape(pts)
+        return changed
+
+    def _operands_points_to(self, I) -> frozenset:
+        pts = frozenset()
+        for op in I.operands():
+            pts |= self.points_to(op)
+        return pts
+
+    def _compute_escaped(self, address_taken) -> set:
+        escaped = set(self._roots)
+        escaped.update(self._shared_globals(address_taken))
+        queue = list(escaped)
+        while queue:
+            o = queue.pop()
+            for c in self._contents.get(o, ()):
+                if c is not UNKNOWN and c not in escaped:
+                    escaped.add(c)
+                    queue.append(c)
+        return escaped
+
+    def _shared_globals(self, address_taken):
+        """Global variables used by functions that a thread may execute"""
+        P = self._program
+        reachable = set()
+        queue = list(self._thread_funs)
+        indirect = False
+        while queue:
+            fun = queue.pop()
+            if fun in reachable:
+                continue
+            reachable.add(fun)
+            for block in fun.bblocks():
+                for I in block.instructions():
+                    if not isinstance(I, Call):
+                        continue
+                    called = I.called_function()
+                    if isinstance(called, Function):
+                        queue.append(called)
+                    elif not indirect:
+                        # a call via a function pointer may call any function
+                        # whose address is taken
+                        indirect = True
+                        queue.extend(address_taken)
+        if P.entry() in reachable:
+            return P.globals()
+
+        shared = set()
+        for fun in reachable:
+            for block in fun.bblocks():
+                for I in block.instructions():
+                    _used_globals(I, shared)
+        return shared
+
+
+def _used_globals(v, globs: set) -> None:
+    """Gather global variables that the value uses (possibly via operands
+    that are not placed in any block, e.g., constant expressions)"""
+    for op in v.operands():
+        if isinstance(op, GlobalVariable):
+            globs.add(op)
+        elif isinstance(op, Instruction) and op.bblock() is None:
+            _used_globals(op, globs)
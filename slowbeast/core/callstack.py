@@ -2,6 +2,8 @@ from copy import copy
 from sys import stdout
 from typing import TextIO
 
+from slowbeast.core.memoryobject import values_equal
+
 
 class CallStack:
     class Frame:
@@ -9,6 +11,7 @@ class CallStack:
             "function",
             "returnsite",
             "_values",
+            "_values_hash",
             "_scoped_objects",
             "_values_ro",
             "_scoped_objects_ro",
@@ -19,23 +22,38 @@ class CallStack:
             self.function = fun
             self.returnsite = returnsite
             self._values = v.copy() if v else {}
+            # xor of the hashes of the items of _values, updated on every set
+            self._values_hash = 0
+            for item in self._values.items():
+                self._values_hash ^= hash(item)
             self._scoped_objects = []
             self._values_ro = False
             self._scoped_objects_ro = False
             # whole frame is read only
             self._ro = False
 
-        # def __eq__(self, rhs):
-        #    return (
-        #        self.function == rhs.function
-        #        and self.values == rhs.values
-        #        and self.returnsite == rhs.returnsite
-        #    )
-
-        # def __hash__(self):
-        #    r = reduce(xor, map(hash, self.values), 0) ^ hash(self.function)
-        #    rets = self.returnsite
-        #    return r ^ hash(rets) if rets else r
+        def structural_hash(self) -> int:
+            return hash((self.function, self.returnsite, self._values_hash))
+
+        def structurally_equal(self, rhs) -> bool:
+            if self is rhs:
+                return True
+            if (
+                self.function is not rhs.function
+                or self.returnsite is not rhs.returnsite
+                or self._values_hash != rhs._values_hash
+            ):
+                return False
+            if [mo.get_id() for mo in self._scoped_objects] != [
+                mo.get_id() for mo in rhs._scoped_objects
+            ]:
+                return False
+            values, rvalues = self._values, rhs._values
+            return values is rvalues or (
+                len(values) == len(rvalues)
+                and all(values_equal(v, rvalues.get(x)) for x, v in values.items())
+            )
+
         def set_ro(self):
             self._ro = True
             self._values_ro = True
@@ -53,6 +71,7 @@ class CallStack:
         def copy(self):
             new = CallStack.Frame(self.function, self.returnsite)
             new._values = self._values
+            new._values_hash = self._values_hash
             new._scoped_objects = self._scoped_objects
             new._values_ro = True
             new._scoped_objects_ro = True
@@ -60,6 +79,23 @@ class CallStack:
             self._scoped_objects_ro = True
             return new
 
+        def snapshot(self):
+            """A read-only copy of the frame that does not take the ownership
+            of the values from this frame (the owned values are copied)"""
+            if self._ro:
+                # the frame is copied before it is changed
+                return self
+            new = CallStack.Frame(self.function, self.returnsite)
+            new._values = self._values if self._values_ro else self._values.copy()
+            new._values_hash = self._values_hash
+            new._scoped_objects = (
+                self._scoped_objects
+                if self._scoped_objects_ro
+                else self._scoped_objects.copy()
+            )
+            new.set_ro()
+            return new
+
         def _objects_reown(self):
             assert self._ro is False
             if self._scoped_objects_ro:
@@ -73,15 +109,20 @@ class CallStack:
         def clear(self):
             self._values_ro = False
             self._values = {}
+            self._values_hash = 0
             self._scoped_objects_ro = False
             self._scoped_objects = {}
 
         def set_values(self, values):
-            self._values_reown()
-            self._values.update(values)
+            for what, v in values.items():
+                self.set(what, v)
 
         def set(self, what, v):
             self._values_reown()
+            old = self._values.get(what)
+            if old is not None:
+                self._values_hash ^= hash((what, old))
+            self._values_hash ^= hash((what, v))
             self._values[what] = v
 
         def get(self, v):
@@ -113,6 +154,27 @@ class CallStack:
             f.set_ro()
         return new
 
+    def snapshot(self) -> "CallStack":
+        """A read-only copy of the call stack. Unlike copy(), the call stack
+        keeps the ownership of its frames, only the frames that it owns
+        are copied."""
+        new = CallStack()
+        new._cs = [f.snapshot() for f in self._cs]
+        new._cs_ro = True
+        return new
+
+    def structural_hash(self) -> int:
+        """Hash of the frames and their values,
+        O(1) in the number of the values"""
+        return hash(tuple(f.structural_hash() for f in self._cs))
+
+    def structurally_equal(self, rhs: "CallStack") -> bool:
+        cs, rcs = self._cs, rhs._cs
+        return cs is rcs or (
+            len(cs) == len(rcs)
+            and all(f.structurally_equal(rf) for f, rf in zip(cs, rcs))
+        )
+
     def _cs_reown(self) -> None:
         if self._cs_ro:
             self._cs = self._cs.copy()
@@ -7,7 +7,8 @@ from slowbeast.core.errors import MemError
 from slowbeast.core.memoryobject import MemoryObject
 from slowbeast.domains.pointer import Pointer
 from slowbeast.ir.instruction import Alloc, GlobalVariable
-from slowbeast.ir.types import get_size_type
+from slowbeast.ir.types import get_offset_type, get_size_type
+from slowbeast.util.hamt import PersistentMap
 from ..domains.concrete_bitvec import ConcreteBitVec
 
 
@@ -19,10 +20,20 @@ class Memory:
     """
 
     def __init__(self) -> None:
-        self._objects = {}
-        self._objects_ro = False
-        self._glob_objects = {}
-        self._glob_objects_ro = False
+        # the maps of objects are persistent, so they are shared between
+        # copies of the memory and an update copies only a few nodes.
+        # The objects are shared too, _owned are the ids of the objects
+        # that are not shared with another memory and can be written.
+        self._objects = PersistentMap()
+        self._glob_objects = PersistentMap()
+        self._owned = set()
+        # the initial values of objects that are written into
+        # the objects on the first access (id -> value at offset 0)
+        self._pending_inits = PersistentMap()
+        # xor of the structural hashes of all objects (the objects
+        # with pending initial values are hashed as if the values
+        # were written), updated on every change of the objects
+        self._objects_hash = 0
         self._glob_bindings = {}
         self._glob_bindings_ro = False
         # TODO: keep heap allocations separately too?
@@ -33,26 +44,67 @@ class Memory:
         self._cs = CallStack()
 
     def __eq__(self, rhs: object):
-        return (
-            isinstance(rhs, Memory)
-            and self._objects == rhs._objects
-            and self._cs == self._cs
-        )
+        return isinstance(rhs, Memory) and self.structurally_equal(rhs)
+
+    def structural_hash(self) -> int:
+        """Hash of the objects and the call stack, O(1) in the number
+        of the objects and the values. Structurally equal memories
+        have equal hashes."""
+        return hash((self._objects_hash, self._cs.structural_hash()))
+
+    def structurally_equal(self, rhs: "Memory") -> bool:
+        return self.objects_equal(rhs) and self._cs.structurally_equal(rhs._cs)
+
+    def objects_hash(self) -> int:
+        """Hash of the objects (without the call stack), O(1)"""
+        return self._objects_hash
+
+    def objects_equal(self, rhs: "Memory") -> bool:
+        """Whether the memories have the same objects with the same contents.
+        The hashes are compared first, so the contents are compared
+        only if the memories are very likely equal."""
+        if self._objects_hash != rhs._objects_hash:
+            return False
+        return self._same_objects(
+            self._objects, rhs, rhs._objects
+        ) and self._same_objects(self._glob_objects, rhs, rhs._glob_objects)
+
+    def _same_objects(self, objects, rhs: "Memory", robjects) -> bool:
+        if objects is robjects and self._pending_inits is rhs._pending_inits:
+            return True
+        if len(objects) != len(robjects):
+            return False
+        pending, rpending = self._pending_inits, rhs._pending_inits
+        for objid, o in objects.items():
+            ro = robjects.get(objid)
+            if ro is None:
+                return False
+            if o is ro and pending.get(objid) is rpending.get(objid):
+                continue
+            if not self._materialized(o).structurally_equal(rhs._materialized(ro)):
+                return False
+        return True
+
+    def _materialized(self, o: MemoryObject) -> MemoryObject:
+        """The object with its pending initial value written (if any)"""
+        value = self._pending_inits.get(o.get_id())
+        if value is None:
+            return o
+        tmp = o.writable_copy()
+        err = tmp.write(value, ConcreteBitVec(0, get_offset_type()))
+        assert err is None, f"Failed initializing mo{o.get_id()}: {err}"
+        return tmp
 
     def _copy_to(self, new):
         new._objects = self._objects
-        new._objects_ro = True
-        self._objects_ro = True
         new._glob_objects = self._glob_objects
-        new._glob_objects_ro = True
-        self._glob_objects_ro = True
+        new._owned = set()
+        self._owned = set()
+        new._pending_inits = self._pending_inits
+        new._objects_hash = self._objects_hash
         new._glob_bindings = self._glob_bindings
         new._glob_bindings_ro = True
         self._glob_bindings_ro = True
-        for o in self._objects.values():
-            o._set_ro()
-        for o in self._glob_objects.values():
-            o._set_ro()
         # do not take a reference, but do directly a copy,
         # we'll very probably modify it soon (it's cow internally)
         new._cs = self._cs.copy()
@@ -63,6 +115,33 @@ class Memory:
         self._copy_to(new)
         return new
 
+    def snapshot(self) -> "Memory":
+        """
+        Return a copy of the memory that is not going to be changed (e.g.,
+        to compare it with other memories later). Unlike copy(), this memory
+        keeps the ownership of its objects: the snapshot takes the owned
+        objects and this memory continues with their writable copies,
+        so only the owned objects are copied.
+        """
+        new = type(self)()
+        new._objects = self._objects
+        new._glob_objects = self._glob_objects
+        new._pending_inits = self._pending_inits
+        new._objects_hash = self._objects_hash
+        new._glob_bindings = self._glob_bindings
+        new._glob_bindings_ro = True
+        self._glob_bindings_ro = True
+        new._cs = self._cs.snapshot()
+        owned, self._owned = self._owned, set()
+        for objid in owned:
+            obj = self._objects.get(objid)
+            isglob = obj is None
+            if isglob:
+                obj = self._glob_objects.get(objid)
+            if obj is not None:
+                self._own_obj(obj.writable_copy(), isglob)
+        return new
+
     def create_memory_object(
         self,
         size,
@@ -79,17 +158,19 @@ class Memory:
         """
         return MemoryObject(size, nm, objid, is_heap, is_glob, is_const)
 
-    def _objs_reown(self) -> None:
-        if self._objects_ro:
-            assert all([x._is_ro() for x in self._objects.values()])
-            self._objects = copy(self._objects)
-            self._objects_ro = False
-
-    def _globs_reown(self) -> None:
-        if self._glob_objects_ro:
-            assert all([x._is_ro() for x in self._glob_objects.values()])
-            self._glob_objects = copy(self._glob_objects)
-            self._glob_objects_ro = False
+    def _own_obj(self, o: MemoryObject, isglob: bool) -> None:
+        """Put the object that is not shared with another memory
+        into this memory (replacing the object with the same id)"""
+        objects = self._glob_objects if isglob else self._objects
+        old = objects.get(o.get_id())
+        if old is not None:
+            self._objects_hash ^= old.structural_hash()
+        self._objects_hash ^= o.structural_hash()
+        if isglob:
+            self._glob_objects = objects.set(o.get_id(), o)
+        else:
+            self._objects = objects.set(o.get_id(), o)
+        self._owned.add(o.get_id())
 
     def _globs_bindings_reown(self) -> None:
         if self._glob_bindings_ro:
@@ -103,9 +184,16 @@ class Memory:
         # pop current scope
         scope = self.get_cs().current_scoped_objects()
         # delete the memory objects
-        self._objs_reown()
+        objects, owned, pending = self._objects, self._owned, self._pending_inits
         for mo in scope:
-            del self._objects[mo.get_id()]
+            o = objects.get(mo.get_id())
+            if o is not None:
+                self._objects_hash ^= self._materialized(o).structural_hash()
+                objects = objects.delete(mo.get_id())
+                pending = pending.delete(mo.get_id())
+            owned.discard(mo.get_id())
+        self._objects = objects
+        self._pending_inits = pending
 
     def _allocate(
         self,
@@ -140,9 +228,8 @@ class Memory:
         if not is_heap:
             self.add_mo_to_current_scope(o)
 
-        self._objs_reown()
         assert self._objects.get(o.get_id()) is None
-        self._objects[o.get_id()] = o
+        self._own_obj(o, False)
 
         return Pointer(ConcreteBitVec(o.get_id(), get_size_type()))
 
@@ -158,9 +245,8 @@ class Memory:
         if G.is_constant():
             o.set_read_only()
 
-        self._globs_reown()
         assert self._glob_objects.get(o.get_id()) is None
-        self._glob_objects[o.get_id()] = o
+        self._own_obj(o, True)
 
         self._globs_bindings_reown()
         assert self._glob_bindings_ro is False
@@ -170,6 +256,27 @@ class Memory:
 
         return ptr
 
+    def defer_init(self, ptr: Pointer, value) -> None:
+        """Write the value to the beginning of the object pointed by ptr
+        when the object is accessed for the first time"""
+        assert ptr.offset().is_concrete() and ptr.offset().value() == 0, ptr
+        objid = ptr.object().value()
+        o = self._glob_objects.get(objid) or self._objects.get(objid)
+        self._objects_hash ^= self._materialized(o).structural_hash()
+        self._pending_inits = self._pending_inits.set(objid, value)
+        self._objects_hash ^= self._materialized(o).structural_hash()
+
+    def _init_pending(self, objid) -> None:
+        value = self._pending_inits.get(objid)
+        if value is None:
+            return
+        self._pending_inits = self._pending_inits.delete(objid)
+        # the object is already hashed with the value written
+        objects_hash = self._objects_hash
+        err = self.write(Pointer(ConcreteBitVec(objid, get_size_type())), value)
+        assert err is None, f"Failed initializing mo{objid}: {err}"
+        self._objects_hash = objects_hash
+
     def has_global_object(self, moid) -> bool:
         return self._glob_objects.get(moid) is not None
 
@@ -177,17 +284,25 @@ class Memory:
         return self._objects.get(moid) is not None or self.has_global_object(moid)
 
     def get_obj(self, moid):
+        """Return the object with the given id. The object is returned
+        as it looks with its pending initial value written, but the value
+        is written into the memory only on an access (read or write),
+        so that queries do not change the memory."""
         if moid.is_concrete():
             moid = moid.value()
         assert isinstance(moid, int), f"Invalid MO ID: {moid}"
         obj = self._objects.get(moid)
         if obj is None:
-            return self._glob_objects.get(moid)
+            obj = self._glob_objects.get(moid)
+        if obj is not None and self._pending_inits:
+            return self._materialized(obj)
         return obj
 
     def write(self, ptr, x):
         isglob = False
         objid = ptr.object().value()
+        if self._pending_inits:
+            self._init_pending(objid)
         obj = self._objects.get(objid)
         if obj is None:
             obj = self._glob_objects.get(objid)
@@ -196,22 +311,19 @@ class Memory:
         if obj is None:
             return MemError(MemError.INVALID_OBJ, str(ptr.object()))
 
-        if isglob:
-            self._globs_reown()
-        else:
-            self._objs_reown()
-
-        if obj._is_ro():  # copy on write
+        if objid not in self._owned:  # copy on write
             obj = obj.writable_copy()
             assert not obj._is_ro()
-            if isglob:
-                self._glob_objects[obj.get_id()] = obj
-            else:
-                self._objects[obj.get_id()] = obj
+            self._own_obj(obj, isglob)
 
-        return obj.write(x, ptr.offset())
+        objhash = obj.structural_hash()
+        err = obj.write(x, ptr.offset())
+        self._objects_hash ^= objhash ^ obj.structural_hash()
+        return err
 
     def read(self, ptr, bytes_num):
+        if self._pending_inits:
+            self._init_pending(ptr.object().value())
         obj = self._objects.get(ptr.object().value())
         if obj is None:
             obj = self._glob_objects.get(ptr.object().value())
@@ -269,6 +381,10 @@ class Memory:
         stream.write("-- Objects:\n")
         for o in self._objects.values():
             o.dump(stream)
+        if self._pending_inits:
+            stream.write("-- Initial values (not written yet):\n")
+            for objid, v in self._pending_inits.items():
+                stream.write(f"mo{objid} -> {v}\n")
         stream.write("-- Call stack:\n")
         self._cs.dump(stream)
 
@@ -282,20 +398,19 @@ class Memory:
         if obj is None:
             return
 
-        if isglob:
-            self._globs_reown()
-        else:
-            self._objs_reown()
+        # the contents are forgotten
+        self._objects_hash ^= self._materialized(obj).structural_hash()
+        self._pending_inits = self._pending_inits.delete(objid)
+        self._objects_hash ^= obj.structural_hash()
 
-        if obj._is_ro():
+        if objid not in self._owned:
             obj = obj.clean_copy()
             assert not obj._is_ro()
-            if isglob:
-                self._glob_objects[obj.get_id()] = obj
-            else:
-                self._objects[obj.get_id()] = obj
+            self._own_obj(obj, isglob)
         else:
+            self._objects_hash ^= obj.structural_hash()
             obj.clear()
+            self._objects_hash ^= obj.structural_hash()
 
     def havoc(self, objs=None, without=None) -> None:
         """Havoc the contents of memory"""
@@ -308,25 +423,28 @@ class Memory:
                 havoc_obj(o.get_id())
             return
 
-        # create clean objects
-        newobjs = {}
-        for p, o in self._objects.items():
-            if without and o in without:
-                newobjs[p] = o.copy()
-            else:
-                newobjs[p] = o.clean_copy()
-        self._objects = newobjs
-        self._objects_ro = False
-
-        # create clean global objects
-        newobjs = {}
-        for p, o in self._glob_objects.items():
-            if without and o in without:
-                newobjs[p] = o.copy()
-            else:
-                newobjs[p] = o.clean_copy()
-        self._glob_objects = newobjs
-        self._glob_objects_ro = False
+        # the kept objects must have their initial values
+        for o in without or ():
+            if self._pending_inits:
+                self._init_pending(o.get_id())
+        self._pending_inits = PersistentMap()
+
+        # create clean objects (and clean global objects)
+        def clean(objects):
+            for p, o in objects.items():
+                if without and o in without:
+                    yield p, o.writable_copy()
+                else:
+                    yield p, o.clean_copy()
+
+        self._objects = PersistentMap(clean(self._objects))
+        self._glob_objects = PersistentMap(clean(self._glob_objects))
+        self._owned = set(self._objects.keys())
+        self._owned.update(self._glob_objects.keys())
+        self._objects_hash = 0
+        for objects in (self._objects, self._glob_objects):
+            for o in objects.values():
+                self._objects_hash ^= o.structural_hash()
 
         # clear values in call stack
         # FIXME: do not havoc the 'without' objects
@@ -1,21 +1,41 @@
+from bisect import bisect_left, insort
 from copy import copy
 from sys import stdout
 from typing import Union, Optional, TextIO
 
 from slowbeast.core.errors import MemError
-from slowbeast.domains.concrete_bitvec import ConcreteBitVec
+from slowbeast.domains.concrete_bitvec import ConcreteBitVec, ConcreteBitVecDomain
 from slowbeast.domains.concrete_value import ConcreteVal
+from slowbeast.domains.pointer import Pointer
 from slowbeast.domains.value import Value
 from slowbeast.ir.instruction import Alloc, GlobalVariable
 from slowbeast.ir.types import get_offset_type
 
 
+def values_equal(a: Optional[Value], b: Optional[Value]) -> bool:
+    """Structural equality of values (expressions are equal
+    if they are the same terms)"""
+    if a is b:
+        return True
+    if type(a) is not type(b) or a is None:
+        return False
+    if isinstance(a, Pointer):
+        return values_equal(a.object(), b.object()) and values_equal(
+            a.offset(), b.offset()
+        )
+    if a.is_concrete():
+        return a == b
+    return a.unwrap().eq(b.unwrap())
+
+
 class MemoryObject:
     ids = 0
 
     __slots__ = (
         "_id",
         "_values",
+        "_values_hash",
+        "_offsets",
         "_size",
         "_name",
         "_allocation",
@@ -42,6 +62,11 @@ class MemoryObject:
             self._id = MemoryObject.ids
 
         self._values = {}  # until we support composite objects, use just 'value'
+        # xor of the hashes of the (offset, value) pairs in _values,
+        # updated on every write
+        self._values_hash = 0
+        # sorted offsets of _values, the stored values do not overlap
+        self._offsets = []
         self._size = size
         self._name = nm  # for debugging
         self._allocation = None  # which allocation allocated this memory
@@ -79,22 +104,52 @@ class MemoryObject:
     def clear(self) -> None:
         assert not self._ro
         self._values.clear()
+        self._values_hash = 0
+        self._offsets.clear()
 
     def writable_copy(self) -> "MemoryObject":
         new = copy(self)
         new._values = copy(self._values)
+        new._offsets = copy(self._offsets)
         new._ro = False
         return new
 
     def clean_copy(self) -> "MemoryObject":
         new = copy(self)
         new._values = {}
+        new._values_hash = 0
+        new._offsets = []
         new._ro = False
         return new
 
     def __eq__(self, rhs: object):
         return isinstance(rhs, MemoryObject) and self._id == rhs._id
 
+    def structural_hash(self) -> int:
+        """Hash of the identity and the contents of the object, O(1)"""
+        return hash((self._id, self._zeroed, self._values_hash))
+
+    def structurally_equal(self, rhs: "MemoryObject") -> bool:
+        """Whether the objects have the same identity and the same contents
+        (stored the same way). Equal objects have equal structural hashes."""
+        if self is rhs:
+            return True
+        return (
+            type(self) is type(rhs)
+            and self._id == rhs._id
+            and self._zeroed == rhs._zeroed
+            and self._values_hash == rhs._values_hash
+            and self._same_values(rhs)
+        )
+
+    def _same_values(self, rhs: "MemoryObject") -> bool:
+        values, rvalues = self._values, rhs._values
+        if values is rvalues:
+            return True
+        return len(values) == len(rvalues) and all(
+            values_equal(v, rvalues.get(off)) for off, v in values.items()
+        )
+
     def get_id(self) -> int:
         return self._id
 
@@ -133,15 +188,6 @@ class MemoryObject:
                 MemError.UNSUPPORTED, "Write to symbolic-sized objects not implemented"
             )
         offval = 0 if off is None else off.value()
-        if offval != 0:
-            # FIXME: not efficient...
-            bw = x.bytewidth()
-            for o, val in self._values.items():
-                if offval < o + val.bytewidth() and offval + bw > o:
-                    return MemError(
-                        MemError.UNSUPPORTED,
-                        "Writing overlapping values to an object is not supported yet",
-                    )
         if self._is_oob(x.bytewidth(), offval):
             return MemError(
                 MemError.OOB_ACCESS,
@@ -150,9 +196,121 @@ class MemoryObject:
                     x.bytewidth(), off, self._size
                 ),
             )
-        self._values[offval] = x
+        if not self._store(x, offval):
+            return MemError(
+                MemError.UNSUPPORTED,
+                "Writing over parts of values that cannot be split is not supported",
+            )
         return None
 
+    def _overlapping(self, offval: int, bts: int) -> list:
+        """Offsets of the stored values that overlap bytes offval..offval+bts-1"""
+        offsets, values = self._offsets, self._values
+        lo = bisect_left(offsets, offval)
+        if lo > 0:
+            prev = offsets[lo - 1]
+            if prev + values[prev].bytewidth() > offval:
+                lo -= 1
+        return offsets[lo : bisect_left(offsets, offval + bts, lo)]
+
+    @staticmethod
+    def _extract(val: Value, start: int, end: int) -> Value:
+        return ConcreteBitVecDomain.Extract(val, start, end)
+
+    @staticmethod
+    def _concat(*vals: Value) -> Value:
+        return ConcreteBitVecDomain.Concat(*vals)
+
+    def _slice(self, val: Value, start: int, bts: int) -> Optional[Value]:
+        """Return bts bytes of the value starting at the byte start
+        or None if the value cannot be split into bytes"""
+        if start == 0 and bts == val.bytewidth():
+            return val
+        if not val.is_bv():
+            return None
+        return self._extract(val, 8 * start, 8 * (start + bts) - 1)
+
+    def _store(self, x: Value, offval: int) -> bool:
+        """Store the value at the offset. The parts of the overwritten values
+        that stick out of the written bytes are kept. Return False (and do
+        not change the object) if an overwritten value cannot be split."""
+        values, offsets = self._values, self._offsets
+        end = offval + x.bytewidth()
+        overlapping = self._overlapping(offval, x.bytewidth())
+        if not overlapping:
+            values[offval] = x
+            self._values_hash ^= hash((offval, x))
+            insort(offsets, offval)
+            return True
+        first, last = overlapping[0], overlapping[-1]
+        if first == offval == last and end == offval + values[offval].bytewidth():
+            self._values_hash ^= hash((offval, values[offval])) ^ hash((offval, x))
+            values[offval] = x
+            return True
+
+        parts = []
+        if first < offval:
+            head = self._slice(values[first], 0, offval - first)
+            if head is None:
+                return False
+            parts.append((first, head))
+        lastend = last + values[last].bytewidth()
+        if lastend > end:
+            tail = self._slice(values[last], end - last, lastend - end)
+            if tail is None:
+                return False
+            parts.append((end, tail))
+
+        idx = bisect_left(offsets, first)
+        del offsets[idx : idx + len(overlapping)]
+        h = self._values_hash
+        for o in overlapping:
+            h ^= hash((o, values.pop(o)))
+        parts.append((offval, x))
+        for o, val in sorted(parts, key=lambda p: p[0]):
+            values[o] = val
+            h ^= hash((o, val))
+            offsets.insert(idx, o)
+            idx += 1
+        self._values_hash = h
+        return True
+
+    def _read_parts(self, bts: int, offval: int, zeroed: bool):
+        """Read bytes that are not stored as a single value by concatenating
+        the parts of the stored values. Return (value, None) on success,
+        (None, error) on error and (None, None) if a value that covers
+        the bytes only partially cannot be split."""
+        values, parts = self._values, []
+        pos, end = offval, offval + bts
+        for o in self._overlapping(offval, bts):
+            if o > pos:
+                if not zeroed:
+                    return None, self._uninit_read_error(pos, o - pos)
+                parts.append(ConcreteBitVec(0, 8 * (o - pos)))
+                pos = o
+            val = values[o]
+            nxt = min(o + val.bytewidth(), end)
+            part = self._slice(val, pos - o, nxt - pos)
+            if part is None:
+                return None, None
+            parts.append(part)
+            pos = nxt
+        if pos < end:
+            if not zeroed:
+                return None, self._uninit_read_error(pos, end - pos)
+            parts.append(ConcreteBitVec(0, 8 * (end - pos)))
+        # the values are little-endian, the last part holds the highest bits
+        parts.reverse()
+        return self._concat(*parts), None
+
+    def _uninit_read_error(self, offval: int, bts: int) -> MemError:
+        return MemError(
+            MemError.UNINIT_READ,
+            f"Read from uninitialized memory.\n"
+            f"Reading bytes {offval}-{offval + bts - 1} from obj {self._id} with contents:\n"
+            f"{self._values}",
+        )
+
     def read(self, bts: int, off: Optional[ConcreteVal] = None):
         """
         Read 'bts' bytes from offset 'off'. Return (value, None)
@@ -180,27 +338,20 @@ class MemoryObject:
             )
 
         val = self._values.get(offval)
-        if val is None:
-            if self._is_global and self._allocation.is_zeroed():
-                return ConcreteBitVec(0, bts * 8), None
-            return None, MemError(
-                MemError.UNINIT_READ,
-                f"Read from uninitialized memory (or unaligned read (not supp.  yet)).\n"
-                f"Reading bytes {offval}-{offval + bts - 1} from obj {self._id} with contents:\n"
-                f"{self._values}",
-            )
-
-        # we would need to obtain overlapping offsets
-        if val.bytewidth() != bts:
+        if val is not None and val.bytewidth() == bts:
+            # FIXME: make me return BytesType objects (a sequence of bytes)
+            return val, None
+
+        # the bytes are defined by parts of values (or not at all)
+        zeroed = self._is_global and self._allocation.is_zeroed()
+        val, err = self._read_parts(bts, offval, zeroed)
+        if val is None and err is None:
             return None, MemError(
                 MemError.UNSUPPORTED,
-                f"Reading bytes from object defined by parts is unsupported atm: "
-                f"reading {bts} bytes from off {offval} where is value with "
-                f"{val.bytewidth()} bytes",
+                f"Reading bytes from object defined by parts that cannot be split: "
+                f"reading {bts} bytes from off {offval}",
             )
-
-        # FIXME: make me return BytesType objects (a sequence of bytes)
-        return val, None
+        return val, err
 
     def offsets(self):
         """Get offsets on which something is written"""
@@ -44,7 +44,8 @@ class ConcreteVal(Value):
         return f"{self._value}:{self.type()}"
 
     def __hash__(self):
-        return self._value
+        # the value is not necessarily an int (floats)
+        return hash(self._value)
 
     def __eq__(self, rhs):
         return (
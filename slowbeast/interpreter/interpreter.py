@@ -1,7 +1,9 @@
 from typing import List, Optional, Sized
 
 from slowbeast.core.iexecutor import IExecutor
+from slowbeast.domains.concrete_value import ConcreteVal
 from slowbeast.interpreter.interactive import InteractiveHandler
+from slowbeast.ir.instruction import GlobalVariable, Store
 from slowbeast.ir.program import Program
 from slowbeast.symexe.state import SEState
 from .options import ExecutionOptions
@@ -15,6 +17,22 @@ class GlobalInit:
         return self
 
 
+def constant_init(G: GlobalVariable) -> Optional[ConcreteVal]:
+    """
+    Return the constant if the initializer of the global just writes
+    a constant to the beginning of the global, otherwise return None.
+    Such initializers are deferred until the global is accessed.
+    """
+    init = G.init()
+    if not init or len(init) != 1:
+        return None
+    store = init[0]
+    if not isinstance(store, Store) or store.pointer_operand() is not G:
+        return None
+    value = store.value_operand()
+    return value if isinstance(value, ConcreteVal) else None
+
+
 class Interpreter:
     def __init__(
         self,
@@ -101,11 +119,15 @@ class Interpreter:
         globs = self._program.globals()
         for G in globs:
             # bind the global to the state
-            for s in states:
-                s.memory.allocate_global(G, zeroed=G.is_zeroed())
+            ptrs = [s.memory.allocate_global(G, zeroed=G.is_zeroed()) for s in states]
 
             if not G.has_init():
                 continue
+            value = constant_init(G)
+            if value is not None:
+                for s, ptr in zip(states, ptrs):
+                    s.memory.defer_init(ptr, value)
+                continue
             for i in G.init():
                 for s in states:
                     ret = self._executor.execute(s, i)
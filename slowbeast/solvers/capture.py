@@ -0,0 +1,182 @@
+"""
+Capturing the solver queries of a run as SMT-LIB2 files
+and replaying them offline against the solver layer.
+"""
+
+import os
+from os.path import isdir, join as pathjoin
+from time import perf_counter
+from typing import Optional
+
+from z3 import Solver as Z3Solver, parse_smt2_file
+
+# the subdirectory of the output directory with the captured queries
+CAPTURE_DIR = "queries"
+
+_VERDICTS = {True: "sat", False: "unsat", None: "unknown"}
+
+
+class QueryCapture:
+    """
+    Writes every checked query (the assertions of the solver together with
+    the assumptions) into its own SMT-LIB2 file. The header of the file
+    holds the place that issued the query, the verdict and the time
+    it took to solve it.
+    """
+
+    __slots__ = "enabled", "_dir", "_num"
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._dir = None
+        self._num = 0
+
+    def enable(self, out_dir: str) -> None:
+        self._dir = pathjoin(out_dir, CAPTURE_DIR)
+        os.makedirs(self._dir, exist_ok=True)
+        self.enabled = True
+
+    def add(self, site: str, formulas, result: Optional[bool], elapsed: float) -> None:
+        self._num += 1
+        solver = Z3Solver()
+        solver.add(*formulas)
+        # the pid keeps apart the queries of forked processes
+        path = pathjoin(self._dir, f"query-{os.getpid()}-{self._num:07d}.smt2")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"; site: {site}\n")
+            f.write(f"; verdict: {_VERDICTS[result]}\n")
+            f.write(f"; time: {elapsed:.6f}\n")
+            f.write(solver.to_smt2())
+
+
+_query_capture = QueryCapture()
+
+
+def query_capture() -> QueryCapture:
+    global _query_capture
+    return _query_capture
+
+
+class CapturedQuery:
+    """A query loaded from a file written by QueryCapture"""
+
+    __slots__ = "path", "site", "verdict", "time", "formulas"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.site, self.verdict, self.time = None, None, None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.startswith(";"):
+                    break
+                key, _, value = line[1:].partition(":")
+                key, value = key.strip(), value.strip()
+                if key == "site":
+                    self.site = value
+                elif key == "verdict":
+                    self.verdict = {"sat": True, "unsat": False}.get(value)
+                elif key == "time":
+                    self.time = float(value)
+        self.formulas = list(parse_smt2_file(path))
+
+
+def load_queries(paths) -> list:
+    """Load the captured queries from the files and directories (in the order
+    in which they were captured by every process)"""
+    files = []
+    for path in paths:
+        if isdir(path):
+            if isdir(pathjoin(path, CAPTURE_DIR)):
+                path = pathjoin(path, CAPTURE_DIR)
+            files.extend(
+                pathjoin(path, name)
+                for name in os.listdir(path)
+                if name.endswith(".smt2")
+            )
+        else:
+            files.append(path)
+    return [CapturedQuery(path) for path in sorted(files)]
+
+
+def _replay_z3(queries):
+    for q in queries:
+        solver = Z3Solver()
+        solver.add(*q.formulas)
+        r = solver.check()
+        yield {"sat": True, "unsat": False}.get(str(r))
+
+
+def _as_exprs(q) -> list:
+    from slowbeast.domains.expr import Expr
+    from slowbeast.ir.types import type_mgr
+
+    bool_ty = type_mgr().bool_ty()
+    return [Expr(f, bool_ty) for f in q.formulas]
+
+
+def _replay_symbolic(queries):
+    from slowbeast.solvers.symcrete import SymbolicSolver
+
+    solver = SymbolicSolver()
+    for q in queries:
+        yield solver.is_sat(*_as_exprs(q))
+
+
+def _replay_incremental(queries):
+    from slowbeast.solvers.symcrete import IncrementalSolver
+
+    solver = IncrementalSolver()
+    for q in queries:
+        solver.push()
+        solver.add(*_as_exprs(q))
+        yield solver.is_sat()
+        solver.pop()
+
+
+def _replay_solve_incrementally(queries):
+    from slowbeast.solvers.symcrete import global_expr_mgr, solve_incrementally
+
+    em = global_expr_mgr()
+    for q in queries:
+        yield solve_incrementally([], _as_exprs(q), em)
+
+
+# the layers of solving against which the queries can be replayed
+REPLAY_LAYERS = {
+    "z3": _replay_z3,
+    "symbolic": _replay_symbolic,
+    "incremental": _replay_incremental,
+    "solve-incrementally": _replay_solve_incrementally,
+}
+
+
+class ReplayResult:
+    __slots__ = "layer", "queries", "time", "unknown", "mismatches"
+
+    def __init__(self, layer: str) -> None:
+        self.layer = layer
+        self.queries = 0
+        self.time = 0.0
+        self.unknown = 0
+        # queries whose definite verdict differs from the captured one
+        self.mismatches = []
+
+    def throughput(self) -> float:
+        return self.queries / self.time if self.time > 0 else float("inf")
+
+
+def replay(queries, layer: str) -> ReplayResult:
+    """Solve the queries with the layer and compare the verdicts
+    with the captured ones"""
+    result = ReplayResult(layer)
+    answers = REPLAY_LAYERS[layer](queries)
+    for q in queries:
+        start = perf_counter()
+        r = next(answers)
+        result.time += perf_counter() - start
+        result.queries += 1
+        if r is None:
+            result.unknown += 1
+        elif q.verdict is not None and r != q.verdict:
+            result.mismatches.append(q.path)
+    return result
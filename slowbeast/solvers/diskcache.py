@@ -0,0 +1,182 @@
+import atexit
+import os
+import sqlite3
+from hashlib import sha256
+from typing import Optional, Set
+
+from z3 import Z3_OP_UNINTERPRETED, is_app
+
+# the default maximal number of queries kept in the file
+DISK_CACHE_SIZE = 1000000
+# the number of changes after which they are written to the file
+_COMMIT_INTERVAL = 512
+
+# opened caches, one per file
+_caches = {}
+
+
+def open_disk_cache(path: str, capacity: int = DISK_CACHE_SIZE) -> "DiskQueryCache":
+    """Return the cache stored in the file, opening it if needed"""
+    path = os.path.abspath(path)
+    cache = _caches.get(path)
+    if cache is None:
+        cache = _caches[path] = DiskQueryCache(path, capacity)
+    return cache
+
+
+def _declarations(formulas) -> Set[str]:
+    """Declarations of the uninterpreted constants and functions
+    in the formulas"""
+    decls, visited = set(), set()
+    stack = list(formulas)
+    while stack:
+        e = stack.pop()
+        eid = e.get_id()
+        if eid in visited:
+            continue
+        visited.add(eid)
+        if is_app(e):
+            d = e.decl()
+            if d.kind() == Z3_OP_UNINTERPRETED:
+                domain = " ".join(d.domain(i).sexpr() for i in range(d.arity()))
+                decls.add(f"({d.name()} ({domain}) {d.range().sexpr()})")
+        stack.extend(e.children())
+    return decls
+
+
+def query_hash(formulas) -> bytes:
+    """Structural hash of a query (a set of Z3 formulas). Unlike the ids
+    of the formulas, the hash is the same in every run. The declarations
+    of the symbols are a part of the hash, since the formulas do not
+    determine the sorts of the symbols (e.g., in x = y)."""
+    formulas = list(formulas)
+    h = sha256()
+    for s in sorted(_declarations(formulas)):
+        h.update(s.encode())
+        h.update(b"\0")
+    h.update(b"\0")
+    for s in sorted({f.sexpr() for f in formulas}):
+        h.update(s.encode())
+        h.update(b"\0")
+    return h.digest()
+
+
+class DiskQueryCache:
+    """
+    Results of satisfiability queries kept in an sqlite database,
+    so that they can be shared by more runs (and processes). The queries
+    are keyed by their structural hash. When the file holds more than
+    capacity queries, the least recently used ones are evicted.
+    Only definite results are stored.
+    """
+
+    __slots__ = (
+        "_path",
+        "_capacity",
+        "_conn",
+        "_pid",
+        "_clock",
+        "_writes",
+        "_uses",
+        "hits",
+        "misses",
+    )
+
+    def __init__(self, path: str, capacity: int = DISK_CACHE_SIZE) -> None:
+        assert capacity > 0, capacity
+        self._path = path
+        self._capacity = capacity
+        self._conn = None
+        self._pid = None
+        # the time of the last use of a query
+        self._clock = 0
+        # new results and uses of queries that were not written yet.
+        # The changes are written in short transactions, so that
+        # more processes can share the file.
+        self._writes = {}
+        self._uses = {}
+        self.hits = 0
+        self.misses = 0
+        atexit.register(self.close)
+
+    def _connection(self) -> sqlite3.Connection:
+        # a connection must not be used in a forked process
+        if self._pid != os.getpid():
+            self._conn = conn = sqlite3.connect(
+                self._path, timeout=60, isolation_level=None
+            )
+            self._pid = os.getpid()
+            self._writes, self._uses = {}, {}
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS queries"
+                " (key BLOB PRIMARY KEY, result INTEGER, used INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS queries_used ON queries (used)")
+            clock = conn.execute("SELECT MAX(used) FROM queries").fetchone()[0]
+            self._clock = max(self._clock, clock or 0)
+        return self._conn
+
+    def get(self, formulas) -> Optional[bool]:
+        conn = self._connection()
+        key = query_hash(formulas)
+        self._clock += 1
+        result = self._writes.get(key)
+        if result is not None:
+            self.hits += 1
+            self._writes[key] = (result[0], self._clock)
+            return result[0]
+        row = conn.execute("SELECT result FROM queries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._uses[key] = self._clock
+        self._changed()
+        return bool(row[0])
+
+    def put(self, formulas, result: Optional[bool]) -> None:
+        if result is None:
+            return
+        self._connection()
+        self._clock += 1
+        self._writes[query_hash(formulas)] = (result, self._clock)
+        self._changed()
+
+    def _changed(self) -> None:
+        if len(self._writes) + len(self._uses) >= _COMMIT_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the changes to the file and evict the superfluous queries"""
+        conn = self._conn
+        if conn is None or self._pid != os.getpid():
+            return
+        if not (self._writes or self._uses):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE queries SET used = MAX(used, ?) WHERE key = ?",
+            ((used, key) for key, used in self._uses.items()),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+            ((key, int(r), used) for key, (r, used) in self._writes.items()),
+        )
+        (size,) = conn.execute("SELECT COUNT(*) FROM queries").fetchone()
+        if size > self._capacity:
+            conn.execute(
+                "DELETE FROM queries WHERE key IN"
+                " (SELECT key FROM queries ORDER BY used LIMIT ?)",
+                (size - self._capacity,),
+            )
+        conn.execute("COMMIT")
+        self._writes, self._uses = {}, {}
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self.flush()
+            self._conn.close()
+        self._conn = None
+        self._pid = None
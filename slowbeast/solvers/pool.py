@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from z3 import Solver as Z3Solver
+
+# the number of released solvers kept for every timeout
+POOL_SIZE = 8
+# the number of uses after which a solver is reset. A solver that answered
+# a few queries is faster than a new one, but the terms of the queries
+# pile up in it and make it slower later.
+POOL_RESET_INTERVAL = 16
+# the timeout of Z3 when no timeout is set
+NO_TIMEOUT = 4294967295
+
+
+class SolverPool:
+    """
+    Z3 solvers reused by more queries. Constructing a Z3 solver and
+    setting its parameters is a visible part of the cost of short queries.
+    The pool keeps the released solvers by their timeout, so that the
+    timeout does not need to be set again for every query. An acquired
+    solver is in a new scope, so the assertions of the user are popped
+    when the solver is returned. Popping is much cheaper than resetting
+    the solver, which is done only once in a few uses.
+    """
+
+    __slots__ = (
+        "_capacity",
+        "_free",
+        "_timeouts",
+        "_uses",
+        "acquired",
+        "created",
+        "resets",
+    )
+
+    def __init__(self, capacity: int = POOL_SIZE) -> None:
+        self._capacity = capacity
+        # timeout -> released solvers with that timeout
+        self._free = {}
+        # id of a solver of the pool -> its timeout
+        self._timeouts = {}
+        # id of a solver of the pool -> the number of its queries since reset
+        self._uses = {}
+        self.acquired = 0
+        self.created = 0
+        self.resets = 0
+
+    def acquire(self, timeout: Optional[int] = None) -> Z3Solver:
+        """Get a solver without assertions with the timeout set"""
+        timeout = timeout or NO_TIMEOUT
+        self.acquired += 1
+        solver = self._take(timeout)
+        solver.push()
+        return solver
+
+    def _take(self, timeout: int) -> Z3Solver:
+        free = self._free.get(timeout)
+        if free:
+            return free.pop()
+        # take a solver with another timeout rather than creating a new one
+        for free in self._free.values():
+            if free:
+                solver = free.pop()
+                self.set_timeout(solver, timeout)
+                return solver
+        self.created += 1
+        solver = Z3Solver()
+        if timeout != NO_TIMEOUT:
+            solver.set("timeout", timeout)
+        self._timeouts[id(solver)] = timeout
+        self._uses[id(solver)] = 0
+        return solver
+
+    def set_timeout(self, solver: Z3Solver, timeout: Optional[int]) -> None:
+        """Set the timeout of an acquired solver"""
+        timeout = timeout or NO_TIMEOUT
+        if self._timeouts[id(solver)] != timeout:
+            solver.set("timeout", timeout)
+            self._timeouts[id(solver)] = timeout
+
+    def release(self, solver: Z3Solver) -> None:
+        """Return the solver to the pool"""
+        key = id(solver)
+        uses = self._uses[key] + 1
+        if uses >= POOL_RESET_INTERVAL:
+            solver.reset()
+            self.resets += 1
+            uses = 0
+        else:
+            solver.pop(solver.num_scopes())
+        free = self._free.setdefault(self._timeouts[key], [])
+        if len(free) < self._capacity:
+            self._uses[key] = uses
+            free.append(solver)
+        else:
+            del self._timeouts[key]
+            del self._uses[key]
+
+    @contextmanager
+    def solver(self, timeout: Optional[int] = None) -> Iterator[Z3Solver]:
+        """Acquire a solver for the with block"""
+        solver = self.acquire(timeout)
+        try:
+            yield solver
+        finally:
+            self.release(solver)
+
+
+_solver_pool = SolverPool()
+
+
+def solver_pool() -> SolverPool:
+    global _solver_pool
+    return _solver_pool
@@ -0,0 +1,126 @@
+"""
+Racing strategies for solving hard queries.
+
+Every strategy runs in its own (forked) process, so that the formulas
+do not need to be serialized. The first definite answer wins and the
+processes of the other strategies are killed.
+"""
+
+import multiprocessing
+from queue import Empty
+from time import perf_counter
+from typing import Optional
+
+from z3 import Extract, SignExt, Solver as Z3Solver, Tactic, Z3Exception, is_bv
+
+from slowbeast.domains.symbolic_helpers import symbols
+from slowbeast.solvers.stats import solver_stats
+from slowbeast.solvers.z3solver import _is_sat
+
+# the bit-width of the values of variables in the under-approximation
+SMALL_VALUES_BITWIDTH = 8
+
+
+def portfolio_available() -> bool:
+    # daemonic processes (e.g., workers of a pool) cannot have children
+    return not multiprocessing.current_process().daemon
+
+
+def _plain(expr, em, to2: int) -> Optional[bool]:
+    return _is_sat(Z3Solver(), None, expr.unwrap())
+
+
+def _qfbv(expr, em, to2: int) -> Optional[bool]:
+    try:
+        solver = Tactic("qfbv").solver()
+        return _is_sat(solver, None, expr.unwrap())
+    except Z3Exception:
+        # not a bit-vector formula
+        return None
+
+
+def _abstraction(expr, em, to2: int) -> Optional[bool]:
+    """Replace arithmetic operations by fresh variables and refine
+    the abstraction gradually. The abstraction can show only that
+    the expression is unsatisfiable."""
+    from slowbeast.solvers.symcrete import IncrementalSolver, _sort_subs
+
+    rexpr, subs = expr.replace_arith_ops()
+    if not rexpr:
+        return None
+    solver = IncrementalSolver()
+    solver.add(rexpr.rewrite_and_simplify())
+    n = 0
+    for placeholder, e in _sort_subs(subs):
+        n += 1
+        if solver.try_is_sat(n * to2) is False:
+            return False
+        solver.add(em.Eq(e, placeholder))
+    return None
+
+
+def _small_values(expr, em, to2: int) -> Optional[bool]:
+    """Restrict the bit-vector variables to values that fit into a few bits.
+    This is an under-approximation, so it can show only that
+    the expression is satisfiable."""
+    formula = expr.unwrap()
+    solver = Z3Solver()
+    solver.add(formula)
+    bw = SMALL_VALUES_BITWIDTH
+    for v in symbols(formula):
+        if is_bv(v) and v.size() > bw:
+            solver.add(v == SignExt(v.size() - bw, Extract(bw - 1, 0, v)))
+    return True if _is_sat(solver, None) is True else None
+
+
+# the strategies raced by solve_portfolio
+STRATEGIES = (_plain, _qfbv, _abstraction, _small_values)
+
+
+def _run(strategy, expr, em, to2: int, queue) -> None:
+    try:
+        r = strategy(expr, em, to2)
+    except BaseException:
+        r = None
+    queue.put((strategy.__name__[1:], r))
+
+
+def solve_portfolio(expr, em, to2: int = 500) -> Optional[bool]:
+    """Decide the satisfiability of the expression by racing the strategies.
+    Return None if no strategy gives a definite answer."""
+    stats = solver_stats()
+    start = stats.timer()
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_run, args=(strategy, expr, em, to2, queue), daemon=True)
+        for strategy in STRATEGIES
+    ]
+    for p in procs:
+        p.start()
+    result, pending = None, len(procs)
+    try:
+        while pending > 0:
+            try:
+                name, r = queue.get(timeout=1)
+            except Empty:
+                # a strategy may have crashed without answering
+                if not any(p.is_alive() for p in procs) and queue.empty():
+                    break
+                continue
+            pending -= 1
+            if r is not None:
+                result = r
+                if start is not None:
+                    stats.answered_by(f"portfolio:{name}")
+                break
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.kill()
+        for p in procs:
+            p.join()
+        queue.close()
+    if start is not None:
+        stats.record("portfolio", perf_counter() - start, result, (expr.unwrap(),))
+    return result
@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from typing import Optional
+
+from z3 import ModelRef, is_and, is_true
+
+# the default number of queries kept in the cache
+QUERY_CACHE_SIZE = 4096
+# the number of models of satisfiable queries kept in the cache
+MODEL_CACHE_SIZE = 16
+# the maximal number of formulas whose value is remembered for a model
+MODEL_VALUES_SIZE = 4096
+
+
+def _conjuncts(formulas):
+    for f in formulas:
+        if is_and(f):
+            yield from _conjuncts(f.children())
+        elif not is_true(f):
+            yield f
+
+
+class CachedModel:
+    """A model of a satisfiable query with the values of the formulas
+    that were evaluated in it"""
+
+    __slots__ = "model", "_values"
+
+    def __init__(self, model: ModelRef) -> None:
+        self.model = model
+        # id of a formula -> (formula, its value). The formulas are kept
+        # alive so that Z3 does not reuse their ids.
+        self._values = {}
+
+    def satisfies(self, formulas) -> bool:
+        values = self._values
+        for f in formulas:
+            value = values.get(f.get_id())
+            if value is None:
+                if len(values) >= MODEL_VALUES_SIZE:
+                    values.clear()
+                value = (f, is_true(self.model.eval(f, model_completion=True)))
+                values[f.get_id()] = value
+            if not value[1]:
+                return False
+        return True
+
+
+class QueryCache:
+    """
+    LRU cache of the results of satisfiability queries. A query is a set
+    of (Z3) formulas, so its key does not depend on the order or
+    duplicities of the formulas nor on how conjunctions are nested.
+
+    Besides exact hits, the cache answers queries via the cached ones:
+    a query that contains an unsatisfiable query is unsatisfiable and
+    a query that is contained in a satisfiable query is satisfiable.
+    Finally, a query is satisfiable if it is satisfied by one of the
+    recently found models. Most queries on a path extend the previous
+    queries by a single formula, so evaluating the models is cheap:
+    the values of the formulas evaluated earlier are remembered.
+    Only definite results are cached.
+    """
+
+    __slots__ = (
+        "_capacity",
+        "_entries",
+        "_sat_index",
+        "_unsat_index",
+        "_models",
+        "hits",
+        "subsumed",
+        "model_hits",
+        "misses",
+    )
+
+    def __init__(self, capacity: int = QUERY_CACHE_SIZE) -> None:
+        assert capacity > 0, capacity
+        self._capacity = capacity
+        # key -> (result, formulas). Keeping the formulas alive makes sure
+        # that Z3 does not reuse their ids for other formulas.
+        self._entries = OrderedDict()
+        # id of a formula -> keys of satisfiable queries that contain it
+        self._sat_index = {}
+        # id of a formula -> keys of unsatisfiable queries whose formula
+        # with the greatest id it is
+        self._unsat_index = {}
+        # models of satisfiable queries, the most recently used first
+        self._models: list[CachedModel] = []
+        self.hits = 0
+        self.subsumed = 0
+        self.model_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def query(formulas) -> tuple[frozenset, tuple]:
+        """Return the key of the query and the conjuncts that it consists of"""
+        conjuncts = tuple(_conjuncts(formulas))
+        return frozenset(f.get_id() for f in conjuncts), conjuncts
+
+    def get(self, key: frozenset, formulas: tuple = ()) -> Optional[bool]:
+        """Return the result of the query if it follows from the cache.
+        If the formulas of the query are given, try also the models."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        result, k, n = self._lookup(key, formulas)
+        if k is not None:
+            self._entries.move_to_end(k)
+            self.subsumed += 1
+        elif n is not None:
+            models = self._models
+            if n > 0:
+                models.insert(0, models.pop(n))
+            self.model_hits += 1
+            self.put(key, formulas, True)
+        else:
+            self.misses += 1
+        return result
+
+    def peek(self, key: frozenset, formulas: tuple = ()) -> Optional[bool]:
+        """Like get(), but the cache is not changed: the statistics
+        and the order of the queries and models stay the same"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry[0]
+        return self._lookup(key, formulas)[0]
+
+    def _lookup(self, key: frozenset, formulas: tuple):
+        """Decide the query (that is not cached) via the cached queries
+        and models. Return the result, the key of the cached query that
+        decides it and the index of the model that satisfies it."""
+        unsat_index = self._unsat_index
+        for i in key:
+            for k in unsat_index.get(i, ()):
+                if k <= key:
+                    return False, k, None
+
+        sat_index = self._sat_index
+        supersets = min((sat_index.get(i, ()) for i in key), key=len, default=())
+        for k in supersets:
+            if key <= k:
+                return True, k, None
+
+        # the formulas added last are the most likely to be falsified
+        formulas = formulas[::-1]
+        for n, m in enumerate(self._models):
+            if m.satisfies(formulas):
+                return True, None, n
+        return None, None, None
+
+    def add_model(self, model: ModelRef) -> None:
+        """Remember a model of a satisfiable query"""
+        models = self._models
+        models.insert(0, CachedModel(model))
+        if len(models) > MODEL_CACHE_SIZE:
+            models.pop()
+
+    def put(self, key: frozenset, formulas: tuple, result: Optional[bool]) -> None:
+        if result is None or key in self._entries:
+            return
+        self._entries[key] = (result, formulas)
+        if result:
+            for i in key:
+                self._sat_index.setdefault(i, set()).add(key)
+        else:
+            self._unsat_index.setdefault(max(key), set()).add(key)
+        if len(self._entries) > self._capacity:
+            self._evict()
+
+    def _evict(self) -> None:
+        key, (result, _) = self._entries.popitem(last=False)
+        if result:
+            for i in key:
+                keys = self._sat_index[i]
+                keys.discard(key)
+                if not keys:
+                    del self._sat_index[i]
+        else:
+            i = max(key)
+            keys = self._unsat_index[i]
+            keys.discard(key)
+            if not keys:
+                del self._unsat_index[i]
+
+    def __len__(self) -> int:
+        return len(self._entries)
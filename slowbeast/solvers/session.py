@@ -0,0 +1,145 @@
+from typing import List, Optional, Union
+
+from z3 import Solver as Z3Solver, BoolVal
+
+from slowbeast.domains.concrete_value import ConcreteVal
+from slowbeast.domains.symbolic_helpers import map_model
+from slowbeast.solvers.symcrete import SymbolicSolver
+from slowbeast.solvers.solver import SolverIntf
+from slowbeast.solvers.z3solver import models_inc, _is_sat
+
+
+class _Scope:
+    """Formulas asserted in one scope of the session solver. A scope can
+    grow until it is shared by more solvers, then the solvers
+    add new formulas into their own child scopes."""
+
+    __slots__ = "parent", "depth", "formulas", "shared"
+
+    def __init__(self, parent: Optional["_Scope"]) -> None:
+        self.parent = parent
+        self.depth = 1 if parent is None else parent.depth + 1
+        self.formulas = []
+        self.shared = False
+
+
+class SolverSession:
+    """
+    One Z3 solver shared by the incremental solvers of states.
+    The assertions of a solver form a path in the tree of scopes
+    and the Z3 solver has pushed the scopes of the solver that
+    queried it last. A query of another solver pops the scopes up to
+    the common ancestor and pushes the scopes of the querying solver.
+    With DFS, the states are forked and queried along the explored path,
+    so forking amounts to a push and backtracking to a pop.
+    """
+
+    __slots__ = "_solver", "_stack", "pushes", "pops"
+
+    def __init__(self) -> None:
+        self._solver = Z3Solver()
+        # the pushed scopes with the number of their asserted formulas
+        self._stack = []
+        self.pushes = 0
+        self.pops = 0
+
+    def solver(self) -> "SessionSolver":
+        """Create a new solver (with no assertions) in this session"""
+        return SessionSolver(self)
+
+    def activate(self, scope: Optional[_Scope]) -> Z3Solver:
+        """Make the Z3 solver assert exactly the formulas
+        of the scope and its ancestors and return it"""
+        solver, stack = self._solver, self._stack
+        missing = []
+        s = scope
+        while s is not None and not (
+            s.depth <= len(stack) and stack[s.depth - 1][0] is s
+        ):
+            missing.append(s)
+            s = s.parent
+        depth = 0 if s is None else s.depth
+        if depth < len(stack):
+            self.pops += len(stack) - depth
+            if depth == 0:
+                solver.reset()
+            else:
+                solver.pop(len(stack) - depth)
+            del stack[depth:]
+        if stack:
+            # the top scope may have grown since it was pushed
+            top = stack[-1]
+            formulas = top[0].formulas
+            if top[1] < len(formulas):
+                solver.add(*formulas[top[1] :])
+                top[1] = len(formulas)
+        for s in reversed(missing):
+            solver.push()
+            solver.add(*s.formulas)
+            stack.append([s, len(s.formulas)])
+        self.pushes += len(missing)
+        return solver
+
+
+class SessionSolver(SymbolicSolver):
+    """
+    Incremental solver whose assertions live in a SolverSession.
+    Copying the solver does not copy any assertions, the copies
+    just share the current scope.
+    """
+
+    def __init__(self, session: SolverSession) -> None:
+        super().__init__(cache_size=0)
+        self._session = session
+        self._scope: Optional[_Scope] = None
+
+    def add(self, *e) -> None:
+        if any(map(lambda x: x.is_concrete() and x.value() is False, e)):
+            formulas = [BoolVal(False)]
+        else:
+            formulas = [x.unwrap() for x in e if not x.is_concrete()]
+        if not formulas:
+            return
+        scope = self._scope
+        if scope is None or scope.shared:
+            scope = self._scope = _Scope(scope)
+        scope.formulas.extend(formulas)
+
+    def is_sat(self, *e) -> Optional[bool]:
+        return self.try_is_sat(None, *e)
+
+    def try_is_sat(self, timeout: Optional[int], *e) -> Optional[bool]:
+        if any(map(lambda x: x.is_concrete() and x.value() is False, e)):
+            return False
+        return _is_sat(
+            self._session.activate(self._scope),
+            timeout,
+            *(x.unwrap() for x in e if not x.is_concrete()),
+            site="session",
+        )
+
+    # the queries must be checked together with the assertions of the solver
+    check_branch = SolverIntf.check_branch
+
+    def copy(self) -> "SessionSolver":
+        s = SessionSolver(self._session)
+        if self._scope is not None:
+            self._scope.shared = True
+            s._scope = self._scope
+        return s
+
+    def concretize(self, assumpt, *e) -> Union[None, List[None], List[ConcreteVal]]:
+        assert all(
+            map(lambda x: not x.is_concrete(), e)
+        ), "ConcreteVal instead of symbolic value"
+        if any(map(lambda x: x.is_concrete() and x.value() is False, assumpt)):
+            return None
+        m = models_inc(self._session.activate(self._scope), assumpt, *e)
+        return map_model(m, e)
+
+    def _model(self):
+        """Debugging feature atm. Must follow is_sat() that is True"""
+        return self._session.activate(self._scope).model()
+
+    def __repr__(self) -> str:
+        return f"SessionSolver: {self._session.activate(self._scope)}"
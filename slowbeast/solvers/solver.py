@@ -23,6 +23,19 @@ class SolverIntf:
     def try_is_sat(self, timeout, *e):
         raise NotImplementedError("Must be overriden")
 
+    def check_branch(self, constraints, cond, timeout=None):
+        """
+        Check the satisfiability of the constraints together with cond
+        and together with the negation of cond. Return the pair of results.
+        """
+        ncond = self._exprmanager.Not(cond)
+        if timeout is None:
+            return self.is_sat(*constraints, cond), self.is_sat(*constraints, ncond)
+        return (
+            self.try_is_sat(timeout, *constraints, cond),
+            self.try_is_sat(timeout, *constraints, ncond),
+        )
+
     def fresh_value(self, name: str, ty: Union[BitVecType, FloatType]) -> Expr:
         """ty = type"""
         return self._exprmanager.fresh_value(name, ty)
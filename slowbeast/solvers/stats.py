@@ -0,0 +1,151 @@
+from time import perf_counter
+from typing import Optional
+
+# upper bounds (in seconds) of the buckets of the histograms of times
+TIME_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0)
+
+_OUTCOMES = {True: "sat", False: "unsat", None: "unknown"}
+
+
+def formula_size(formulas) -> int:
+    """The number of distinct nodes of the formulas"""
+    seen, queue = set(), list(formulas)
+    while queue:
+        f = queue.pop()
+        if f.get_id() in seen:
+            continue
+        seen.add(f.get_id())
+        queue.extend(f.children())
+    return len(seen)
+
+
+class SiteStats:
+    """Statistics of the solver calls made at one place (or one stage)"""
+
+    __slots__ = (
+        "calls",
+        "time",
+        "max_time",
+        "assertions",
+        "size",
+        "max_size",
+        "outcomes",
+        "histogram",
+    )
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        # the sums of the numbers of assertions and sizes of the queries
+        self.assertions = 0
+        self.size = 0
+        self.max_size = 0
+        self.outcomes = {}
+        # the number of calls per bucket of TIME_BUCKETS (and one more
+        # bucket for the longer calls)
+        self.histogram = [0] * (len(TIME_BUCKETS) + 1)
+
+    def add(self, elapsed: float, outcome, assertions: int, size: int) -> None:
+        self.calls += 1
+        self.time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.assertions += assertions
+        self.size += size
+        self.max_size = max(self.max_size, size)
+        outcome = _OUTCOMES.get(outcome, outcome)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        for i, bound in enumerate(TIME_BUCKETS):
+            if elapsed < bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "time": self.time,
+            "max_time": self.max_time,
+            "assertions": self.assertions,
+            "size": self.size,
+            "max_size": self.max_size,
+            "outcomes": self.outcomes,
+            "histogram": self.histogram,
+        }
+
+
+class SolverStats:
+    """
+    Instrumentation of the solver calls. For every place (or stage of
+    solving) that calls the solver, it records the time, the number of
+    assertions and the size of the queries and their outcomes. It also
+    counts which stages of solve_incrementally decided the queries.
+    The statistics are gathered only when enabled, as computing the sizes
+    of the formulas is not for free.
+    """
+
+    __slots__ = "enabled", "sites", "answered"
+
+    def __init__(self) -> None:
+        self.enabled = False
+        # place -> SiteStats
+        self.sites = {}
+        # stage of solving -> the number of queries it decided
+        self.answered = {}
+
+    def record(
+        self, site: str, elapsed: float, outcome, formulas=(), assertions=None
+    ) -> None:
+        """Record a solver call. The outcome is True, False, None
+        or a string if the call is not a satisfiability check."""
+        stats = self.sites.get(site)
+        if stats is None:
+            stats = self.sites[site] = SiteStats()
+        formulas = tuple(formulas)
+        if assertions is None:
+            assertions = len(formulas)
+        stats.add(elapsed, outcome, assertions, formula_size(formulas))
+
+    def answered_by(self, stage: str) -> None:
+        self.answered[stage] = self.answered.get(stage, 0) + 1
+
+    def timer(self) -> Optional[float]:
+        """Start measuring a call if the statistics are enabled"""
+        return perf_counter() if self.enabled else None
+
+    def as_dict(self) -> dict:
+        return {
+            "time_buckets": TIME_BUCKETS,
+            "sites": {site: s.as_dict() for site, s in self.sites.items()},
+            "answered": self.answered,
+        }
+
+    def report(self) -> list:
+        """Lines with a summary of the statistics"""
+        lines = []
+        buckets = " ".join(
+            f"<{b * 1000:g}ms" for b in TIME_BUCKETS
+        ) + f" >={TIME_BUCKETS[-1] * 1000:g}ms"
+        for site, s in sorted(self.sites.items(), key=lambda x: -x[1].time):
+            outcomes = ", ".join(f"{n} {o}" for o, n in sorted(s.outcomes.items()))
+            lines.append(
+                f"{site}: {s.calls} calls, {s.time:.3f}s (max {s.max_time:.3f}s), "
+                f"avg size {s.size / s.calls:.1f} (max {s.max_size}), "
+                f"avg assertions {s.assertions / s.calls:.1f}; {outcomes}"
+            )
+            lines.append(f"  [{buckets}]: {s.histogram}")
+        if self.answered:
+            answered = ", ".join(
+                f"{stage} {n}" for stage, n in sorted(self.answered.items())
+            )
+            lines.append(f"decided by: {answered}")
+        return lines
+
+
+_solver_stats = SolverStats()
+
+
+def solver_stats() -> SolverStats:
+    global _solver_stats
+    return _solver_stats
@@ -1,11 +1,17 @@
+from time import perf_counter
 from typing import List, Optional, Union
 
-from z3 import Solver as Z3Solver, is_false, BoolVal
+from z3 import Solver as Z3Solver, is_false, BoolVal, Not
 
 from slowbeast.domains.concrete_value import ConcreteVal
 from slowbeast.domains.exprmgr import ExpressionManager
 from slowbeast.domains.symbolic_helpers import map_model
+from slowbeast.solvers.diskcache import DiskQueryCache
+from slowbeast.solvers.pool import solver_pool
+from slowbeast.solvers.portfolio import portfolio_available, solve_portfolio
+from slowbeast.solvers.querycache import QueryCache, QUERY_CACHE_SIZE
 from slowbeast.solvers.solver import SolverIntf
+from slowbeast.solvers.stats import solver_stats
 from slowbeast.solvers.z3solver import models, models_inc, _is_sat
 
 global_expr_manager = ExpressionManager()
@@ -21,26 +27,108 @@ class SymbolicSolver(SolverIntf):
     Wrapper for SMT solver(s) used throughout this project
     """
 
-    def __init__(self) -> None:
+    def __init__(self, cache_size: int = QUERY_CACHE_SIZE) -> None:
         super().__init__(global_expr_mgr())
+        # results of the queries, 0 disables the cache
+        self._cache = QueryCache(cache_size) if cache_size > 0 else None
+        # results of the queries shared by more runs
+        self._disk_cache: Optional[DiskQueryCache] = None
+
+    def query_cache(self) -> Optional[QueryCache]:
+        return self._cache
+
+    def disk_cache(self) -> Optional[DiskQueryCache]:
+        return self._disk_cache
+
+    def set_disk_cache(self, cache: Optional[DiskQueryCache]) -> None:
+        self._disk_cache = cache
 
     def is_sat(self, *e) -> Optional[bool]:
-        if any(
-            map(lambda x: is_false(x) or (x.is_concrete() and x.value() is False), e)
-        ):
-            return False
-        return _is_sat(
-            Z3Solver(), None, *(x.unwrap() for x in e if not x.is_concrete())
-        )
+        return self.try_is_sat(None, *e)
 
-    def try_is_sat(self, timeout: int, *e) -> Optional[bool]:
+    def try_is_sat(self, timeout: Optional[int], *e) -> Optional[bool]:
         if any(
             map(lambda x: is_false(x) or (x.is_concrete() and x.value() is False), e)
         ):
             return False
-        return _is_sat(
-            Z3Solver(), timeout, *(x.unwrap() for x in e if not x.is_concrete())
-        )
+        formulas = (x.unwrap() for x in e if not x.is_concrete())
+        cache, disk = self._cache, self._disk_cache
+        if cache is None and disk is None:
+            return _is_sat(None, timeout, *formulas, site="try_is_sat")
+        key, conjuncts = QueryCache.query(formulas)
+        if not key:
+            return True
+        r = None if cache is None else cache.get(key, conjuncts)
+        # only the results computed by the solver are written to the disk,
+        # the results decided in memory need not be written again
+        if r is None and disk is not None:
+            r = disk.get(conjuncts)
+            if cache is not None:
+                cache.put(key, conjuncts, r)
+        if r is None:
+            with solver_pool().solver(timeout) as solver:
+                r = _is_sat(solver, None, *conjuncts, site="try_is_sat")
+                if disk is not None:
+                    disk.put(conjuncts, r)
+                if cache is not None:
+                    cache.put(key, conjuncts, r)
+                    if r:
+                        cache.add_model(solver.model())
+        return r
+
+    def check_branch(
+        self, constraints, cond, timeout: Optional[int] = None
+    ) -> tuple[Optional[bool], Optional[bool]]:
+        if cond.is_concrete():
+            return self.try_is_sat(timeout, *constraints, cond), self.try_is_sat(
+                timeout, *constraints, self.expr_manager().Not(cond)
+            )
+        if any(map(lambda x: x.is_concrete() and x.value() is False, constraints)):
+            return False, False
+        cache, disk = self._cache, self._disk_cache
+        pc = QueryCache.query(x.unwrap() for x in constraints if not x.is_concrete())
+        sides = [QueryCache.query((f,)) for f in (cond.unwrap(), Not(cond.unwrap()))]
+        queries = [(pc[0] | key, pc[1] + conjuncts) for key, conjuncts in sides]
+        # the cached results and models often decide one of the directions
+        results = [None, None]
+        if cache is not None:
+            results = [cache.get(key, formulas) for key, formulas in queries]
+        if disk is not None:
+            for i, (key, formulas) in enumerate(queries):
+                if results[i] is None:
+                    results[i] = disk.get(formulas)
+                    if cache is not None:
+                        cache.put(key, formulas, results[i])
+
+        pool, solver = solver_pool(), None
+        try:
+            for i, (key, formulas) in enumerate(queries):
+                if results[i] is not None:
+                    continue
+                other = results[1 - i]
+                if other is False and cache is not None and cache.peek(*pc) is True:
+                    # the path condition is satisfiable, so if one direction
+                    # is not, the other one is
+                    results[i] = True
+                    if disk is not None:
+                        disk.put(formulas, True)
+                    continue
+                if solver is None:
+                    # assert the path condition only once for both directions
+                    solver = pool.acquire(timeout)
+                    solver.add(*pc[1])
+                r = _is_sat(solver, None, *sides[i][1], site="check_branch")
+                results[i] = r
+                if disk is not None:
+                    disk.put(formulas, r)
+                if cache is not None:
+                    cache.put(key, formulas, r)
+                    if r:
+                        cache.add_model(solver.model())
+        finally:
+            if solver is not None:
+                pool.release(solver)
+        return results[0], results[1]
 
     def concretize(self, assumpt, *e) -> Union[None, List[None], List[ConcreteVal]]:
         assert all(
@@ -55,7 +143,7 @@ class SymbolicSolver(SolverIntf):
 class IncrementalSolver(SymbolicSolver):
     def __init__(self) -> None:
         # FIXME: add local expr manager
-        super().__init__()
+        super().__init__(cache_size=0)
         self._solver = Z3Solver()
 
     def add(self, *e) -> None:
@@ -73,16 +161,25 @@ class IncrementalSolver(SymbolicSolver):
         if any(map(lambda x: x.is_concrete() and x.value() is False, e)):
             return False
         return _is_sat(
-            self._solver, None, *(x.unwrap() for x in e if not x.is_concrete())
+            self._solver,
+            None,
+            *(x.unwrap() for x in e if not x.is_concrete()),
+            site="incremental",
         )
 
     def try_is_sat(self, timeout: int, *e) -> Optional[bool]:
         if any(map(lambda x: x.is_concrete() and x.value() is False, e)):
             return False
         return _is_sat(
-            self._solver, timeout, *(x.unwrap() for x in e if not x.is_concrete())
+            self._solver,
+            timeout,
+            *(x.unwrap() for x in e if not x.is_concrete()),
+            site="incremental",
         )
 
+    # the queries must be checked together with the assertions of the solver
+    check_branch = SolverIntf.check_branch
+
     def copy(self) -> "IncrementalSolver":
         s = IncrementalSolver()
         s._solver = self._solver.translate(self._solver.ctx)
@@ -135,7 +232,9 @@ def _rewrite_poly(em, exprs, assumptions=None):
     return expr1
 
 
-def solve_incrementally(assumptions, exprs, em, to1: int = 3000, to2: int = 500):
+def solve_incrementally(
+    assumptions, exprs, em, to1: int = 3000, to2: int = 500, portfolio: bool = False
+):
     # check if we can evaluate some expression syntactically
     for a in assumptions:
         exprs = [em.substitute(e, (a, em.get_true())) for e in exprs]
@@ -145,12 +244,16 @@ def solve_incrementally(assumptions, exprs, em, to1: int = 3000, to2: int = 500)
     if assumptions:
         exprs, r = _remove_implied(assumptions, em, exprs)
         if r is not None:
-            return r
+            return _decided("remove_implied", r)
 
     # First try to rewrite the formula into a simpler form
+    stats = solver_stats()
+    start = stats.timer()
     expr = _rewrite_poly(em, exprs, assumptions)
     if expr.is_concrete():
-        return bool(expr.value())
+        if start is not None:
+            stats.record("rewriting", perf_counter() - start, bool(expr.value()))
+        return _decided("rewriting", bool(expr.value()))
     exprcnf = expr.to_cnf()
     eqs = exprcnf.infer_equalities()
     if eqs:
@@ -158,16 +261,39 @@ def solve_incrementally(assumptions, exprs, em, to1: int = 3000, to2: int = 500)
         if not expr.is_concrete():
             exprs, r = _remove_implied(eqs, em, expr.to_cnf().children())
             if r is not None:
-                return r
+                return _decided("remove_implied", r)
             expr = em.conjunction(*exprs, *eqs)
     # else: keep the last expr that we had
+    if start is not None:
+        stats.record(
+            "rewriting",
+            perf_counter() - start,
+            bool(expr.value()) if expr.is_concrete() else "rewritten",
+            () if expr.is_concrete() else (expr.unwrap(),),
+        )
 
     if expr.is_concrete():
-        return bool(expr.value())
+        return _decided("rewriting", bool(expr.value()))
+
+    if portfolio and portfolio_available():
+        # race the strategies below (and more) instead of trying them in turn
+        return solve_portfolio(expr, em, to2)
 
     # FIXME: transfer state from _remove_implied
-    solver = IncrementalSolver()
+    pool = solver_pool()
+    with pool.solver() as solver:
+        return _solve_abstracted(pool, solver, expr, em, to2)
 
+
+def _decided(stage: str, r: Optional[bool]) -> Optional[bool]:
+    """Record the stage of solve_incrementally that decided the query"""
+    stats = solver_stats()
+    if stats.enabled and r is not None:
+        stats.answered_by(stage)
+    return r
+
+
+def _solve_abstracted(pool, solver, expr, em, to2: int) -> Optional[bool]:
     # FIXME try reduced bitwidth with propagating back models instead of this
     # for bw in (1, 2, 4, 8, 16):
     #    # FIXME: handle signed/unsinged and negations correctly in
@@ -189,32 +315,50 @@ def solve_incrementally(assumptions, exprs, em, to1: int = 3000, to2: int = 500)
     rexpr, subs = expr.replace_arith_ops()
     if rexpr:
         solver.push()
-        solver.add(rexpr.rewrite_and_simplify())
+        solver.add(*_formulas((rexpr.rewrite_and_simplify(),)))
         n = 0
         for placeholder, e in _sort_subs(subs):
             n += 1
-            if solver.try_is_sat(n * to2) is False:
-                return False
-            solver.add(em.Eq(e, placeholder))
+            pool.set_timeout(solver, n * to2)
+            if _is_sat(solver, None, site="abstraction") is False:
+                return _decided("abstraction", False)
+            solver.add(*_formulas((em.Eq(e, placeholder),)))
         solver.pop()
     # fall-back to solving the un-abstracted expression
-    return solver.is_sat(expr)
+    pool.set_timeout(solver, None)
+    r = _is_sat(solver, None, *_formulas((expr,)), site="solve_incrementally")
+    return _decided("full", r)
+
+
+def _formulas(exprs) -> list:
+    """Z3 formulas of the expressions (without the constant True)"""
+    if any(map(lambda x: x.is_concrete() and x.value() is False, exprs)):
+        return [BoolVal(False)]
+    return [x.unwrap() for x in exprs if not x.is_concrete()]
 
 
 def _remove_implied(assumptions, em, exprs):
-    solver = IncrementalSolver()
-    solver.add(*assumptions)
-    # check the assumpitons - if we are able to check them on their own,
-    r = solver.try_is_sat(1000)
-    if r is False:
-        return [em.get_false()], False
-    # we're good and can continue -- the solver has built a state for faster
-    # solving now
-
-    # try to subsume the implied expressions
-    # assert solver.is_sat() is True # otherwise we'll subsume everything
-    exprs = [e for e in exprs if solver.try_is_sat(500, em.Not(e)) is not False]
-    r = solver.try_is_sat(1000, *exprs)
+    pool = solver_pool()
+    with pool.solver(1000) as solver:
+        solver.add(*_formulas(assumptions))
+        # check the assumpitons - if we are able to check them on their own,
+        r = _is_sat(solver, None, site="remove_implied")
+        if r is False:
+            return [em.get_false()], False
+        # we're good and can continue -- the solver has built a state for faster
+        # solving now
+
+        # try to subsume the implied expressions
+        # assert solver.is_sat() is True # otherwise we'll subsume everything
+        pool.set_timeout(solver, 500)
+        exprs = [
+            e
+            for e in exprs
+            if _is_sat(solver, None, *_formulas((em.Not(e),)), site="remove_implied")
+            is not False
+        ]
+        pool.set_timeout(solver, 1000)
+        r = _is_sat(solver, None, *_formulas(exprs), site="remove_implied")
     return exprs, r
 
 
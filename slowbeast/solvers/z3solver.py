@@ -1,9 +1,34 @@
+from time import perf_counter
 from typing import Optional
 
 from z3 import sat, unsat, unknown, Solver as Z3Solver, BoolVal, BitVecVal, FPVal
 from z3.z3 import Solver
 
 from slowbeast.domains.concrete import concrete_value
+from slowbeast.solvers.capture import query_capture
+from slowbeast.solvers.pool import NO_TIMEOUT, solver_pool
+from slowbeast.solvers.stats import solver_stats
+
+
+def _result(r) -> Optional[bool]:
+    return True if r == sat else False if r == unsat else None
+
+
+def _timer() -> Optional[float]:
+    """Start measuring a call if it is recorded in the statistics
+    or captured"""
+    if solver_stats().enabled or query_capture().enabled:
+        return perf_counter()
+    return None
+
+
+def _record(site: str, elapsed: float, r, formulas, assertions=None) -> None:
+    stats, capture = solver_stats(), query_capture()
+    result = _result(r)
+    if stats.enabled:
+        stats.record(site, elapsed, result, formulas, assertions)
+    if capture.enabled:
+        capture.add(site, formulas, result, elapsed)
 
 
 def to_z3_val(v):
@@ -17,18 +42,18 @@ def to_z3_val(v):
 
 
 def models(assumpt, *args):
-    s = Z3Solver()
     for a in assumpt:
         assert a.is_bool(), a
-        if a.is_concrete():
-            s.add(a.value())
-        else:
-            s.add(a.unwrap())
-    r = s.check()
-    if r != sat:
-        return None
+    formulas = [BoolVal(a.value()) if a.is_concrete() else a.unwrap() for a in assumpt]
+    start = _timer()
+    with solver_pool().solver() as s:
+        r = s.check(*formulas)
+        if start is not None:
+            _record("models", perf_counter() - start, r, formulas)
+        if r != sat:
+            return None
+        m = s.model()
 
-    m = s.model()
     vals = []
     for a in args:
         # concrete values evaluate to concrete values
@@ -46,6 +71,7 @@ def models(assumpt, *args):
 
 
 def models_inc(solver, assumpt, *args):
+    start = _timer()
     solver.push()
     for a in assumpt:
         assert a.is_bool()
@@ -54,6 +80,8 @@ def models_inc(solver, assumpt, *args):
         else:
             solver.add(a.unwrap())
     r = solver.check()
+    if start is not None:
+        _record("models_inc", perf_counter() - start, r, solver.assertions())
     if r != sat:
         solver.pop()
         return None
@@ -76,16 +104,26 @@ def models_inc(solver, assumpt, *args):
     return vals
 
 
-def _is_sat(solver: Solver, timeout: int, *args) -> Optional[bool]:
+def _is_sat(
+    solver: Solver, timeout: int, *args, site: str = "is_sat"
+) -> Optional[bool]:
+    """Check the assertions of the solver with args as assumptions.
+    The site names the caller in the solver statistics."""
     if solver is None:
-        solver = Z3Solver()
+        with solver_pool().solver(timeout) as solver:
+            return _is_sat(solver, None, *args, site=site)
 
+    start = _timer()
     if timeout:
         solver.set("timeout", timeout)
         r = solver.check(*args)
-        solver.set("timeout", 4294967295)  # default value
+        solver.set("timeout", NO_TIMEOUT)
     else:
         r = solver.check(*args)
+    if start is not None:
+        elapsed = perf_counter() - start
+        assertions = solver.assertions()
+        _record(site, elapsed, r, (*assertions, *args), len(assertions))
 
     if r == sat:
         return True
@@ -1,19 +1,89 @@
+from z3 import is_false, is_true
+
+from slowbeast.domains.symbolic_helpers import symbols
 from slowbeast.solvers.symcrete import IncrementalSolver
 
 
+def _symbol_ids(c) -> set:
+    return {s.get_id() for s in symbols(c.unwrap()) if not (is_true(s) or is_false(s))}
+
+
 class ConstraintsSet:
-    __slots__ = "_constraints"
+    """
+    A set of constraints. Besides the list of the constraints, the set
+    keeps the constraints partitioned into independent components:
+    constraints that (transitively) share symbols are in the same
+    component. A query about an expression then needs only the components
+    with the symbols of the expression, the rest of the constraints
+    cannot make the expression unsatisfiable (provided the constraints
+    are satisfiable).
+    """
+
+    __slots__ = "_constraints", "_symbol_comp", "_components", "_ground"
 
     def __init__(self, C=None) -> None:
         self._constraints = []
+        # id of a symbol -> id of its component
+        self._symbol_comp = {}
+        # id of a component -> (ids of its symbols, its constraints)
+        self._components = {}
+        # constraints without symbols
+        self._ground = ()
         if C:
             self.add(*C)
 
     def copy(self) -> "ConstraintsSet":
         n = ConstraintsSet()
-        n._constraints = self._constraints.copy()
+        self._copy_to(n)
         return n
 
+    def _copy_to(self, n: "ConstraintsSet") -> None:
+        # the components are tuples, so it is enough to copy the dicts
+        n._constraints = self._constraints.copy()
+        n._symbol_comp = self._symbol_comp.copy()
+        n._components = self._components.copy()
+        n._ground = self._ground
+
+    def _add_to_component(self, c) -> None:
+        syms = _symbol_ids(c)
+        if not syms:
+            self._ground += (c,)
+            return
+        symbol_comp, components = self._symbol_comp, self._components
+        comps = {symbol_comp[s] for s in syms if s in symbol_comp}
+        # keep the id of the biggest component, so that we re-map
+        # the symbols of the smaller ones only
+        rep = max(comps, key=lambda r: len(components[r][0]), default=None)
+        if rep is None:
+            rep = next(iter(syms))
+            comp_syms, comp_constrs = frozenset(), ()
+        else:
+            comp_syms, comp_constrs = components[rep]
+        new_syms = syms.difference(comp_syms)
+        for r in comps:
+            if r != rep:
+                rsyms, rconstrs = components.pop(r)
+                new_syms.update(rsyms)
+                comp_constrs += rconstrs
+        for sym in new_syms:
+            symbol_comp[sym] = rep
+        components[rep] = (comp_syms | new_syms, comp_constrs + (c,))
+
+    def relevant(self, *E) -> list:
+        """Return the constraints that may share symbols with the
+        expressions (directly or via other constraints)"""
+        symbol_comp = self._symbol_comp
+        comps = set()
+        for e in E:
+            if not e.is_concrete():
+                comps.update(
+                    symbol_comp[s] for s in _symbol_ids(e) if s in symbol_comp
+                )
+        if len(comps) == len(self._components):
+            return self._constraints
+        components = self._components
+        return [*self._ground, *(c for r in comps for c in components[r][1])]
+
     def __eq__(self, rhs: object):
         return self._constraints == rhs._constraints
 
@@ -29,14 +99,20 @@ class ConstraintsSet:
             if c.is_concrete():
                 if c.value() is False:
                     self._constraints = [c]
+                    self._symbol_comp = {}
+                    self._components = {}
+                    self._ground = (c,)
                     ret = True
                     break
                 # we can ignore True...
             elif c.is_and():
-                constr.extend(c.children())
+                for child in c.children():
+                    constr.append(child)
+                    self._add_to_component(child)
                 ret = True
             else:
                 constr.append(c)
+                self._add_to_component(c)
                 ret = True
         return ret
 
@@ -62,7 +138,7 @@ class IncrementalConstraintsSet(ConstraintsSet):
 
     def copy(self) -> "IncrementalConstraintsSet":
         n = IncrementalConstraintsSet(solver=self._solver.copy())
-        n._constraints = self._constraints.copy()
+        self._copy_to(n)
         return n
 
     def add(self, *C) -> bool:
@@ -13,6 +13,8 @@ from slowbeast.domains.value import Value
 from slowbeast.ir.function import Function
 from slowbeast.ir.program import Program
 from slowbeast.solvers.symcrete import SymbolicSolver
+from slowbeast.solvers.diskcache import open_disk_cache
+from slowbeast.solvers.session import SolverSession
 from slowbeast.symexe.annotations import ExprAnnotation
 from slowbeast.symexe.memorymodel import SymbolicMemoryModel
 from slowbeast.symexe.options import SEOptions
@@ -125,6 +127,10 @@ class IExecutor(ConcreteIExecutor):
             memorymodel = SymbolicMemoryModel(opts)
         super().__init__(program, opts, memorymodel)
         self.solver = solver
+        if opts.smt_cache:
+            solver.set_disk_cache(open_disk_cache(opts.smt_cache, opts.smt_cache_size))
+        # the Z3 solver shared by the states with incremental solving
+        self._solver_session = SolverSession() if opts.incremental_solving else None
         self.stats = SEStats()
         # use these values in place of nondet values
         self._input_vector = None
@@ -147,7 +153,7 @@ class IExecutor(ConcreteIExecutor):
         if m is None:
             m = self.get_memory_model().create_memory()
         if self.get_options().incremental_solving:
-            s = IncrementalSEState(self, pc, m)
+            s = IncrementalSEState(self, pc, m, self._solver_session.solver())
         else:
             # FIXME: we do not use the solver...
             s = SEState(self, pc, m, self.solver)
@@ -196,13 +202,12 @@ class IExecutor(ConcreteIExecutor):
             raise RuntimeError(f"Invalid condition: {cond.value()}")
 
         # check SAT of cond and its negation
-        csat = state.is_sat(cond)
+        csat, ncsat = state.check_branch(cond)
         if csat is None:
             T = state.copy()
             T.set_killed(f"Solver failure: {csat}")
 
         ncond = state.expr_manager().Not(cond)
-        ncsat = state.is_sat(ncond)
         if ncsat is None:
             F = state.copy()
             F.set_killed(f"Solver failure: {ncsat}")
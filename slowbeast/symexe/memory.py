@@ -2,10 +2,26 @@ from typing import Optional
 
 from slowbeast.core.memory import Memory as CoreMemory
 from slowbeast.domains.concrete_bitvec import ConcreteBitVec
-from slowbeast.symexe.memoryobject import MemoryObject
+from slowbeast.symexe.memoryobject import ArrayMemoryObject, MemoryObject
 
 
 class Memory(CoreMemory):
+    def __init__(
+        self, array_objects: bool = False, array_objects_size: Optional[int] = None
+    ) -> None:
+        super().__init__()
+        # turn objects accessed at symbolic offsets into array objects
+        self._array_objects = array_objects
+        # allocate objects of at least this size (and of symbolic size)
+        # as array objects
+        self._array_objects_size = array_objects_size
+
+    def _copy_to(self, new):
+        super()._copy_to(new)
+        new._array_objects = self._array_objects
+        new._array_objects_size = self._array_objects_size
+        return new
+
     def create_memory_object(
         self,
         size: ConcreteBitVec,
@@ -20,4 +36,34 @@ class Memory(CoreMemory):
         by child classes to create a different type of
         memory objects.
         """
+        min_size = self._array_objects_size
+        if min_size is not None and (
+            not size.is_concrete() or size.value() >= min_size
+        ):
+            return ArrayMemoryObject(size, nm, objid, is_heap, is_global, is_read_only)
         return MemoryObject(size, nm, objid, is_heap, is_global, is_read_only)
+
+    def _to_array_object(self, ptr) -> None:
+        """Turn the object pointed by ptr into an array object
+        if the offset of ptr is symbolic"""
+        if not self._array_objects or ptr.offset().is_concrete():
+            return
+        if not ptr.object().is_concrete():
+            return
+        if self._pending_inits:
+            # the object is accessed, so write its initial value
+            self._init_pending(ptr.object().value())
+        obj = self.get_obj(ptr.object())
+        if obj is None or isinstance(obj, ArrayMemoryObject):
+            return
+        new = ArrayMemoryObject.from_object(obj)
+        if new is not None:
+            self._own_obj(new, self.has_global_object(obj.get_id()))
+
+    def write(self, ptr, x):
+        self._to_array_object(ptr)
+        return super().write(ptr, x)
+
+    def read(self, ptr, bytes_num):
+        self._to_array_object(ptr)
+        return super().read(ptr, bytes_num)
@@ -1,13 +1,17 @@
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
+from slowbeast.core.errors import MemError
 from slowbeast.core.memorymodel import MemoryModel as CoreMM
+from slowbeast.domains.concrete import concrete_value
 from slowbeast.domains.expr import NondetLoad
 from slowbeast.domains.value import Value
 from slowbeast.ir.instruction import Alloc, GlobalVariable, Load
 from slowbeast.ir.types import get_size_type
 from slowbeast.ir.types import type_mgr
 from slowbeast.symexe.memory import Memory
+from slowbeast.symexe.memoryobject import ArrayMemoryObject
 from slowbeast.symexe.options import SEOptions
+from slowbeast.symexe.state import SEState
 from slowbeast.util.debugging import dbgv
 
 
@@ -17,7 +21,93 @@ class SymbolicMemoryModel(CoreMM):
 
     def create_memory(self) -> Memory:
         """Create a memory object that is going to be a part of a state."""
-        return Memory()
+        opts = self._opts
+        return Memory(opts.array_objects, opts.array_objects_size)
+
+    def _unchecked_object(self, state: SEState, ptr):
+        """
+        Return the object accessed via ptr if the bounds of the access
+        must be checked here, i.e., the access has a symbolic offset or the
+        object has a symbolic size, so the object itself cannot check it.
+        """
+        if ptr is None or not ptr.is_pointer() or not ptr.object().is_concrete():
+            return None
+        off = ptr.offset()
+        mo = state.memory.get_obj(ptr.object())
+        if mo is None:
+            return None
+        if not isinstance(mo, ArrayMemoryObject) and (
+            not self._opts.array_objects or off.is_concrete()
+        ):
+            return None
+        if off.is_concrete() and mo.size().is_concrete():
+            # checked by the object
+            return None
+        return mo
+
+    def _check_bounds(
+        self, state: SEState, ptr, mo, bytes_num: int
+    ) -> Tuple[Optional[SEState], List[SEState]]:
+        """
+        Fork the state on the access of bytes_num bytes via ptr into
+        the object mo being in bounds. Return the state where the access
+        is in bounds (or None) and the states with the out-of-bounds access.
+        """
+        off, size = ptr.offset(), mo.size()
+        em = state.expr_manager()
+        bts = concrete_value(bytes_num, size.type())
+        # the offsets are unsigned here, so negative offsets are too big too
+        inbounds = em.And(
+            em.Le(bts, size, unsigned=True),
+            em.Le(off, em.Sub(size, bts), unsigned=True),
+        )
+        if inbounds.is_concrete():
+            if inbounds.value():
+                return state, []
+            state.set_error(self._oob_error(ptr, bytes_num, size))
+            return None, [state]
+
+        insat, outsat = state.check_branch(inbounds)
+        if insat is None or outsat is None:
+            state.set_killed("Solver failure when checking bounds of an access")
+            return None, [state]
+        if not outsat:
+            return state, []
+        if not insat:
+            state.set_error(self._oob_error(ptr, bytes_num, size))
+            return None, [state]
+        oob = state.copy()
+        oob.add_constraint(em.Not(inbounds))
+        oob.set_error(self._oob_error(ptr, bytes_num, size))
+        state.add_constraint(inbounds)
+        return state, [oob]
+
+    def _oob_error(self, ptr, bytes_num: int, size) -> MemError:
+        return MemError(
+            MemError.OOB_ACCESS,
+            f"Accessing {bytes_num}B at offset {ptr.offset()} of object "
+            f"{ptr.object()} of size {size}",
+        )
+
+    def write(self, state, instr, value_op, to_op):
+        to = state.get(to_op)
+        mo = self._unchecked_object(state, to)
+        if mo is None:
+            return super().write(state, instr, value_op, to_op)
+        state, oob = self._check_bounds(state, to, mo, instr.bytewidth())
+        if state is None:
+            return oob
+        return super().write(state, instr, value_op, to_op) + oob
+
+    def read(self, state, to_op, from_op, bytes_num: int, bitsnum=None):
+        frm = state.get(from_op)
+        mo = self._unchecked_object(state, frm)
+        if mo is None:
+            return super().read(state, to_op, from_op, bytes_num, bitsnum)
+        state, oob = self._check_bounds(state, frm, mo, bytes_num)
+        if state is None:
+            return oob
+        return super().read(state, to_op, from_op, bytes_num, bitsnum) + oob
 
 
 # LazySymbolicMemoryModel inherints from CoreMM intentionally (SymbolicMemoryModel
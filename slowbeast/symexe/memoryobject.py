@@ -1,22 +1,51 @@
 from typing import Union, Tuple, Optional
 
+from z3 import Array, BitVecSort, BitVecVal, Concat, Extract, K, Select, Store, simplify
+
 from slowbeast.core.errors import MemError
-from slowbeast.core.memoryobject import MemoryObject as CoreMO
+from slowbeast.core.memoryobject import MemoryObject as CoreMO, values_equal
 from slowbeast.domains.concrete_bitvec import ConcreteBitVec
 from slowbeast.domains.concrete_value import ConcreteVal
 from slowbeast.domains.expr import Expr
+from slowbeast.domains.symbolic_helpers import python_constant
 from slowbeast.domains.value import Value
 from slowbeast.ir.types import get_offset_type, type_mgr
 from slowbeast.solvers.symcrete import global_expr_mgr
 from slowbeast.util.debugging import dbgv
 
 
-def write_bytes(values: list, offval, x: Union[Expr, Value]) -> Optional[MemError]:
+# objects promoted to bytes keep the bytes in pages of this many bytes.
+# Untouched pages are not materialized and copies of objects share
+# the pages until they write them.
+PAGE_BITS = 6
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+
+def _byte(pages: list, i: int):
+    page = pages[i >> PAGE_BITS]
+    return None if page is None else page[i & PAGE_MASK]
+
+
+def bytes_items(pages: list):
+    """The (offset, byte) pairs of the written bytes of the pages"""
+    for p, page in enumerate(pages):
+        if page is not None:
+            base = p << PAGE_BITS
+            for i, b in enumerate(page):
+                if b is not None:
+                    yield base + i, b
+
+
+def write_bytes(
+    pages: list, owned: set, offval, x: Union[Expr, Value]
+) -> Optional[MemError]:
     """
-    Write value "x" at offval + offval + size(x) indices of values list.
+    Write value "x" at offval + offval + size(x) indices of the pages.
+    The pages that are not in owned are copied before writing them.
     Return None if all is fine or return a MemError object.
     """
-    assert values
+    assert pages
 
     if x.type().is_pointer():
         return MemError(MemError.UNSUPPORTED, f"breaking pointer to bytes")
@@ -33,54 +62,98 @@ def write_bytes(values: list, offval, x: Union[Expr, Value]) -> Optional[MemErro
     if xvalues is None:  # for optimized runs
         return None
     for n, i in enumerate(range(offval, offval + bw)):
-        values[i] = xvalues[n]
+        p = i >> PAGE_BITS
+        page = pages[p]
+        if page is None:
+            page = pages[p] = [None] * PAGE_SIZE
+            owned.add(p)
+        elif p not in owned:
+            page = pages[p] = page.copy()
+            owned.add(p)
+        page[i & PAGE_MASK] = xvalues[n]
     return None
 
 
-def read_bytes(values: list, offval, bts, zeroed):
+def read_bytes(pages: list, offval, bts, zeroed):
     assert bts > 0, bts
     assert offval >= 0, offval
     expr_mgr = global_expr_mgr()
+    c = offval + bts - 1
     if zeroed:
-        c = offval + bts - 1
         # just make Extract return BytesType and it should work well then
-        vals = [
-            values[c - i] if values[c - i] is not None else ConcreteBitVec(0, 8)
-            for i in range(0, bts)
-        ]
+        vals = [_byte(pages, c - i) for i in range(0, bts)]
+        vals = [ConcreteBitVec(0, 8) if v is None else v for v in vals]
     else:
-        if offval + bts > len(values):
+        if offval + bts > len(pages) * PAGE_SIZE:
             return None, MemError(
                 MemError.UNINIT_READ,
                 f"Read of {bts} bytes on offset {offval} "
-                f"from object with {len(values)} initialized "
+                f"from object with {len(pages) * PAGE_SIZE} initialized "
                 "values.",
             )
-        if any(values[i] is None for i in range(offval, offval + bts)):
+        vals = [_byte(pages, c - i) for i in range(0, bts)]
+        if any(v is None for v in vals):
             return None, MemError(MemError.UNINIT_READ, "Read of uninitialized byte")
-        c = offval + bts - 1
-        vals = [values[c - i] for i in range(0, bts)]
 
     return expr_mgr.bytes(vals), None
 
 
-def mo_to_bytes(values, size):
+def mo_to_bytes(values, size, owned: set):
+    """Create the pages of bytes with the values written,
+    the indices of created pages are added to owned"""
     dbgv("Promoting MO to bytes", color="gray")
     assert isinstance(values, dict), values
-    newvalues = [None] * size
+    pages = [None] * ((size + PAGE_SIZE - 1) >> PAGE_BITS)
     for o, val in values.items():
-        tmp = write_bytes(newvalues, o, val)
+        tmp = write_bytes(pages, owned, o, val)
         if tmp is not None:
             return None, tmp
-    return newvalues, None
+    return pages, None
 
 
 class MemoryObject(CoreMO):
-    __slots__ = ()
+    # the pages of bytes that are not shared with other objects
+    __slots__ = ("_owned_pages",)
 
     def _is_bytes(self):
         return isinstance(self._values, list)
 
+    def writable_copy(self) -> "MemoryObject":
+        new = super().writable_copy()
+        if self._is_bytes():
+            # the pages are shared now, both objects copy them on write
+            new._owned_pages = set()
+            self._owned_pages = set()
+        return new
+
+    def clear(self) -> None:
+        assert not self._ro
+        self._values = {}
+        self._values_hash = 0
+        self._offsets = []
+
+    def _same_values(self, rhs: CoreMO) -> bool:
+        if not self._is_bytes() and not rhs._is_bytes():
+            return super()._same_values(rhs)
+        if not self._is_bytes() or not rhs._is_bytes():
+            return False
+        for page, rpage in zip(self._values, rhs._values):
+            if page is rpage:
+                continue
+            if page is None or rpage is None:
+                return False
+            if not all(values_equal(b, rb) for b, rb in zip(page, rpage)):
+                return False
+        return True
+
+    @staticmethod
+    def _extract(val: Value, start: int, end: int) -> Value:
+        return global_expr_mgr().Extract(val, start, end)
+
+    @staticmethod
+    def _concat(*vals: Value) -> Value:
+        return global_expr_mgr().Concat(*vals)
+
     # FIXME: refactor
     def read(
         self, bts: int, off: Optional[ConcreteVal] = None
@@ -121,25 +194,41 @@ class MemoryObject(CoreMO):
     def read_value(self, bts, offval, size):
         values: dict = self._values
         val = values.get(offval)
-        if val is None and self._zeroed:
-            if any((values.get(off) for off in range(offval, offval + bts))):
-                # there exist some value that overlaps with the range of read bytes
-                return self.promote_and_read(bts, offval, size)
-            val = ConcreteBitVec(0, 8 * bts)
-        if val is None or val.bytewidth() != bts:
+        if val is not None and val.bytewidth() == bts:
+            # FIXME: make me return BytesType objects (a sequence of bytes)
+            return val, None
+        val, err = self._read_parts(bts, offval, self._zeroed)
+        if val is None and err is None:
+            # some value cannot be split, read the object as bytes
             return self.promote_and_read(bts, offval, size)
-
-        # FIXME: make me return BytesType objects (a sequence of bytes)
-        return val, None
+        return val, err
 
     def promote_and_read(self, bts, offval, size):
-        bytevalues, err = mo_to_bytes(self._values, size)
+        # reads do not change the object (it may be shared by more memories
+        # and the promotion changes its hash), so promote only the values
+        # that overlap the read bytes and throw the bytes away
+        values = self._values
+        overlapping = {o: values[o] for o in self._overlapping(offval, bts)}
+        bytevalues, err = mo_to_bytes(overlapping, size, set())
         if err:
             return None, err
-        self._values = bytevalues
-        assert isinstance(self._values, list)
         return read_bytes(bytevalues, offval, bts, self._zeroed)
 
+    def _promote(self, size) -> Optional[MemError]:
+        """Keep the values as bytes. The hash of the bytes differs from
+        the hash of the values, so it is computed anew."""
+        owned = set()
+        pages, err = mo_to_bytes(self._values, size, owned)
+        if err:
+            return err
+        self._values = pages
+        self._owned_pages = owned
+        h = 0
+        for i, b in bytes_items(pages):
+            h ^= hash((i, b))
+        self._values_hash = h
+        return None
+
     def write(self, x: Value, off: Optional[ConcreteVal] = None) -> Optional[MemError]:
         """
         Write 'x' to 'off' offset in this object.
@@ -172,31 +261,186 @@ class MemoryObject(CoreMO):
                 f"Writing {x.bytewidth()}B to offset {offval} of {size}B object",
             )
 
-        values = self._values
         if self._is_bytes():
-            return write_bytes(values, offval, x)
-        # does the write overlap? should we promote the object
-        # to bytes-object?
-        # FIXME: not efficient...
-        bw = x.bytewidth()
-        for o, val in values.items():
-            if offval < o + val.bytewidth() and offval + bw > o:
-                if o == offval and val.bytewidth() == bw:
-                    break  # the overlap is perfect, we just overwrite the value
-
-                # promote to bytes
-                tmp, err = mo_to_bytes(values, size)
-                if err:
-                    return err
-                self._values = tmp
-                return write_bytes(tmp, offval, x)
-
-        values[offval] = x
+            return self._write_bytes(offval, x)
+        if self._store(x, offval):
+            return None
+
+        # an overwritten value cannot be split, promote to bytes
+        err = self._promote(size)
+        if err:
+            return err
+        return self._write_bytes(offval, x)
+
+    def _write_bytes(self, offval, x: Value) -> Optional[MemError]:
+        pages, end = self._values, offval + x.bytewidth()
+        h = self._values_hash
+        for i in range(offval, end):
+            b = _byte(pages, i)
+            if b is not None:
+                h ^= hash((i, b))
+        err = write_bytes(pages, self._owned_pages, offval, x)
+        if err is not None:
+            return err
+        for i in range(offval, end):
+            h ^= hash((i, _byte(pages, i)))
+        self._values_hash = h
         return None
 
     def __repr__(self) -> str:
         s = self._repr_header()
         vals = self._values
-        for k, v in enumerate(vals) if isinstance(vals, list) else vals.items():
+        for k, v in bytes_items(vals) if isinstance(vals, list) else vals.items():
             s += f"\n  {k} -> {v}"
         return s
+
+
+def _array_term(x: Value):
+    """The bit-vector term of the value stored into an array object
+    (or None if the value cannot be stored into the array)"""
+    if x.is_pointer() or x.bitwidth() % 8 != 0:
+        return None
+    em = global_expr_mgr()
+    if not x.is_bv():
+        x = em.BitCast(x, type_mgr().bv_ty(x.bitwidth()))
+        if x is None or not x.is_bv():
+            return None
+    return em.lift(x).unwrap()
+
+
+def _index_term(off: Value):
+    if off.is_concrete():
+        return BitVecVal(off.value(), off.bitwidth())
+    return off.unwrap()
+
+
+class ArrayMemoryObject(MemoryObject):
+    """
+    Memory object whose bytes are an SMT array (from offsets to bytes).
+    Writes store the bytes of the value into the array and reads select
+    the bytes from the array, so the offsets of the accesses
+    can be symbolic. The uninitialized bytes are nondeterministic
+    (or zeros if the object is zeroed). Pointers cannot be stored
+    into array objects.
+    """
+
+    arrays = 0
+
+    __slots__ = ("_array",)
+
+    def __init__(
+        self,
+        size: ConcreteBitVec,
+        nm: str = "unnamed",
+        objid: None = None,
+        is_heap: bool = False,
+        is_global: bool = False,
+        is_read_only: bool = False,
+    ) -> None:
+        super().__init__(size, nm, objid, is_heap, is_global, is_read_only)
+        self._array = self._fresh_array()
+
+    def _fresh_array(self):
+        if self._zeroed:
+            return K(BitVecSort(get_offset_type().bitwidth()), BitVecVal(0, 8))
+        ArrayMemoryObject.arrays += 1
+        return Array(
+            f"array_mo{self._id}_{ArrayMemoryObject.arrays}",
+            BitVecSort(get_offset_type().bitwidth()),
+            BitVecSort(8),
+        )
+
+    @staticmethod
+    def from_object(mo: MemoryObject) -> Optional["ArrayMemoryObject"]:
+        """Create an array object with the same identity and contents as mo.
+        Return None if some value of mo cannot be stored into the array."""
+        new = ArrayMemoryObject.__new__(ArrayMemoryObject)
+        for attr in CoreMO.__slots__:
+            setattr(new, attr, getattr(mo, attr))
+        new._values, new._values_hash, new._offsets, new._ro = {}, 0, [], False
+        new._array = new._fresh_array()
+        vals = mo._values
+        for off, val in bytes_items(vals) if isinstance(vals, list) else vals.items():
+            if new._store_bytes(BitVecVal(off, get_offset_type().bitwidth()), val):
+                return None
+        return new
+
+    def set_zeroed(self) -> None:
+        super().set_zeroed()
+        self._array = self._fresh_array()
+
+    def structural_hash(self) -> int:
+        # the terms are hash-consed, their hashes are O(1)
+        return hash((self._id, self._zeroed, self._array.hash()))
+
+    def structurally_equal(self, rhs: CoreMO) -> bool:
+        if self is rhs:
+            return True
+        return (
+            type(self) is type(rhs)
+            and self._id == rhs._id
+            and self._zeroed == rhs._zeroed
+            and self._array.eq(rhs._array)
+        )
+
+    def clear(self) -> None:
+        assert not self._ro
+        self._array = self._fresh_array()
+
+    def clean_copy(self) -> "ArrayMemoryObject":
+        new = super().clean_copy()
+        new._array = new._fresh_array()
+        return new
+
+    def _store_bytes(self, idx, x: Value) -> Optional[MemError]:
+        term = _array_term(x)
+        if term is None:
+            return MemError(
+                MemError.UNSUPPORTED, f"Cannot store {x} into an array object"
+            )
+        array = self._array
+        for i in range(x.bytewidth()):
+            array = Store(array, idx + i, Extract(8 * i + 7, 8 * i, term))
+        self._array = array
+        return None
+
+    def _check_bounds(self, bts: int, off: Value) -> Optional[MemError]:
+        # accesses with symbolic offsets or to symbolic-sized objects
+        # are checked with the solver by SymbolicMemoryModel
+        size = self.size()
+        if off.is_concrete() and size.is_concrete():
+            if off.value() + bts > size.value():
+                return MemError(
+                    MemError.OOB_ACCESS,
+                    f"Accessing {bts}B at offset {off.value()} of {size.value()}B object",
+                )
+        return None
+
+    def write(self, x: Value, off: Optional[Value] = None) -> Optional[MemError]:
+        assert isinstance(x, Value)
+        assert self._ro is False, "Writing read-only object (COW bug)"
+        if off is None:
+            off = ConcreteBitVec(0, get_offset_type())
+        err = self._check_bounds(x.bytewidth(), off)
+        if err:
+            return err
+        return self._store_bytes(_index_term(off), x)
+
+    def read(self, bts: int, off: Optional[Value] = None):
+        assert isinstance(bts, int), "Read non-constant number of bytes"
+        if off is None:
+            off = ConcreteBitVec(0, get_offset_type())
+        err = self._check_bounds(bts, off)
+        if err:
+            return None, err
+        idx, array = _index_term(off), self._array
+        # the values are little-endian
+        sel = [Select(array, idx + i) for i in range(bts - 1, -1, -1)]
+        term = simplify(Concat(*sel) if bts > 1 else sel[0])
+        c = python_constant(term)
+        if c is not None:
+            return ConcreteBitVec(c, 8 * bts), None
+        return Expr(term, type_mgr().bv_ty(8 * bts)), None
+
+    def __repr__(self) -> str:
+        return f"{self._repr_header()}\n  array: {self._array}"
@@ -1,4 +1,5 @@
 from slowbeast.interpreter.options import ExecutionOptions
+from slowbeast.solvers.diskcache import DISK_CACHE_SIZE
 
 # FIXME self.check should be an enum
 class SEOptions(ExecutionOptions):
@@ -6,16 +7,46 @@ class SEOptions(ExecutionOptions):
         super().__init__(opts)
         if opts:
             self.incremental_solving = opts.incremental_solving
+            self.smt_cache = opts.smt_cache
+            self.smt_cache_size = opts.smt_cache_size
+            self.solver_portfolio = opts.solver_portfolio
+            self.array_objects = opts.array_objects
+            self.array_objects_size = opts.array_objects_size
             self.replay_errors = opts.replay_errors
             self.concretize_nondets = opts.concretize_nondets
             self.uninit_is_nondet = opts.uninit_is_nondet
             self.exit_on_error = opts.exit_on_error
             self.error_funs = opts.error_funs
             self.threads = opts.threads
+            self.threads_dpor_jobs = opts.threads_dpor_jobs
+            self.threads_dpor_stateful = opts.threads_dpor_stateful
+            self.threads_coalesce_invisible = opts.threads_coalesce_invisible
+            self.threads_escape_analysis = opts.threads_escape_analysis
             self.check = opts.check
         else:
             self.threads = False
+            # number of worker processes for (source) DPOR
+            self.threads_dpor_jobs = 1
+            # do not explore again states visited by (source) DPOR
+            self.threads_dpor_stateful = False
+            # execute the instructions of a thread that are invisible
+            # to other threads without scheduling points
+            self.threads_coalesce_invisible = False
+            # do not schedule threads around accesses to memory
+            # that does not escape its thread
+            self.threads_escape_analysis = True
             self.incremental_solving = False
+            # file with the results of SMT queries shared by more runs
+            self.smt_cache = None
+            # the maximal number of queries kept in the file
+            self.smt_cache_size = DISK_CACHE_SIZE
+            # race more solving strategies in processes on hard queries
+            self.solver_portfolio = False
+            # turn memory objects accessed at symbolic offsets
+            # into objects backed by SMT arrays
+            self.array_objects = False
+            # allocate objects of at least this size as array objects
+            self.array_objects_size = None
             self.replay_errors = False
             self.concretize_nondets = False
             self.uninit_is_nondet = False
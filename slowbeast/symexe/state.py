@@ -88,14 +88,36 @@ class SEState(ExecutionState):
         if not symb:
             return True
 
-        r = self.solver().try_is_sat(1000, *self.constraints(), *e)
+        # only the constraints that share symbols with e matter
+        C = self._constraints.relevant(*symb)
+        r = self.solver().try_is_sat(1000, *C, *e)
         if r is not None:
             return r
 
-        return solve_incrementally(self.constraints(), e, self.expr_manager())
+        return self._solve_incrementally(C, e)
+
+    def _solve_incrementally(self, C, E):
+        executor = self._executor
+        portfolio = executor is not None and executor.get_options().solver_portfolio
+        return solve_incrementally(C, E, self.expr_manager(), portfolio=portfolio)
+
+    def check_branch(self, cond):
+        """Check whether the state is feasible with cond and with
+        the negation of cond. Return the pair of results."""
+        em = self.expr_manager()
+        if cond.is_concrete():
+            return self.is_sat(cond), self.is_sat(em.Not(cond))
+        C = self._constraints.relevant(cond)
+        csat, ncsat = self.solver().check_branch(C, cond, 1000)
+        if csat is None:
+            csat = self._solve_incrementally(C, (cond,))
+        if ncsat is None:
+            ncsat = self._solve_incrementally(C, (em.Not(cond),))
+        return csat, ncsat
 
     def try_is_sat(self, timeout, *e):
-        return self.solver().try_is_sat(timeout, *self.constraints(), *e)
+        C = self._constraints.relevant(*e)
+        return self.solver().try_is_sat(timeout, *C, *e)
 
     def is_feasible(self):
         """
@@ -109,8 +131,7 @@ class SEState(ExecutionState):
         if r is not None:
             return r
 
-        em = self.expr_manager()
-        return solve_incrementally([], C, em)
+        return self._solve_incrementally([], C)
 
     def concretize(self, *e):
         return self.solver().concretize(self.constraints(), *e)
@@ -229,8 +250,8 @@ class SEState(ExecutionState):
 
 
 class IncrementalSEState(SEState):
-    def __init__(self, executor=None, pc=None, m=None) -> None:
-        C = IncrementalConstraintsSet()
+    def __init__(self, executor=None, pc=None, m=None, solver=None) -> None:
+        C = IncrementalConstraintsSet(solver=solver)
         super().__init__(executor, pc, m, solver=None, constraints=C)
 
     def solver(self):
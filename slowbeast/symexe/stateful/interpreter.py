@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from typing import Type
 
 from slowbeast.symexe.state import SEState
@@ -5,25 +6,34 @@ from slowbeast.symexe.interpreter import SEOptions
 from slowbeast.symexe.iexecutor import IExecutor as SExecutor
 from slowbeast.symexe.interpreter import SymbolicInterpreter
 
+# the maximal number of explored states kept for the subsumption checks,
+# the least recently used ones are forgotten (and may be explored again)
+EXPLORED_STATES_SIZE = 65536
 
-def subsumed_memory(s, state) -> bool:
-    # every value in the state must be included in the corresponding value of s
-    # FIXME: accessing protected attrs
-    meml, memr = state.memory, s.memory
 
-    if len(meml._cs) != len(memr._cs):
-        return False
+def subsumed_memory(memory, state) -> bool:
+    """Is the memory of the state equal to the (explored) memory?
+    The values are compared as terms: the state has the same memory if its
+    values are the same functions of the symbols, so together with
+    the constraints (see implies_constraints) it has no other behaviours
+    than the explored state."""
+    return memory.structurally_equal(state.memory)
+
 
-    # cs, objects, globalobjects
-    for reg, lo in meml._objects.items():
-        # if two MO with same ID in two states correspond to the same allocation during runtime, so we can just compare
-        # them
-        ro = memr.get_obj(reg)
-        if ro is None:
-            return False
-        for lval in lo.values().items():
-            s.is_sat()
-    return True
+def implies_constraints(state, C) -> bool:
+    """Do the constraints of the state imply the constraints C?
+    The constraints that the state has too are implied trivially,
+    the rest is implied if the state is infeasible with its negation
+    (an unknown answer of the solver is taken as no)."""
+    ids = {c.unwrap().get_id() for c in state.constraints() if not c.is_concrete()}
+    missing = [c for c in C if c.is_concrete() or c.unwrap().get_id() not in ids]
+    if not missing:
+        return True
+    em = state.expr_manager()
+    negation = em.Not(em.conjunction(*missing))
+    if negation.is_concrete():
+        return negation.value() is False
+    return state.try_is_sat(1000, negation) is False
 
 
 class StatefulSymbolicInterpreter(SymbolicInterpreter):
@@ -33,7 +43,7 @@ class StatefulSymbolicInterpreter(SymbolicInterpreter):
         ohandler=None,
         opts: SEOptions = SEOptions(),
         executor=None,
-        ExecutorClass: Type[slowbeast.symexe.executor.ForwardExecutor] = SExecutor,
+        ExecutorClass: Type[SExecutor] = SExecutor,
     ) -> None:
         super().__init__(
             P,
@@ -42,7 +52,10 @@ class StatefulSymbolicInterpreter(SymbolicInterpreter):
             executor,
             ExecutorClass,
         )
-        self.explored_states = {}
+        # (pc, hash of memory) -> explored (memory, status, constraints),
+        # the most recently used last
+        self.explored_states = OrderedDict()
+        self._explored_num = 0
 
     def handle_new_state(self, state: SEState) -> None:
         if self.is_subsumed(state):
@@ -56,23 +69,28 @@ class StatefulSymbolicInterpreter(SymbolicInterpreter):
         """
         Return true if we have a state that was implied by this state
         """
-        pc = state.pc
-        # FIXME use approximate hasing to get a small set of states for subsumption checking
-        # for s in self.explored_states.setdefault(pc, set()):
-        EM = state.expr_manager()
-        for s in self.explored_states.setdefault(pc, []):
-            # FIXME: will not work with incremental solving, there may be a symbol collision
-            # every value in the state must be included in the corresponding
-            # value of s
-            assert state.pc is s.pc
-            if s.status != state.status:
+        # the memories are hashed incrementally, so we look up just
+        # the explored states whose memory is very likely equal
+        key = (state.pc, state.memory.structural_hash())
+        explored_states = self.explored_states
+        explored = explored_states.get(key)
+        if explored is None:
+            explored = explored_states[key] = []
+        else:
+            explored_states.move_to_end(key)
+        for memory, status, C in explored:
+            if status != state.status():
                 continue
-            if subsumed_memory(s, state):
+            if subsumed_memory(memory, state) and implies_constraints(state, C):
                 return True
 
-        # if s.is_sat(expr_mgr.Not(state.constraints_obj().asFormula(expr_mgr))) is False:
-        #    dbg(f"Subsumed {state.constraints()} by {s.constraints()} at {pc}", color="white")
-        #    return True
-        # self.explored_states[pc].add(state)
-        self.explored_states[pc].append(state)
+        # the state is going to be executed further, keep a snapshot of its
+        # memory (the state keeps the ownership of its objects)
+        explored.append(
+            (state.memory.snapshot(), state.status().copy(), list(state.constraints()))
+        )
+        self._explored_num += 1
+        while self._explored_num > EXPLORED_STATES_SIZE:
+            _, evicted = explored_states.popitem(last=False)
+            self._explored_num -= len(evicted)
         return False
@@ -1,8 +1,18 @@
 from __future__ import annotations
+from typing import Union
 
+from slowbeast.analysis.threadescape import ThreadEscape
 from slowbeast.core.errors import GenericError
 from slowbeast.domains.concrete import concrete_value
-from slowbeast.ir.instruction import Alloc, ThreadJoin, Return, Thread, Call
+from slowbeast.ir.instruction import (
+    Alloc,
+    ThreadJoin,
+    Return,
+    Thread,
+    Call,
+    Load,
+    Store,
+)
 from slowbeast.ir.types import get_offset_type
 from slowbeast.ir.function import Function
 from slowbeast.symexe.iexecutor import IExecutor as BaseIExecutor, unsupported_funs
@@ -26,6 +36,21 @@ def may_be_glob_mem(state, mem: Alloc) -> bool:
     return True
 
 
+def _is_global_event_fun(fn) -> bool:
+    # FIXME: what if another thread is writing to arguments of pthread_create?
+    # return name.startswith("pthread_")  or
+    # name.startswith("__VERIFIER_atomic")
+    name = fn.name()
+    if name.startswith("__VERIFIER_atomic"):
+        return True
+    if fn.is_undefined() and name in (
+        "pthread_mutex_lock",
+        "pthread_mutex_unlock",
+    ):
+        return True
+    return False
+
+
 class IExecutor(BaseIExecutor):
     def __init__(
         self,
@@ -35,6 +60,40 @@ class IExecutor(BaseIExecutor):
         memorymodel: SymbolicMemoryModel | None = None,  # noqa:F821
     ) -> None:
         super().__init__(program, solver, opts, memorymodel)
+        self._coalesce_invisible = opts.threads_coalesce_invisible
+        # memory that only one thread can access
+        self._thread_escape = (
+            ThreadEscape(program) if opts.threads_escape_analysis else None
+        )
+
+    def thread_local_pointers(self) -> frozenset:
+        if self._thread_escape is None:
+            return frozenset()
+        return self._thread_escape.thread_local_pointers()
+
+    def is_global_event(
+        self, state, pc: Union[Call, Load, Store, ThreadJoin]
+    ) -> bool:
+        """Can the instruction interfere with other threads?"""
+        if isinstance(pc, (Load, Store)):
+            ptr = pc.pointer_operand()
+            if self._thread_escape and self._thread_escape.is_thread_local(ptr):
+                return False
+            return may_be_glob_mem(state, ptr)
+        if isinstance(pc, (Thread, ThreadJoin)):
+            return True
+        if isinstance(pc, Call):
+            fn = pc.called_function()
+            if not isinstance(fn, Function):
+                fun = state.try_eval(fn)
+                if fun is None:
+                    return True
+                fn = self._resolve_function_pointer(state, fun)
+                if fn is None:
+                    return True
+                assert isinstance(fn, Function)
+            return _is_global_event_fun(fn)
+        return False
 
     def exec_undef_fun(self, state, instr, fun, tid):
         fnname = fun.name()
@@ -247,6 +306,34 @@ class IExecutor(BaseIExecutor):
             states.append(legacy_output)
         return states
 
+    def execute_thread_step(
+        self, state: TSEState, thread_id: int
+    ) -> tuple[list[TSEState], Instruction]:
+        """Execute the instruction of the thread. If coalescing invisible
+        instructions, continue with the following instructions of the thread
+        until it reaches an instruction that is visible to other threads
+        (a global event or a return), so that scheduling points are only
+        before visible instructions. Return the instruction of the step."""
+        states, instr = self.execute_single_thread(state, thread_id)
+        if not self._coalesce_invisible:
+            return states, instr
+        finished = []
+        pending = states[::-1]
+        while pending:
+            s = pending.pop()
+            if (
+                s.is_ready()
+                and thread_id in s.thread_ids()
+                and not s.thread_ro(thread_id).is_paused()
+                and not isinstance(s.thread_ro(thread_id).pc, Return)
+                and not self.is_global_event(s, s.thread_ro(thread_id).pc)
+            ):
+                newstates, _ = self.execute_single_thread(s, thread_id)
+                pending.extend(reversed(newstates))
+            else:
+                finished.append(s)
+        return finished, instr
+
     def execute_single_thread(
         self, state: TSEState, thread_id: int
     ) -> tuple[list[TSEState], Instruction]:
@@ -1,31 +1,15 @@
 # TODO: Remove. Most functions already copied to the main interpreter: interpreterSDPOR
 
 from typing import List, Optional, Union
-from slowbeast.ir.function import Function
-from slowbeast.ir.instruction import Alloc, Call, Load, Store, ThreadJoin, Thread
+from slowbeast.ir.instruction import Call, Load, Store, ThreadJoin
 from slowbeast.solvers.symcrete import SymbolicSolver
 from slowbeast.symexe.interpreter import SymbolicInterpreter as SymexeInterpreter
 from slowbeast.symexe.memorymodel import SymbolicMemoryModel
 from slowbeast.symexe.options import SEOptions
-from slowbeast.symexe.threads.iexecutor import IExecutor, may_be_glob_mem
+from slowbeast.symexe.threads.iexecutor import IExecutor
 from slowbeast.util.debugging import print_stderr
 
 
-def _is_global_event_fun(fn) -> bool:
-    # FIXME: what if another thread is writing to arguments of pthread_create?
-    # return name.startswith("pthread_")  or
-    # name.startswith("__VERIFIER_atomic")
-    name = fn.name()
-    if name.startswith("__VERIFIER_atomic"):
-        return True
-    if fn.is_undefined() and name in (
-        "pthread_mutex_lock",
-        "pthread_mutex_unlock",
-    ):
-        return True
-    return False
-
-
 class SymbolicInterpreter(SymexeInterpreter):
     def __init__(
         self, P, ohandler=None, opts: SEOptions = SEOptions(), executor=None
@@ -35,24 +19,7 @@ class SymbolicInterpreter(SymexeInterpreter):
         super().__init__(P, ohandler, opts, executor)
 
     def _is_global_event(self, state, pc: Union[Call, Load, Store, ThreadJoin]) -> bool:
-        if isinstance(pc, Load):
-            return may_be_glob_mem(state, pc.operand(0))
-        if isinstance(pc, Store):
-            return may_be_glob_mem(state, pc.operand(1))
-        if isinstance(pc, (Thread, ThreadJoin)):
-            return True
-        if isinstance(pc, Call):
-            fn = pc.called_function()
-            if not isinstance(fn, Function):
-                fun = state.try_eval(fn)
-                if fun is None:
-                    return True
-                fn = self.executor()._resolve_function_pointer(state, fun)
-                if fn is None:
-                    return True
-                assert isinstance(fn, Function)
-            return _is_global_event_fun(fn)
-        return False
+        return self.executor().is_global_event(state, pc)
 
     # def schedule(self, state: TSEState) -> List[Optional[TSEState]]:
     #     l = state.num_threads()
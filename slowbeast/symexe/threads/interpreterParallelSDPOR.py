@@ -0,0 +1,401 @@
+"""
+Source-DPOR explored by a pool of worker processes.
+
+A work item is a schedule prefix and the node at its end: the sequence of
+the executed threads with the indices of the chosen successor states, the
+sleep sets and the scheduled threads of the nodes on the prefix and the
+thread to explore from the last node (or None for any thread).
+A worker replays the prefix from the initial state and explores the subtree.
+In the top levels of the subtree, only the first thread of a backtrack set
+and the first successor state of a step are explored by the worker itself,
+the other threads and successors are sent to the coordinator. So are the
+threads added to the backtrack sets of the nodes of the prefix.
+The coordinator keeps the tree of these shared nodes and turns every thread
+that was not scheduled at a node yet into a new work item.
+The first data race found stops all workers. A failure of a worker
+(an exception or the death of the worker process) fails the whole run,
+as a part of the state space would stay unexplored.
+"""
+
+import multiprocessing
+from queue import Empty
+
+from slowbeast.symexe.options import SEOptions
+from slowbeast.symexe.threads.interpreterSDPOR import (
+    ExplorationFrame,
+    SPORSymbolicInterpreter,
+    VisitedState,
+    get_enabled_threads,
+)
+from slowbeast.symexe.threads.state import TSEState
+from slowbeast.symexe.threads.trace import Action
+from slowbeast.util.debugging import print_stderr
+
+from typing import Set
+
+# A step of a schedule: (thread, index of the successor state)
+Step = tuple[int, int]
+# Sleep set and scheduled threads of a node
+NodeInfo = tuple[frozenset[int], frozenset[int]]
+WorkItem = tuple[tuple[Step, ...], tuple[NodeInfo, ...], int | None]
+
+# the number of levels of the subtree of a work item whose
+# nodes are shared via the coordinator
+SHARED_LEVELS = 8
+
+
+class WorkerError(RuntimeError):
+    """A worker failed, the exploration is incomplete"""
+
+
+class SharedNode:
+    """A node of the tree of shared nodes kept by the coordinator"""
+
+    __slots__ = "sleep", "scheduled", "children"
+
+    def __init__(self) -> None:
+        self.sleep: Set[int] = set()
+        self.scheduled: Set[int] = set()
+        self.children: dict[Step, SharedNode] = {}
+
+    def info(self) -> NodeInfo:
+        return frozenset(self.sleep), frozenset(self.scheduled)
+
+
+# the interpreter of a worker process, set by _init_worker
+_worker: "ParallelSPORSymbolicInterpreter | None" = None
+
+
+def _init_worker(interpreter, queue, stop, waiting) -> None:
+    global _worker
+    _worker = interpreter
+    interpreter._queue = queue
+    interpreter._stop = stop
+    interpreter._waiting = waiting
+
+
+def _explore_item(item: WorkItem) -> None:
+    assert _worker is not None, "Worker not initialized"
+    try:
+        _worker.explore_item(item)
+    except BaseException as e:
+        _worker._queue.put(("error", repr(e)))
+        raise
+
+
+def _check_workers(ctx, workers: Set[int], results: list) -> str | None:
+    """Return the description of a failure of a worker or None.
+    The finished results are removed from results."""
+    alive = {p.pid for p in ctx.active_children()}
+    dead = workers - alive
+    if dead:
+        return f"worker process(es) {sorted(dead)} died"
+    failed, pending = None, []
+    for r in results:
+        if not r.ready():
+            pending.append(r)
+        elif not r.successful():
+            failed = r
+    results[:] = pending
+    if failed is not None:
+        try:
+            failed.get()
+        except BaseException as e:
+            return repr(e)
+    return None
+
+
+class ParallelSPORSymbolicInterpreter(SPORSymbolicInterpreter):
+    def __init__(self, P, ohandler=None, opts: SEOptions = SEOptions()) -> None:
+        super().__init__(P, ohandler, opts)
+        self._jobs = opts.threads_dpor_jobs
+        # communication with the coordinator (in workers)
+        self._queue = None
+        self._stop = None
+        # the number of shipped work items that no worker has started yet
+        self._waiting = None
+        # the explored work item (in workers)
+        self._item_steps: tuple[Step, ...] = ()
+        self._item_nodes: tuple[NodeInfo, ...] = ()
+        # the enabled threads in the states on the prefix of the item
+        self._item_enabled: list[Set[int]] = []
+        self._horizon = 0
+
+    def run(self) -> int:
+        self.prepare()
+        self.log_trace = []
+        self.states.append(self.init_state)
+
+        # workers are forked, so they inherit the program and the initial state
+        ctx = multiprocessing.get_context("fork")
+        queue, stop, waiting = ctx.Queue(), ctx.Event(), ctx.Value("i", 0)
+        root = SharedNode()
+        outstanding = 0
+        # the results of the shipped items that may not have finished yet
+        results = []
+        failure = None
+
+        with ctx.Pool(
+            self._jobs,
+            initializer=_init_worker,
+            initargs=(self, queue, stop, waiting),
+        ) as pool:
+            # the workers never exit on their own, a missing worker was killed
+            workers = {p.pid for p in ctx.active_children()}
+
+            def ship(item: WorkItem) -> None:
+                nonlocal outstanding
+                outstanding += 1
+                with waiting.get_lock():
+                    waiting.value += 1
+                results.append(pool.apply_async(_explore_item, (item,)))
+
+            ship(((), (root.info(),), None))
+            while outstanding > 0:
+                try:
+                    msg = queue.get(timeout=1)
+                except Empty:
+                    failure = _check_workers(ctx, workers, results)
+                    if failure is not None:
+                        break
+                    continue
+                kind = msg[0]
+                if kind == "thread":
+                    item = self._schedule_thread(root, *msg[1:])
+                    if item is not None:
+                        ship(item)
+                elif kind == "successor":
+                    ship(self._schedule_successor(root, *msg[1:]))
+                elif kind == "done":
+                    outstanding -= 1
+                    self._add_counters(msg[1])
+                    failure = _check_workers(ctx, workers, results)
+                    if failure is not None:
+                        break
+                elif kind == "race":
+                    self._add_counters(msg[1])
+                    self.data_race = True
+                    break
+                else:
+                    failure = msg[1]
+                    break
+            # stop the workers if we finished early, the pool is terminated
+            # when leaving the with block
+            stop.set()
+
+        if failure is not None:
+            print_stderr(f"DPOR worker failed: {failure}", color="RED")
+            raise WorkerError(f"DPOR worker failed: {failure}")
+        return 0
+
+    def _record(
+        self, root: SharedNode, steps: tuple[Step, ...], nodes: tuple[NodeInfo, ...]
+    ) -> list[SharedNode]:
+        """Record the nodes of a path in the tree and return them"""
+        assert len(nodes) == len(steps) + 1
+        path = [root]
+        for step in steps:
+            path.append(path[-1].children.setdefault(step, SharedNode()))
+        for node, (sleep, scheduled) in zip(path, nodes):
+            node.sleep.update(sleep)
+            node.scheduled.update(scheduled)
+        for node, step in zip(path, steps):
+            node.scheduled.add(step[0])
+        return path
+
+    def _schedule_thread(
+        self,
+        root: SharedNode,
+        steps: tuple[Step, ...],
+        nodes: tuple[NodeInfo, ...],
+        thread: int,
+    ) -> WorkItem | None:
+        """Create a work item for thread at the end of the path,
+        unless the thread was scheduled (or is asleep) there already"""
+        path = self._record(root, steps, nodes)
+        node = path[-1]
+        if thread in node.sleep or thread in node.scheduled:
+            return None
+        item = (steps, tuple(n.info() for n in path), thread)
+        node.scheduled.add(thread)
+        return item
+
+    def _schedule_successor(
+        self,
+        root: SharedNode,
+        steps: tuple[Step, ...],
+        nodes: tuple[NodeInfo, ...],
+    ) -> WorkItem:
+        """Create a work item for the (not yet explored) end of the path"""
+        path = self._record(root, steps, nodes)
+        return steps, tuple(n.info() for n in path), None
+
+    def _counters(self) -> tuple[int, ...]:
+        executor, stats = self._executor, self.stats
+        cache = executor.solver.query_cache()
+        return (
+            stats.paths,
+            stats.exited_paths,
+            stats.killed_paths,
+            stats.terminated_paths,
+            stats.errors,
+            executor._executed_instrs,
+            executor._executed_blks,
+            executor.stats.branchings,
+            executor.stats.branch_forks,
+            executor.stats.fork_calls,
+            executor.stats.forks,
+            cache.hits if cache is not None else 0,
+            cache.subsumed if cache is not None else 0,
+            cache.model_hits if cache is not None else 0,
+            cache.misses if cache is not None else 0,
+        )
+
+    def _add_counters(self, delta: tuple[int, ...]) -> None:
+        executor, stats = self._executor, self.stats
+        (
+            paths,
+            exited_paths,
+            killed_paths,
+            terminated_paths,
+            errors,
+            instrs,
+            blks,
+            branchings,
+            branch_forks,
+            fork_calls,
+            forks,
+            cache_hits,
+            cache_subsumed,
+            cache_model_hits,
+            cache_misses,
+        ) = delta
+        stats.paths += paths
+        stats.exited_paths += exited_paths
+        stats.killed_paths += killed_paths
+        stats.terminated_paths += terminated_paths
+        stats.errors += errors
+        executor._executed_instrs += instrs
+        executor._executed_blks += blks
+        executor.stats.branchings += branchings
+        executor.stats.branch_forks += branch_forks
+        executor.stats.fork_calls += fork_calls
+        executor.stats.forks += forks
+        cache = executor.solver.query_cache()
+        if cache is not None:
+            cache.hits += cache_hits
+            cache.subsumed += cache_subsumed
+            cache.model_hits += cache_model_hits
+            cache.misses += cache_misses
+
+    ###
+    # Worker side
+    ###
+    def explore_item(self, item: WorkItem) -> None:
+        steps, nodes, thread = item
+        with self._waiting.get_lock():  # type: ignore
+            self._waiting.value -= 1  # type: ignore
+        self.data_race = False
+        self.log_trace = []
+        self._item_steps, self._item_nodes = steps, nodes
+        self._horizon = len(steps) + SHARED_LEVELS
+
+        # replay the prefix, the states on it were handled already
+        state = self.init_state.copy()
+        self._item_enabled = []
+        # the states on the prefix are on the explored path
+        prefix_visited = []
+        for (tid, isucc), (sleep, scheduled) in zip(steps, nodes):
+            self._item_enabled.append(get_enabled_threads(state))
+            if self._visited is not None:
+                fingerprint = state.fingerprint()
+                entry = VisitedState(sleep, len(state.trace))
+                self._visited[fingerprint] = entry
+                prefix_visited.append((fingerprint, entry))
+            state.trace.set_backtrack(set(scheduled))
+            newstates, _ = state.exec_thread_and_update_trace(tid)
+            state = newstates[isucc]
+
+        start = self._counters()
+        sleep, scheduled = nodes[-1]
+        if thread is None:
+            self.explore(state, set(sleep))
+        else:
+            self.explore(state, set(sleep | scheduled) - {thread}, thread)
+        for fingerprint, entry in prefix_visited:
+            self.forget_visited(fingerprint, entry)
+        # the workers are not shut down gracefully, write the results now
+        disk_cache = self._executor.solver.disk_cache()
+        if disk_cache is not None:
+            disk_cache.flush()
+        delta = tuple(n - o for n, o in zip(self._counters(), start))
+        if self.data_race:
+            self._stop.set()  # type: ignore
+            self._queue.put(("race", delta))  # type: ignore
+        else:
+            self._queue.put(("done", delta))  # type: ignore
+
+    def _path(self, depth: int) -> tuple[tuple[Step, ...], tuple[NodeInfo, ...]]:
+        """The steps to the node at the depth and the nodes on the way"""
+        base = len(self._item_steps)
+        if depth < base:
+            return self._item_steps[:depth], self._item_nodes[: depth + 1]
+        # the frames of the nodes from the root of the item to the depth
+        frames = self._frames[: depth - base + 1]
+        assert len(frames) == depth - base + 1, "Path below the stack"
+        steps = self._item_steps + tuple(
+            (f.ithread, f.isucc) for f in frames[:-1]  # type: ignore
+        )
+        return steps, self._item_nodes[:base] + tuple(map(_frame_info, frames))
+
+    def add_to_prefix_backtrack(
+        self, state: TSEState, action: Action, thread: int
+    ) -> None:
+        super().add_to_prefix_backtrack(state, action, thread)
+        if action.pos < self._horizon:
+            self._queue.put(("thread", *self._path(action.pos), thread))  # type: ignore
+
+    def enabled_threads_at(self, node: Action) -> Set[int]:
+        if node.pos + 1 < self._base:
+            return set(self._item_enabled[node.pos + 1])
+        return super().enabled_threads_at(node)
+
+    def _depth(self, frame: ExplorationFrame) -> int:
+        """The depth of the top frame (its trace may already be extended)"""
+        assert self._frames[-1] is frame, "Not the top frame"
+        return len(self._item_steps) + len(self._frames) - 1
+
+    def delegate_threads(self, frame: ExplorationFrame, threads: Set[int]) -> bool:
+        depth = self._depth(frame)
+        if depth >= self._horizon:
+            return False
+        steps, nodes = self._path(depth)
+        for thread in threads:
+            self._queue.put(("thread", steps, nodes, thread))  # type: ignore
+        return True
+
+    def delegate_successor(
+        self, frame: ExplorationFrame, state: TSEState, sleep: Set[int]
+    ) -> bool:
+        depth = self._depth(frame)
+        if (
+            depth >= self._horizon
+            or frame.isucc == 0
+            # successors are shared only when no work item is waiting
+            or self._waiting.value > 0  # type: ignore
+            or not get_enabled_threads(state)
+        ):
+            return False
+        steps, nodes = self._path(depth)
+        steps += ((frame.ithread, frame.isucc),)  # type: ignore
+        nodes += ((frozenset(sleep), frozenset()),)
+        self._queue.put(("successor", steps, nodes))  # type: ignore
+        return True
+
+    def interrupted(self) -> bool:
+        return self._stop is not None and self._stop.is_set()
+
+
+def _frame_info(frame: ExplorationFrame) -> NodeInfo:
+    scheduled = () if frame.ithread is None else (frame.ithread,)
+    return frozenset(frame.sleep), frozenset(scheduled)
@@ -1,26 +1,99 @@
 # from copy import deepcopy
-from sys import setrecursionlimit
 
 from slowbeast.symexe.options import SEOptions
 from slowbeast.symexe.threads.interpreter import SymbolicInterpreter
 from slowbeast.symexe.threads.state import TSEState
-from slowbeast.interpreter.interpreter import GlobalInit
+from slowbeast.symexe.threads.trace import Action
+from slowbeast.interpreter.interpreter import GlobalInit, constant_init
 
 from slowbeast.core.errors import MemError
 
 from typing import (
+    Iterator,
     Set,
 )
 
 # from slowbeast.ir.instruction import Branch
 
 
+class ExplorationFrame:
+    """
+    One level of the SDPOR search: the explored state with its sleep set,
+    the thread whose step is being explored, the index of the explored
+    successor state of that step and the successors that still wait for
+    exploration. The backtrack set of the level lives in the (shared) trace.
+    With stateful exploration, the frame also collects the heads of the trace
+    of its state that the explored subtree raced with, see VisitedState.
+    """
+
+    __slots__ = (
+        "state",
+        "sleep",
+        "ithread",
+        "isucc",
+        "successors",
+        "depth",
+        "partial",
+        "fingerprint",
+        "visited",
+        "races",
+    )
+
+    def __init__(self, state: TSEState, sleep: Set[int]) -> None:
+        self.state = state
+        self.sleep = sleep
+        self.ithread: int | None = None
+        self.isucc = -1
+        self.successors: Iterator[TSEState] | None = None
+        # the length of the trace of the state
+        self.depth = len(state.trace)
+        # was a part of the subtree left to someone else?
+        self.partial = False
+        self.fingerprint: tuple | None = None
+        self.visited: VisitedState | None = None
+        # (pos, kind, obj, tid) of the actions of the trace of the state
+        # that were in race with an action of the explored subtree
+        self.races: set[tuple[int, int, object, int]] | None = None
+
+
+class VisitedState:
+    """
+    An entry of the cache of visited states of stateful DPOR: the sleep set
+    with which the state was entered, the length of its trace and, once the
+    state is explored, the heads of the trace of the state (as kind, object
+    and thread) that were in race with an action of the explored subtree.
+    A state that is not explored yet is on the explored path.
+
+    A state with the same fingerprint and a bigger sleep set has the same
+    subtree, so it is not explored again. The same heads of its trace would
+    race with the same actions, so the threads that the exploration would
+    add to the backtrack sets of its prefix are added right away (all the
+    enabled ones, since the racing actions are not remembered).
+    """
+
+    __slots__ = "sleep", "depth", "explored", "races"
+
+    def __init__(self, sleep: Set[int], depth: int) -> None:
+        self.sleep = frozenset(sleep)
+        self.depth = depth
+        self.explored = False
+        self.races: frozenset[tuple[int, object, int]] = frozenset()
+
+
 class SPORSymbolicInterpreter(SymbolicInterpreter):
 
     def __init__(self, P, ohandler=None, opts: SEOptions = SEOptions()) -> None:
         # print("Initiating the SPOR executor")
         super().__init__(P, ohandler, opts)
         self.data_race = False
+        # the stack of the running exploration and the length of the trace
+        # of the state at its bottom
+        self._frames: list[ExplorationFrame] = []
+        self._base = 0
+        # fingerprints of the visited states, for stateful exploration
+        self._visited: dict[tuple, VisitedState] | None = (
+            {} if opts.threads_dpor_stateful else None
+        )
 
     def initial_states(self) -> TSEState:
         mem = self._executor.get_memory_model().create_memory()
@@ -53,10 +126,14 @@ class SPORSymbolicInterpreter(SymbolicInterpreter):
 
         globs = self._program.globals()
         for G in globs:
-            self.init_state.memory.allocate_global(G, zeroed=G.is_zeroed())
+            ptr = self.init_state.memory.allocate_global(G, zeroed=G.is_zeroed())
 
             if not G.has_init():
                 continue
+            value = constant_init(G)
+            if value is not None:
+                self.init_state.memory.defer_init(ptr, value)
+                continue
             for i in G.init():
                 ret = self._executor.exec_legacy(self.init_state, i)
                 assert len(ret) == 1, "Unhandled initialization"
@@ -73,18 +150,65 @@ class SPORSymbolicInterpreter(SymbolicInterpreter):
         self.states.append(
             self.init_state
         )  # To populate self.states to halt exploration
-        setrecursionlimit(10**4)
-        try:
-            self.explore(self.init_state, set())
-        except RecursionError:
-            print(
-                "Exploration too deep. Consider making it iterative or increasing recursion depth."
-            )
+        self.explore(self.init_state, set())
         # print(self.log_trace)
 
-    def explore(self, state: TSEState, sleep: Set[int]) -> None:
-        """Source - DPOR"""
+    def explore(
+        self, state: TSEState, sleep: Set[int], thread: int | None = None
+    ) -> None:
+        """Source - DPOR.
+        Iterative formulation: every level of the search is an ExplorationFrame
+        on an explicit stack, so the depth of exploration is bounded by memory
+        and not by the recursion limit of the interpreter.
+        If thread is given, it is the first thread explored from the state."""
 
+        stack: list[ExplorationFrame] = []
+        self._frames = stack
+        self._base = len(state.trace)
+        self._enter(stack, state, sleep, thread)
+        while stack:
+            if self.data_race:
+                # Do not trim anything, the trace is the witness.
+                self.log_trace.append("🚩")
+                break
+            if self.interrupted():
+                break
+
+            frame = stack[-1]
+            if frame.successors is not None:
+                s = next(frame.successors, None)
+                if s is not None:
+                    frame.isucc += 1
+                    self.handle_new_state(s)
+                    newsleep = self._successor_sleep(frame, s)
+                    if self.delegate_successor(frame, s, newsleep):
+                        frame.partial = True
+                    else:
+                        self._enter(stack, s, newsleep)
+                    continue
+
+                # all successors of the step of frame.ithread are explored
+                frame.state.trace.trim()
+                self.log_trace.append(("☝️", frame.ithread))
+                frame.sleep.add(frame.ithread)
+                frame.successors = None
+
+            if not self._step(frame):
+                self._leave(stack)
+
+        # the states left on the stack (if we stopped early) are not explored
+        for frame in stack:
+            self.forget_visited(frame.fingerprint, frame.visited)
+
+    def _enter(
+        self,
+        stack: list["ExplorationFrame"],
+        state: TSEState,
+        sleep: Set[int],
+        thread: int | None = None,
+    ) -> None:
+        """Start exploring the state: push a frame for it if it has
+        any thread that can be scheduled."""
         if self.data_race:
             self.log_trace.append("🚩")
             return
@@ -96,85 +220,206 @@ class SPORSymbolicInterpreter(SymbolicInterpreter):
             self.log_trace.append((enabled_set.copy(), "💤🫷", sleep))
 
         if usable_threads:
-            state.trace.set_backtrack({usable_threads.pop()})
-            while state.trace.get_backtrack().difference(sleep):
-                ithread = state.trace.get_backtrack().difference(sleep).pop()
-                newstates, ithread_in_action = state.exec_thread_and_update_trace(
-                    ithread
+            fingerprint = None
+            if self._visited is not None:
+                fingerprint = state.fingerprint()
+                entry = self._visited.get(fingerprint)
+                if entry is not None and entry.sleep <= sleep:
+                    self._revisit(stack, state, entry)
+                    return
+            if thread is None:
+                thread = usable_threads.pop()
+            else:
+                assert thread in usable_threads, "Thread cannot be scheduled"
+            state.trace.set_backtrack({thread})
+            frame = ExplorationFrame(state, sleep)
+            if fingerprint is not None:
+                frame.fingerprint = fingerprint
+                frame.visited = VisitedState(sleep, frame.depth)
+                frame.races = set()
+                self._visited[fingerprint] = frame.visited  # type: ignore
+            stack.append(frame)
+
+    def _leave(self, stack: list["ExplorationFrame"]) -> None:
+        """Pop the explored top frame, pass what it found to its parent
+        and remember its state as visited"""
+        frame = stack.pop()
+        entry = frame.visited
+        if entry is None:
+            return
+        if stack:
+            parent = stack[-1]
+            parent.partial = parent.partial or frame.partial
+            parent.races.update(  # type: ignore
+                r for r in frame.races if r[0] < parent.depth  # type: ignore
+            )
+        visited = self._visited
+        current = visited.get(frame.fingerprint)  # type: ignore
+        if frame.partial:
+            # the subtree is not explored here, the races are not known
+            self.forget_visited(frame.fingerprint, entry)
+            return
+        entry.explored = True
+        entry.races = frozenset(r[1:] for r in frame.races)  # type: ignore
+        # keep an explored state with a smaller sleep set
+        if (
+            current is None
+            or not current.explored
+            or not current.sleep <= entry.sleep
+        ):
+            visited[frame.fingerprint] = entry  # type: ignore
+
+    def _revisit(
+        self, stack: list["ExplorationFrame"], state: TSEState, entry: VisitedState
+    ) -> None:
+        """The state has the same fingerprint as the visited state of entry
+        and a bigger sleep set, so instead of exploring it, update the
+        backtrack sets of its prefix"""
+        if entry.explored:
+            races = entry.races
+        else:
+            # The visited state is on the explored path, we closed a cycle.
+            # Fully expand the state on the path, so that the threads that
+            # do not take part in the cycle are not postponed forever, and
+            # since its subtree is not explored yet, assume races with all
+            # the locks.
+            action = state.trace.last()
+            while action.pos > entry.depth:
+                action = action.prev  # type: ignore
+            for t in self.enabled_threads_at(action.prev):  # type: ignore
+                self.add_to_prefix_backtrack(state, action, t)
+            races = frozenset(
+                (h.kind, h.obj, h.tid) for h in state.trace.heads_of_kind(Action.LOCK)
+            )
+        self.log_trace.append(("♻️", len(races), entry.sleep))
+
+        parent = stack[-1] if stack else None
+        for kind, obj, tid in races:
+            head = state.trace.head(kind, obj, tid)
+            assert head is not None, "Visited state with a different trace"
+            for t in self.enabled_threads_at(head.prev):  # type: ignore
+                self.add_to_prefix_backtrack(state, head, t)
+            if parent is not None and head.pos < parent.depth:
+                parent.races.add((head.pos, kind, obj, tid))  # type: ignore
+
+    def forget_visited(
+        self, fingerprint: tuple | None, entry: VisitedState | None
+    ) -> None:
+        """Remove the entry of a state that was not explored"""
+        if entry is not None and self._visited.get(fingerprint) is entry:  # type: ignore
+            del self._visited[fingerprint]  # type: ignore
+
+    def enabled_threads_at(self, node: Action) -> Set[int]:
+        """Threads enabled in the state of the explored path
+        whose trace ends with the node"""
+        i = node.pos + 1 - self._base
+        assert i >= 0, "Node below the explored stack"
+        frame = self._frames[i]
+        assert frame.depth == node.pos + 1, "Node not on the stack"
+        return get_enabled_threads(frame.state)
+
+    def _step(self, frame: "ExplorationFrame") -> bool:
+        """Execute the next thread from the backtrack set of the frame
+        and update the backtrack sets of the racing prefixes.
+        Return False if there is nothing more to explore from the frame."""
+        state, sleep = frame.state, frame.sleep
+        candidates = state.trace.get_backtrack().difference(sleep)
+        if not candidates:
+            return False
+        if frame.ithread is not None and self.delegate_threads(frame, candidates):
+            frame.partial = True
+            return False
+
+        ithread = candidates.pop()
+        newstates, ithread_in_action = state.exec_thread_and_update_trace(ithread)
+        # ithread_in_action = state.thread_to_action(ithread)
+        assert (
+            ithread_in_action is not None
+        ), "Backtracked instruction not in sleep and not enabled"
+        if state.trace.data_race:
+            self.log_trace.append("⛔")
+            state.set_data_race()
+            self.handle_new_state(state)
+            self.data_race = True
+            return False
+        self.log_trace.append(
+            (
+                (ithread_in_action.tid, ithread_in_action.occurrence),
+                state.trace.get_backtrack(ithread_in_action),
+                sleep.copy(),
+                ithread_in_action.instr,
+                [(x.tid, x.occurrence) for x in ithread_in_action.caused_by],
+            )
+        )
+
+        for racist_action in state.trace.get_racist_set():
+            indep_suffix_set = state.trace.independent_suffix_set(racist_action)
+            racist_prefix_backtrack = state.trace.get_backtrack(racist_action)
+            missing_thread_in_backtrack = None
+            if not indep_suffix_set.intersection(racist_prefix_backtrack):
+                missing_thread_in_backtrack = indep_suffix_set.pop()
+                self.add_to_prefix_backtrack(
+                    state, racist_action, missing_thread_in_backtrack
                 )
-                # ithread_in_action = state.thread_to_action(ithread)
-                assert (
-                    ithread_in_action is not None
-                ), "Backtracked instruction not in sleep and not enabled"
-                # state.trace.append_in_place(
-                #     ithread_in_action
-                # )  # This should handle updating causality and race.
-                if state.trace.data_race:
-                    self.log_trace.append("⛔")
-                    state.set_data_race()
-                    self.handle_new_state(state)
-                    self.data_race = True
-                    break
-                self.log_trace.append(
+        if frame.races is not None:
+            frame.races.update(
+                (r.pos, r.kind, r.obj, r.tid) for r in state.trace.get_racist_set()
+            )
+        if state.trace.get_racist_set():
+            self.log_trace.append(
+                (
+                    "🏁⤴️",
+                    [(x.tid, x.occurrence) for x in state.trace.get_racist_set()],
                     (
-                        (ithread_in_action.tid, ithread_in_action.occurrence),
-                        state.trace._backtrack[-2],
-                        sleep.copy(),
-                        ithread_in_action.instr,
-                        [(x.tid, x.occurrence) for x in ithread_in_action.caused_by],
-                    )
+                        missing_thread_in_backtrack
+                        if missing_thread_in_backtrack
+                        else "💩"
+                    ),
                 )
+            )
 
-                for racist_action in state.trace.get_racist_set():
-                    indep_suffix_set = state.trace.independent_suffix_set(racist_action)
-                    racist_prefix_backtrack = state.trace.get_backtrack(racist_action)
-                    missing_thread_in_backtrack = None
-                    if not indep_suffix_set.intersection(racist_prefix_backtrack):
-                        missing_thread_in_backtrack = indep_suffix_set.pop()
-                        state.trace.add_to_prefix_backtrack(
-                            racist_action, missing_thread_in_backtrack
-                        )
-                if state.trace.get_racist_set():
-                    self.log_trace.append(
-                        (
-                            "🏁⤴️",
-                            [
-                                (x.tid, x.occurrence)
-                                for x in state.trace.get_racist_set()
-                            ],
-                            (
-                                missing_thread_in_backtrack
-                                if missing_thread_in_backtrack
-                                else "💩"
-                            ),
-                        )
-                    )
-                # newstates = state.exec_trace_preset()
-                # state.trace.trim()
-                for s in newstates:
-                    # s.check_data_race()
-                    self.handle_new_state(s)
-                    newsleep = set()
-                    if s.is_killed() or s.is_terminated():
-                        newsleep.update(s._threads.keys())
-                        self.log_trace.append("SSBeing 🚩🚩🚩")
-                    else:
-                        for q in sleep:
-                            if not self.dependent_threads(s, ithread, q):
-                                newsleep.add(q)
-                    if newsleep:
-                        self.log_trace.append(str(newsleep.copy()) + " added to 💤")
+        frame.ithread = ithread
+        frame.isucc = -1
+        frame.successors = iter(newstates)
+        return True
 
-                    self.explore(s, newsleep)
+    def add_to_prefix_backtrack(
+        self, state: TSEState, action: Action, thread: int
+    ) -> None:
+        """Schedule thread at the prefix of the trace of state before action"""
+        state.trace.add_to_prefix_backtrack(action, thread)
 
-                if self.data_race:
-                    return
+    def delegate_threads(self, frame: "ExplorationFrame", threads: Set[int]) -> bool:
+        """Called with the threads that are still to be explored from the frame
+        after its first thread. Return True if the exploration of the threads
+        was taken over by someone else (the frame is then finished)."""
+        return False
 
-                state.trace.trim()
+    def delegate_successor(
+        self, frame: "ExplorationFrame", state: TSEState, sleep: Set[int]
+    ) -> bool:
+        """Called with a successor state of the step of the frame and its sleep
+        set. Return True if its exploration was taken over by someone else."""
+        return False
 
-                self.log_trace.append(("☝️", ithread))
+    def interrupted(self) -> bool:
+        """Should the exploration stop (e.g., some other explorer found
+        a data race)?"""
+        return False
 
-                sleep.add(ithread)
+    def _successor_sleep(self, frame: "ExplorationFrame", s: TSEState) -> Set[int]:
+        """Sleep set of a successor state s of the step of frame.ithread"""
+        newsleep = set()
+        if s.is_killed() or s.is_terminated():
+            newsleep.update(s._threads.keys())
+            self.log_trace.append("SSBeing 🚩🚩🚩")
+        else:
+            for q in frame.sleep:
+                if not self.dependent_threads(s, frame.ithread, q):
+                    newsleep.add(q)
+        if newsleep:
+            self.log_trace.append(str(newsleep.copy()) + " added to 💤")
+        return newsleep
 
     def dependent_threads(self, pstate: TSEState, p: int, q: int) -> bool:
         """pstate = state with p executed TODO: move to TSEState"""
@@ -208,7 +453,8 @@ def get_enabled_threads(state: TSEState) -> set[int]:
     if state.is_ready():
         enabled = set()
         for id in state.thread_ids():
-            if not (state.thread(id).is_paused() or state.thread(id).is_detached()):
+            thr = state.thread_ro(id)
+            if not (thr.is_paused() or thr.is_detached()):
                 enabled.add(id)
         return enabled
     else:
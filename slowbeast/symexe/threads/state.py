@@ -4,6 +4,8 @@ from typing import TextIO, Self
 
 from slowbeast.core.callstack import CallStack
 from slowbeast.core.errors import MemError
+from slowbeast.core.memory import Memory
+from slowbeast.domains.pointer import Pointer
 
 # from slowbeast.core.errors import GenericError
 from slowbeast.ir.instruction import ThreadJoin, Store, Load
@@ -18,11 +20,17 @@ class TSEState(BaseState):
 
     __slots__ = (
         "_threads",
+        "_threads_ro",
+        "_owned_threads",
         "_current_thread",
         "_exited_threads",
+        "_exited_threads_ro",
         "_wait_join",
+        "_wait_join_ro",
         "_wait_mutex",
+        "_wait_mutex_ro",
         "_mutexes",
+        "_mutexes_ro",
         "_last_tid",
         "conflicts",
         "immediate_conflicts",
@@ -45,11 +53,23 @@ class TSEState(BaseState):
             self._threads = {0: Thread(0, pc, self.memory.get_cs())}
         else:
             None
+        # the table of threads and the synchronization maps are shared
+        # between copies of the state until one of them modifies them.
+        # Thread records are shared too, _owned_threads are the ids
+        # of the threads whose records are not shared with another state.
+        self._threads_ro = False
+        self._owned_threads = set()
         self._wait_join = {}
+        self._wait_join_ro = False
         self._exited_threads = {}
+        self._exited_threads_ro = False
         self._mutexes = {}
+        self._mutexes_ro = False
         self._wait_mutex = {}
-        self.trace: Trace = Trace()
+        self._wait_mutex_ro = False
+        self.trace: Trace = Trace(
+            local=executor.thread_local_pointers() if executor else frozenset()
+        )
 
     def _thread_idx(self, thr: Thread) -> int:
         """Return ID of a given thread. Thread's own ID
@@ -62,18 +82,60 @@ class TSEState(BaseState):
 
     def _copy_to(self, new: Self) -> None:
         super()._copy_to(new)
-        new._threads = {id: thr.copy() for id, thr in self._threads.items()}
-        new._wait_join = self._wait_join.copy()
-        new._exited_threads = self._exited_threads.copy()
+        new._threads = self._threads
+        new._threads_ro = self._threads_ro = True
+        new._owned_threads = set()
+        self._owned_threads = set()
+        new._wait_join = self._wait_join
+        new._wait_join_ro = self._wait_join_ro = True
+        new._exited_threads = self._exited_threads
+        new._exited_threads_ro = self._exited_threads_ro = True
         new._last_tid = self._last_tid
         new._current_thread = self._current_thread
-        new._mutexes = self._mutexes.copy()
-        new._wait_mutex = {mtx: W.copy() for mtx, W in self._wait_mutex.items() if W}
-        new.trace = self.trace
+        new._mutexes = self._mutexes
+        new._mutexes_ro = self._mutexes_ro = True
+        new._wait_mutex = self._wait_mutex
+        new._wait_mutex_ro = self._wait_mutex_ro = True
+        new.trace = self.trace.copy()
+
+    def _threads_reown(self) -> None:
+        if self._threads_ro:
+            self._threads = self._threads.copy()
+            self._threads_ro = False
+
+    def _thread_rw(self, idx: int) -> Thread:
+        """Get the record of the thread for modification"""
+        if idx in self._owned_threads:
+            return self._threads[idx]
+        self._threads_reown()
+        thr = self._threads[idx].copy()
+        self._threads[idx] = thr
+        self._owned_threads.add(idx)
+        return thr
+
+    def _wait_join_reown(self) -> None:
+        if self._wait_join_ro:
+            self._wait_join = self._wait_join.copy()
+            self._wait_join_ro = False
+
+    def _exited_threads_reown(self) -> None:
+        if self._exited_threads_ro:
+            self._exited_threads = self._exited_threads.copy()
+            self._exited_threads_ro = False
+
+    def _mutexes_reown(self) -> None:
+        if self._mutexes_ro:
+            self._mutexes = self._mutexes.copy()
+            self._mutexes_ro = False
+
+    def _wait_mutex_reown(self) -> None:
+        if self._wait_mutex_ro:
+            self._wait_mutex = self._wait_mutex.copy()
+            self._wait_mutex_ro = False
 
     def sync_pc(self) -> None:
         if self._threads:
-            self._threads[self._current_thread].pc = self.pc
+            self._thread_rw(self._current_thread).pc = self.pc
 
     def sync_cs(self) -> None:
         """Synchronise callstack"""
@@ -107,13 +169,21 @@ class TSEState(BaseState):
         cs.push_call(None, thread_fn, args)
         t = Thread(self._last_tid, pc, cs)
         assert not t.is_paused()
+        self._threads_reown()
         self._threads[self._last_tid] = t
+        self._owned_threads.add(self._last_tid)
         return t
 
     def current_thread(self) -> int:
         return self._current_thread
 
     def thread(self, idx=None) -> Thread:
+        """Get the thread for reading and modification"""
+        return self._thread_rw(self._current_thread if idx is None else idx)
+
+    def thread_ro(self, idx=None) -> Thread:
+        """Get the thread only for reading, the record may be shared
+        with other states"""
         return self._threads[self._current_thread if idx is None else idx]
 
     def thread_ids(self):
@@ -123,28 +193,28 @@ class TSEState(BaseState):
         return self._threads[self._current_thread if idx is None else idx].get_id()
 
     def pause_thread(self, idx=None) -> None:
-        self._threads[self._current_thread if idx is None else idx].pause()
+        self.thread(idx).pause()
 
     def unpause_thread(self, idx=None) -> None:
-        self._threads[self._current_thread if idx is None else idx].unpause()
+        self.thread(idx).unpause()
 
     def start_atomic(self, idx=None) -> None:
-        assert not self._threads[
-            self._current_thread if idx is None else idx
-        ].in_atomic()
-        self._threads[self._current_thread if idx is None else idx].set_atomic(True)
+        assert not self.thread_ro(idx).in_atomic()
+        self.thread(idx).set_atomic(True)
 
     def end_atomic(self, idx=None) -> None:
-        assert self._threads[self._current_thread if idx is None else idx].in_atomic()
-        self._threads[self._current_thread if idx is None else idx].set_atomic(False)
+        assert self.thread_ro(idx).in_atomic()
+        self.thread(idx).set_atomic(False)
 
     def mutex_locked_by(self, mtx):
         return self._mutexes.get(mtx)
 
     def mutex_init(self, mtx) -> None:
+        self._mutexes_reown()
         self._mutexes[mtx] = None
 
     def mutex_destroy(self, mtx) -> None:
+        self._mutexes_reown()
         self._mutexes.pop(mtx)
 
     def has_mutex(self, mtx):
@@ -154,6 +224,7 @@ class TSEState(BaseState):
         # tid = self.thread(self._current_thread if idx is None else idx).get_id()
         tid = self._current_thread if idx is None else idx
         assert self.mutex_locked_by(mtx) is None, "Locking locked mutex"
+        self._mutexes_reown()
         self._mutexes[mtx] = tid
 
     def mutex_unlock(self, mtx, idx=None) -> None:
@@ -163,34 +234,40 @@ class TSEState(BaseState):
             else idx
             # == self.thread(self._current_thread if idx is None else idx).get_id()
         ), "Unlocking wrong mutex"
+        self._mutexes_reown()
         self._mutexes[mtx] = None
         # tidx = self._thread_idx
         # unpause = self.unpause_thread
         W = self._wait_mutex.get(mtx)
-        if W is not None:
+        if W:
             for tid in W:
                 # unpause(tidx(tid))
                 self.unpause_thread(tid)
-            self._wait_mutex[mtx] = set()
+            self._wait_mutex_reown()
+            del self._wait_mutex[mtx]
 
     def mutex_wait(self, mtx, idx=None) -> None:
         "Thread idx waits for mutex mtx"
         tid = self._current_thread if idx is None else idx
         assert self.mutex_locked_by(mtx) is not None, "Waiting for unlocked mutex"
         self.pause_thread(idx)
-        self._wait_mutex.setdefault(mtx, set()).add(tid)
+        # the sets are shared by copies of the state, do not modify them
+        self._wait_mutex_reown()
+        self._wait_mutex[mtx] = self._wait_mutex.get(mtx, frozenset()) | {tid}
 
     def exit_thread(self, retval, tid=None) -> None:
         """Exit thread and wait for join (if not detached)"""
         tid = self._current_thread if tid is None else tid
         assert tid not in self._exited_threads
+        self._exited_threads_reown()
         self._exited_threads[tid] = retval
         self.remove_thread(tid)
 
         if tid in self._wait_join:
+            self._wait_join_reown()
             waiting_thread_ids = self._wait_join.pop(tid)
             for waitidx in waiting_thread_ids:
-                assert self.thread(waitidx).is_paused(), self._wait_join
+                assert self.thread_ro(waitidx).is_paused(), self._wait_join
                 self.unpause_thread(waitidx)
                 t = self.thread(waitidx)
                 # pass the return value
@@ -205,6 +282,7 @@ class TSEState(BaseState):
         """
         if tid in self._exited_threads:
             # pass the return value
+            self._exited_threads_reown()
             retval = self._exited_threads.pop(tid)
             self.thread(totid).get_cs().set(self.thread(totid).pc, retval)
             self.thread(totid).pc = self.thread(totid).pc.get_next_inst()
@@ -213,16 +291,20 @@ class TSEState(BaseState):
         toidx = (
             self._current_thread
             if totid is None
-            else self._thread_idx(self.thread(totid))
+            else self._thread_idx(self.thread_ro(totid))
         )
-        if tid not in self._wait_join:
-            self._wait_join[tid] = []
-        if toidx not in self._wait_join[tid]:
-            self._wait_join[tid].append(toidx)
+        waiting = self._wait_join.get(tid, ())
+        if toidx not in waiting:
+            # the lists are shared by copies of the state, do not modify them
+            self._wait_join_reown()
+            self._wait_join[tid] = [*waiting, toidx]
         self.pause_thread(toidx)
 
     def remove_thread(self, idx=None) -> None:
-        self._threads.pop(self._current_thread if idx is None else idx)
+        idx = self._current_thread if idx is None else idx
+        self._threads_reown()
+        self._threads.pop(idx)
+        self._owned_threads.discard(idx)
         # if self._threads:
         #     self.pc = self._threads[0].pc
         #     self.memory.set_cs(self._threads[0].get_cs())
@@ -249,11 +331,38 @@ class TSEState(BaseState):
         write(f" -- Mutexes (locked by): {self._mutexes}\n")
         write(f" -- Threads waiting for mutexes: {self._wait_mutex}\n")
         write(" -- Events --\n")
-        for it in self.trace._sequence:
+        for it in self.trace:
             write(str(it) + "\n")
 
+    def fingerprint(self) -> tuple:
+        """A hashable description of everything the further exploration of
+        the state depends on: the threads with their pcs and callstacks,
+        the memory, the synchronization, the path condition and the frontier
+        of the trace. States with equal fingerprints have the same futures."""
+        return (
+            tuple(
+                (tid, _thread_fingerprint(t)) for tid, t in sorted(self._threads.items())
+            ),
+            # the call stacks are in the threads
+            _Snapshot(
+                self.memory.snapshot(), Memory.objects_hash, Memory.objects_equal
+            ),
+            frozenset((_value_key(mtx), tid) for mtx, tid in self._mutexes.items()),
+            frozenset(
+                (_value_key(mtx), frozenset(W)) for mtx, W in self._wait_mutex.items() if W
+            ),
+            frozenset((tid, tuple(W)) for tid, W in self._wait_join.items()),
+            frozenset(
+                (tid, _value_key(retval))
+                for tid, retval in self._exited_threads.items()
+            ),
+            self._last_tid,
+            tuple(map(_value_key, self.constraints())),
+            self.trace.frontier(),
+        )
+
     def exec_thread(self, thread: int) -> tuple[list[Self], Instruction]:
-        output_states, instr = self._executor.execute_single_thread(self, thread)
+        output_states, instr = self._executor.execute_thread_step(self, thread)
         return output_states, instr
 
     def thread_to_action(self, tid: int) -> Action | None:
@@ -262,11 +371,11 @@ class TSEState(BaseState):
         TODO: Update occurrence as well."""
         if (
             tid in self.thread_ids()
-            and not self.thread(tid).is_paused()
-            and not self.thread(tid).is_detached()
+            and not self.thread_ro(tid).is_paused()
+            and not self.thread_ro(tid).is_detached()
         ):
-            assert self.thread(tid).pc, "Thread {tid} PC empty"
-            return Action(tid, self.thread(tid).pc)
+            assert self.thread_ro(tid).pc, "Thread {tid} PC empty"
+            return Action(tid, self.thread_ro(tid).pc)
         else:
             return None
 
@@ -274,7 +383,7 @@ class TSEState(BaseState):
         """ASSUMES NON-TERMINAL PART OF THE TRACE BELONGS TO THE STATE ITSELF"""
         output_states = self.exec_thread(trace.terminal_thread())
         for state in output_states:
-            state.trace = trace
+            state.trace = trace.copy()
         return output_states
 
     def exec_trace_preset(self) -> list[Self]:
@@ -315,14 +424,71 @@ class TSEState(BaseState):
 
         if (
             tid in self.thread_ids()
-            and not self.thread(tid).is_paused()
-            and not self.thread(tid).is_detached()
+            and not self.thread_ro(tid).is_paused()
+            and not self.thread_ro(tid).is_detached()
         ):
-            assert self.thread(tid).pc, "Thread {tid} PC empty"
+            assert self.thread_ro(tid).pc, "Thread {tid} PC empty"
             self._current_thread = tid
             output_states, finished_instr = self.exec_thread(self._current_thread)
             thread_in_action = Action(tid, finished_instr)
             self.trace.append_in_place(thread_in_action)
+            # the successors were copied before the action was appended
+            for state in output_states:
+                state.trace = self.trace.copy()
             return output_states, thread_in_action
         else:
             return [], None
+
+
+def _value_key(v):
+    """A hashable key of a value. Keys of values of different types
+    are never compared by the values, that could fail for expressions."""
+    if v is None:
+        return None
+    if isinstance(v, Pointer):
+        return _value_key(v.object()), _value_key(v.offset())
+    if v.is_concrete():
+        return str(v.type()), v.value()
+    return str(v.type()), v
+
+
+def _thread_fingerprint(t: Thread) -> tuple:
+    return (
+        t.pc.get_id(),
+        t.is_paused(),
+        t.is_detached(),
+        t.in_atomic(),
+        _Snapshot(
+            t.get_cs().snapshot(),
+            CallStack.structural_hash,
+            CallStack.structurally_equal,
+        ),
+    )
+
+
+class _Snapshot:
+    """
+    A snapshot of a memory or a call stack used in fingerprints
+    (the state keeps the ownership of its objects and frames). The hash
+    is maintained incrementally by the memory (call stack), so hashing
+    the snapshot is cheap and the contents are compared only when
+    the hashes match.
+    """
+
+    __slots__ = "value", "_hash", "_equal"
+
+    def __init__(self, value, hash_fn, equal_fn) -> None:
+        self.value = value
+        self._hash = hash_fn(value)
+        self._equal = equal_fn
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, rhs: object) -> bool:
+        return (
+            isinstance(rhs, _Snapshot)
+            and self._hash == rhs._hash
+            and self._equal(self.value, rhs.value)
+        )
+
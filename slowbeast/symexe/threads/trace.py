@@ -1,161 +1,437 @@
 from typing import (
+    Iterator,
     Self,
     Set
 )
-from copy import deepcopy
 from slowbeast.ir.instruction import Instruction
 from slowbeast.ir.instruction import Store, Load, Call, Thread, ThreadJoin, Return
 # from slowbeast.ir.types import PointerType
 
 
 class Action:
+    __slots__ = (
+        "tid",
+        "occurrence",
+        "caused_by",
+        "clock",
+        "instr",
+        "kind",
+        "obj",
+        "pos",
+        "prev",
+        "prev_in_thread",
+        "prev_same",
+        "jump",
+        "backtrack",
+        "racist",
+    )
+
+    # kinds of actions as classified when appended to a trace
+    OTHER = 0
+    READ = 1
+    WRITE = 2
+    LOCK = 3  # successful pthread_mutex_lock
+    UNLOCK = 4
+    FORK = 5
+    JOIN = 6
+    RETURN = 7
+
     def __init__(self, tid: int | None, instr: Instruction | None):
         self.tid = tid
         self.occurrence: int | None = None
-        self.occurrence: int | None = None
-        self.causes: Set[Self] = set()
-        self.caused_by: Set[Self] = set()
+        # immediate causal predecessors, for logging
+        self.caused_by: list[Action] = []
+        # vector clock: thread id -> occurrence of the last action of the
+        # thread that happens before (or is) this action
+        self.clock: dict[int, int] = {}
         self.instr = instr
+        # set by the trace: the kind of the action and the object it works
+        # with (resolved location, mutex operand or the other thread's id)
+        self.kind = Action.OTHER
+        self.obj = None
+        # Set by the trace. An appended action is a node of a persistent
+        # trace: it knows its position and links to the previous action of
+        # the trace, of its thread and of its thread of the same kind and
+        # object, and holds the backtrack set of the trace ending with it
+        # and the actions in race with it (None if there are none).
+        # These links never change, so traces that share a prefix share
+        # its actions. The jump pointer is a skew-binary jump over the
+        # actions of the thread, so an action of a thread is found by
+        # its occurrence in O(log n), see Trace.find.
+        self.pos = -1
+        self.prev: Action | None = None
+        self.prev_in_thread: Action | None = None
+        self.prev_same: Action | None = None
+        self.jump: Action | None = None
+        self.backtrack: set[int] | None = None
+        self.racist: set[Action] | None = None
+
+    def key(self) -> tuple[int, int]:
+        """Identifies the action in any trace that contains it"""
+        return self.tid, self.occurrence  # type: ignore
+
+    def happens_after(self, e: "Action") -> bool:
+        """Is e (transitively) causally before this action? O(1)"""
+        return e is not self and self.clock.get(e.tid, 0) >= e.occurrence  # type: ignore
+
+
+# causality candidates of an appended action, see update_race_and_causality
+_PREDECESSOR = 0
+_DATA = 1
+_LOCK = 2
+_CAUSE = 3
 
 
 class Trace:
-    def __init__(self, sequence: list[Action] = []):
-        self._sequence = sequence
-        self._racist: list[set[Action] | None] = [
-            set()
-        ]  # actions in race with the last action
-        # self._penultimate_racist: set[Action] = set() # Used for trimming the trace.
-        self._backtrack: list[set[int] | None] = [set()]
+    """A handle to a persistent trace. The trace itself is the linked list
+    of actions ending with the last action, so copying a trace is O(1)
+    and copies share their common prefix. Backtrack sets belong to the
+    prefixes (i.e., to the actions) and are therefore shared too."""
+
+    def __init__(
+        self, sequence: list[Action] | None = None, local: frozenset = frozenset()
+    ):
+        # the sentinel before the first action, holds the initial backtrack
+        self._root = Action(None, None)
+        self._root.backtrack = set()
+        self._last = self._root
+        # the last action of each thread and, for each kind and object
+        # (location, mutex, thread) the last action of each thread of that
+        # kind and object, see _head_key. The inner dicts are never modified,
+        # only replaced, so copying the outer dict is enough for COW.
+        self._thread_last: dict[int, Action] = {}
+        self._heads: dict[tuple[int, object], dict[int, Action]] = {}
+        self._heads_ro = False
         self.data_race = False
+        # pointer operands of loads and stores that access memory
+        # of only one thread, such accesses are not in race with anything
+        self._local = local
+        for e in sequence or ():
+            self.append_in_place(e)
+
+    def copy(self) -> "Trace":
+        new = Trace()
+        self._copy_to(new)
+        return new
+
+    def _copy_to(self, new: "Trace") -> None:
+        new._root = self._root
+        new._last = self._last
+        new._thread_last = self._thread_last
+        new._heads = self._heads
+        new._heads_ro = True
+        self._heads_ro = True
+        new.data_race = self.data_race
+        new._local = self._local
+
+    def _heads_rw(self) -> None:
+        if self._heads_ro:
+            self._thread_last = self._thread_last.copy()
+            self._heads = self._heads.copy()
+            self._heads_ro = False
 
     def append(self, e: Action) -> Self:
         """RETURNS an appended trace. Doesn't mutate instance."""
-        new_trace = deepcopy(self)
-        new_trace.set_occurrence(e)
-        new_trace._sequence.append(e)
-        new_trace._backtrack.append(None)
-        new_trace.update_race_and_causality()
-        return new_trace
+        new_trace = self.copy()
+        new_trace.append_in_place(e)
+        return new_trace  # type: ignore
 
     def append_in_place(self, e: Action) -> None:
         """Appends the trace along with updating races and causality"""
+        assert e.prev is None and e.pos == -1, "Action already in a trace"
+        self._heads_rw()
+        self._classify(e)
+        e.prev = self._last
+        e.pos = self._last.pos + 1
+        e.prev_in_thread = self._thread_last.get(e.tid)  # type: ignore
         self.set_occurrence(e)
-        self._sequence.append(e)
-        self._backtrack.append(None)
-        self._racist.append(set())
+        self._set_jump(e)
+        self._last = e
         self.update_race_and_causality()
+        self._thread_last[e.tid] = e  # type: ignore
+        key = self._head_key(e)
+        if key is not None:
+            heads = self._heads.get(key, {}).copy()
+            e.prev_same = heads.get(e.tid)  # type: ignore
+            heads[e.tid] = e  # type: ignore
+            self._heads[key] = heads
 
     def trim(self) -> None:
-        """Trims last event out of the trace. Preserves backtrack updates."""
-        for e in self._sequence[-1].caused_by:
-            e.causes.remove(self._sequence[-1])
-        self._racist = self._racist[:-1]
-        self._sequence = self._sequence[:-1]
-        self._backtrack = self._backtrack[:-1]
+        """Trims last event out of the trace. Preserves backtrack updates.
+        The action stays untouched, other traces may still contain it."""
+        p = self._last
+        assert p.prev is not None, "Trimming an empty trace"
+        self._heads_rw()
+        if p.prev_in_thread is None:
+            del self._thread_last[p.tid]  # type: ignore
+        else:
+            self._thread_last[p.tid] = p.prev_in_thread  # type: ignore
+        key = self._head_key(p)
+        if key is not None:
+            heads = self._heads[key].copy()
+            if p.prev_same is None:
+                del heads[p.tid]  # type: ignore
+            else:
+                heads[p.tid] = p.prev_same  # type: ignore
+            if heads:
+                self._heads[key] = heads
+            else:
+                del self._heads[key]
+        self._last = p.prev
+
+    def __iter__(self) -> Iterator[Action]:
+        return iter(self._actions_after(self._root))
+
+    def _actions_after(self, action: Action) -> list[Action]:
+        """Actions of the trace that follow the given action, in order"""
+        suffix = []
+        e = self._last
+        while e is not action:
+            assert e is not None, "Action not in the trace"
+            suffix.append(e)
+            e = e.prev  # type: ignore
+        suffix.reverse()
+        return suffix
 
     def set_backtrack(self, bt: set[int]) -> None:
         """sets backtrack"""
-        self._backtrack[-1] = bt
+        self._last.backtrack = bt
+
+    def last(self) -> Action:
+        """The last action of the trace (the root sentinel if it is empty)"""
+        return self._last
 
-    def get_racist_set(self):
-        return self._racist[-1]
+    def get_racist_set(self) -> Set[Action]:
+        return self._last.racist or set()
 
     def get_backtrack(self, action: Action | None = None) -> Set[int]:
         """Returns backtrack for the last action
         (= current trace) or backtrack of the PREFIX
-        of the requested action"""
-        backtrack = self._backtrack[-1]
+        of the requested action of this trace. O(1)"""
         if action is None:
-            backtrack = self._backtrack[-1]
+            backtrack = self._last.backtrack
         else:
-            backtrack = self._backtrack[self._sequence.index(action)]
+            assert action.prev is not None, "Action not in a trace"
+            backtrack = action.prev.backtrack
         assert backtrack is not None, "Backtrack should not be None"
         return backtrack
 
     def set_occurrence(self, act: Action) -> None:
-        for e in reversed(self._sequence):
-            assert e.occurrence is not None, "Unknown behaviour"
-            if e.tid == act.tid:
-                act.occurrence = e.occurrence + 1
-                break
-        if act.occurrence is None:
-            act.occurrence = 1
+        assert act.tid is not None, "Unknown behaviour"
+        prev = act.prev_in_thread
+        act.occurrence = 1 if prev is None else prev.occurrence + 1  # type: ignore
+        act.clock = {act.tid: act.occurrence}
+
+    @staticmethod
+    def _set_jump(act: Action) -> None:
+        j = act.prev_in_thread
+        if (
+            j is not None
+            and j.jump is not None
+            and j.jump.jump is not None
+            and j.occurrence - j.jump.occurrence  # type: ignore
+            == j.jump.occurrence - j.jump.jump.occurrence  # type: ignore
+        ):
+            act.jump = j.jump.jump
+        else:
+            act.jump = j
+
+    def find(self, tid: int, occurrence: int) -> Action | None:
+        """The action of this trace with the given key. O(log n)"""
+        e = self._thread_last.get(tid)
+        while e is not None and e.occurrence > occurrence:  # type: ignore
+            jump = e.jump
+            if jump is not None and jump.occurrence >= occurrence:  # type: ignore
+                e = jump
+            else:
+                e = e.prev_in_thread
+        if e is not None and e.occurrence == occurrence:
+            return e
+        return None
+
+    def _classify(self, p: Action) -> None:
+        """Set the kind and the object of a freshly executed action.
+        Must be called before the action is indexed, since the tid operands
+        of thread instructions are overwritten by later executions."""
+        instr = p.instr
+        if isinstance(instr, (Load, Store)):
+            obj = self.resolve_multi_pointers(instr.pointer_operand())
+            if obj not in self._local:
+                p.obj = obj
+                p.kind = Action.READ if isinstance(instr, Load) else Action.WRITE
+        elif isinstance(instr, Thread):
+            p.kind, p.obj = Action.FORK, instr.get_operand_tid()
+        elif isinstance(instr, Call):
+            name = instr.called_function().name()  # type: ignore (legacy)
+            if name == "pthread_mutex_lock" and instr.succ:  # type: ignore (legacy)
+                p.kind, p.obj = Action.LOCK, instr.operand(0)
+            elif name == "pthread_mutex_unlock":
+                p.kind, p.obj = Action.UNLOCK, instr.operand(0)
+        elif isinstance(instr, ThreadJoin):
+            p.kind, p.obj = Action.JOIN, instr.get_operand_tid()
+        elif isinstance(instr, Return):
+            p.kind, p.obj = Action.RETURN, p.tid
+
+    @staticmethod
+    def _head_key(p: Action) -> tuple[int, object] | None:
+        """The key of the actions of the same kind and object as p
+        (joins are looked up only via the thread)"""
+        if p.kind in (Action.OTHER, Action.JOIN):
+            return None
+        return p.kind, p.obj
 
     def add_to_prefix_backtrack(self, action: Action, thread: int) -> None:
-        # Remove try-except block. Likely just needs None handling.
-        try:
-            self._backtrack[self._sequence.index(action)].add(thread) # type: ignore
-        except ValueError:
-            self._backtrack[self.index(action)].add(thread) # type: ignore
+        self.get_backtrack(action).add(thread)
 
     def independent_suffix_set(self, action: Action) -> Set[int]:  # ✅
-        """The I_{E'.e}(notdep(e,E).p) for e."""
+        """The I_{E'.e}(notdep(e,E).p) for e: threads of the actions
+        of notdep(e,E).p that are not caused by any other action of it."""
         isfset: Set[int] = set()
-        initial_index = self._sequence.index(action) + 1
-        initial_set = set(self._sequence[initial_index:])
-        e_causes = self.get_causes(action)
-        e_caused_by = self.get_caused_by(action)
-        suffix_set = initial_set.difference(e_causes)
-        suffix_set.add(self._sequence[-1])
-        for e in suffix_set:
-            if not e_caused_by.intersection(suffix_set):
-                # print(e)
+        # notdep events of a thread form a prefix of its events after e,
+        # so it is enough to remember the first one per thread
+        first: dict[int, Action] = {}
+        suffix = [
+            e
+            for e in self._actions_after(action)[:-1]
+            if not e.happens_after(action)
+        ]
+        suffix.append(self._last)
+        for e in suffix:
+            first.setdefault(e.tid, e)  # type: ignore
+        for e in suffix:
+            if first[e.tid] is not e:  # type: ignore
+                continue
+            if not any(
+                f is not e and e.happens_after(f) for f in first.values()
+            ):
                 assert e.tid is not None, "Unknown behaviour"
                 isfset.add(e.tid)
         return isfset
 
     def get_causes(self, e: Action) -> Set[Action]:
         """Returns transivitively closed set of causal successors"""
-        successors : Set[Action] = set()
-
-        stack = [e]
-        while stack:
-            current = stack.pop()
-            for succ in current.causes:
-                if succ not in successors:
-                    successors.add(succ)
-                    stack.append(succ)
-
-        return successors
+        return {q for q in self if q.happens_after(e)}
 
     def get_caused_by(self, e: Action) -> Set[Action]:
         """Returns transivitively closed set of causal predecessors"""
-        predecessors: Set[Action] = set()
+        return {q for q in self if e.happens_after(q)}
+
+    def _heads_of(self, kind: int, obj: object, tid: int) -> list[Action]:
+        """The last actions of other threads than tid of the kind on obj"""
+        heads = self._heads.get((kind, obj))
+        if heads is None:
+            return []
+        return [e for t, e in heads.items() if t != tid]
+
+    def head(self, kind: int, obj: object, tid: int) -> Action | None:
+        """The last action of thread tid of the kind on obj"""
+        heads = self._heads.get((kind, obj))
+        return None if heads is None else heads.get(tid)
+
+    def heads_of_kind(self, kind: int) -> Iterator[Action]:
+        """The last actions of all threads of the kind on any object"""
+        for (k, _), heads in self._heads.items():
+            if k == kind:
+                yield from heads.values()
+
+    def frontier(self) -> tuple:
+        """A canonical form of the part of the trace that actions appended
+        to it can see: the last actions of the threads and the heads, with
+        the order of their positions and their vector clocks, where every
+        component of a clock is replaced by its rank among the values of
+        that component. Appending the same actions to traces with equal
+        frontiers yields the same races and causality."""
+        actions = {e.pos: e for e in self._thread_last.values()}
+        for heads in self._heads.values():
+            for e in heads.values():
+                actions[e.pos] = e
+        values: dict[int, set[int]] = {}
+        for e in actions.values():
+            for tid, occ in e.clock.items():
+                values.setdefault(tid, set()).add(occ)
+        # occurrences start at 1, rank 0 stays for the missing components
+        ranks = {
+            tid: {occ: r for r, occ in enumerate(sorted(occs), 1)}
+            for tid, occs in values.items()
+        }
+        order = sorted(actions)
+        rank = {pos: r for r, pos in enumerate(order)}
+        return (
+            frozenset((tid, rank[e.pos]) for tid, e in self._thread_last.items()),
+            frozenset(
+                (key, frozenset((tid, rank[e.pos]) for tid, e in heads.items()))
+                for key, heads in self._heads.items()
+            ),
+            tuple(
+                frozenset(
+                    (tid, ranks[tid][occ]) for tid, occ in actions[pos].clock.items()
+                )
+                for pos in order
+            ),
+        )
 
-        stack = [e]
-        while stack:
-            current = stack.pop()
-            for pred in current.caused_by:
-                if pred not in predecessors:
-                    predecessors.add(pred)
-                    stack.append(pred)
+    def _candidates(self, p: Action) -> list[tuple[Action, int]]:
+        """Actions that may be in race with or cause the (not yet indexed)
+        last action p, paired with the kind of the relation.
+        Earlier actions of the same thread are ordered before these
+        by the program order, so only the last one of each thread is needed."""
+        kind, obj, tid = p.kind, p.obj, p.tid
+        assert tid is not None, "Unknown behaviour"
+        candidates: list[tuple[Action, int]] = []
+        if kind == Action.READ:
+            candidates.extend(
+                (e, _DATA) for e in self._heads_of(Action.WRITE, obj, tid)
+            )
+        elif kind == Action.WRITE:
+            candidates.extend(
+                (e, _DATA) for e in self._heads_of(Action.READ, obj, tid)
+            )
+            candidates.extend(
+                (e, _DATA) for e in self._heads_of(Action.WRITE, obj, tid)
+            )
+        elif kind == Action.LOCK:
+            candidates.extend(
+                (e, _LOCK) for e in self._heads_of(Action.LOCK, obj, tid)
+            )
 
-        return predecessors
+        j = p.prev_in_thread
+        if j is not None:
+            candidates.append((j, _PREDECESSOR))
+            if j.kind == Action.LOCK:
+                causes = self._heads_of(Action.UNLOCK, j.obj, tid)
+            elif j.kind == Action.JOIN:
+                causes = self._heads_of(Action.RETURN, j.obj, tid)
+            else:
+                causes = []
+        else:
+            causes = self._heads_of(Action.FORK, tid, tid)
+        candidates.extend((e, _CAUSE) for e in causes)
+        return candidates
 
     def update_race_and_causality(self) -> None:  # ✅
-        """Updates immediate causal relation and racist set"""
-        p = self._sequence[-1]
-        for e in reversed(self._sequence[:-1]):
-            if e.tid == p.tid:
-                if e.occurrence + 1 == p.occurrence:    # type: ignore
-                    self.set_happens_before(e, p)
-            elif self.in_data_race(e, p):
+        """Updates immediate causal relation and racist set.
+        Visits only the candidates found in the heads, latest first."""
+        p = self._last
+        candidates = self._candidates(p)
+        candidates.sort(key=lambda c: c[0].pos, reverse=True)
+        for e, rel in candidates:
+            if rel == _DATA:
                 if self.update_race(e, p):
                     self.data_race = True
                     break  # Should not break if data race detection is not the only goal.
                 self.set_happens_before(e, p)
-            elif self.in_lock_race(e, p):
+            elif rel == _LOCK:
                 self.update_race(e, p)
                 self.set_happens_before(e, p)
-            elif self.non_reversible_causality(e, p):
+            else:
                 self.set_happens_before(e, p)
 
     def update_race(self, e: Action, p: Action) -> bool:
         """Returns True if race is updated"""
-        e_causes = self.get_causes(e)
-        if p not in e_causes:
-            assert self._racist[-1] is not None, "Racist set should not be None"
-            self._racist[-1].add(e)
+        if not p.happens_after(e):
+            if p.racist is None:
+                p.racist = set()
+            p.racist.add(e)
             return True
         else:
             return False
@@ -180,19 +456,12 @@ class Trace:
             isinstance(e.instr, Call)
             and e.instr.called_function().name() == "pthread_mutex_unlock"  # type: ignore (legacy)
         ):
-            for j in reversed(self._sequence):
-                assert j.occurrence is not None, "Unknown behaviour"
-                if (
-                    j.tid == p.tid
-                    and j.occurrence + 1 == p.occurrence
-                    and isinstance(j.instr, Call)
-                    and j.instr.called_function().name() == "pthread_mutex_lock" # type: ignore (legacy)
-                    and j.instr.succ
-                    and e.instr.operand(0) == j.instr.operand(0) # type: ignore (legacy)
-                ):
-                    return True
-                if j.tid == p.tid and j.occurrence < p.occurrence - 1:
-                    break
+            j = p.prev_in_thread
+            return (
+                j is not None
+                and j.kind == Action.LOCK
+                and e.instr.operand(0) == j.obj # type: ignore (legacy)
+            )
         return False
 
     def fork_causality(self, e: Action, p: Action) -> bool:
@@ -204,15 +473,8 @@ class Trace:
     def join_causality(self, e: Action, p: Action) -> bool:
         assert p.occurrence is not None, "Unknown behaviour"
         if isinstance(e.instr, Return):
-            for j in reversed(self._sequence):
-                assert j.occurrence is not None, "Unknown behaviour"
-                if (
-                    j.tid == p.tid
-                    and j.occurrence == p.occurrence - 1
-                    and isinstance(j.instr, ThreadJoin)
-                    and j.instr.get_operand_tid() == e.tid
-                ):
-                    return True
+            j = p.prev_in_thread
+            return j is not None and j.kind == Action.JOIN and j.obj == e.tid
         return False
 
     def in_data_race(self, e: Action, p: Action) -> bool:
@@ -238,7 +500,10 @@ class Trace:
         # store_metadata = store_instr._metadata # type: ignore
         # lline = self.get_line_no_from_metadata(load_metadata) # type: ignore
         # sline = self.get_line_no_from_metadata(store_metadata) # type: ignore
-        return load_location == store_location # type: ignore
+        return (
+            load_location == store_location  # type: ignore
+            and load_location not in self._local
+        )
 
     def resolve_multi_pointers(self, pointer_op): # type: ignore
         """Resolves double (or more) pointers"""
@@ -269,28 +534,28 @@ class Trace:
         )
 
     def set_happens_before(self, e: Action, p: Action) -> None:  # ✅
-        """Order matters"""
-        e.causes.add(p)
-        p.caused_by.add(e)
+        """Order matters. Joins the vector clock of e into p's."""
+        p.caused_by.append(e)
+        clock = p.clock
+        for tid, occ in e.clock.items():
+            if clock.get(tid, 0) < occ:
+                clock[tid] = occ
 
     def terminal_thread(self) -> int:
-        assert self._sequence[-1].tid is not None, "Unknown behaviour"
-        return self._sequence[-1].tid
+        assert self._last.tid is not None, "Unknown behaviour"
+        return self._last.tid
 
     def __len__(self):
-        return len(self._sequence)
+        return self._last.pos + 1
 
     def index(self, action: Action) -> int | None:
-        ind = 0
-        for e in self._sequence:
-            if e.tid == action.tid and e.occurrence == action.occurrence:
-                return ind
-            else:
-                ind += 1
-        return None
+        """Position of the action of this trace with the key of the given
+        action (which may come from another trace)"""
+        e = self.find(*action.key())
+        return None if e is None else e.pos
 
     def depends_on_last(self, e: Action) -> bool:
-        p = self._sequence[-1]
+        p = self._last
         # self.set_occurrence(e)
         assert p.tid != e.tid, "Actions from the same thread."
         return (
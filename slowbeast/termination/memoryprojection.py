@@ -13,6 +13,12 @@ class MemoryProjection:
                 if not mo.is_read_only()
             }
         )
+        # the initial values of globals that were not accessed yet
+        memory = state.memory
+        for mo_id, val in memory._pending_inits.items():
+            mo = memory._glob_objects.get(mo_id)
+            if mo is not None and not mo.is_read_only():
+                self.memory[(mo_id, 0)] = val
 
     def get(self, mo_id, offset):
         return self.memory.get((mo_id, offset))
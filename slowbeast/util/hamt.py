@@ -0,0 +1,248 @@
+"""
+Persistent hash array mapped trie (HAMT).
+
+A node of the trie maps 5 bits of the hash of a key to its children,
+storing only the present children in a list indexed by a bitmap.
+Updates copy only the nodes on the path from the root to the changed
+entry, the rest of the trie is shared with the original map.
+Copying a map is therefore free and an update takes O(log n) time.
+"""
+
+from typing import Any, Iterator, Optional
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+
+class _Node:
+    """An inner node of the trie. Its entries are either subnodes
+    or (key, value) pairs. The nodes are never modified once they
+    are part of a map."""
+
+    __slots__ = "bitmap", "entries"
+
+    def __init__(self, bitmap: int, entries: list) -> None:
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _Collision:
+    """The (key, value) pairs of keys whose hashes are equal"""
+
+    __slots__ = "entries"
+
+    def __init__(self, entries: list) -> None:
+        self.entries = entries
+
+
+def _hash(key) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _get(node, h: int, key, default):
+    shift = 0
+    while True:
+        if type(node) is _Collision:
+            for k, v in node.entries:
+                if k == key:
+                    return v
+            return default
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return default
+        entry = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+        if type(entry) is tuple:
+            return entry[1] if entry[0] == key else default
+        node = entry
+        shift += _BITS
+
+
+def _pair_node(shift: int, h1: int, pair1: tuple, h2: int, pair2: tuple):
+    """Create a subnode with two pairs whose hashes agree below shift"""
+    if shift >= _HASH_BITS:
+        return _Collision([pair1, pair2])
+    i1, i2 = (h1 >> shift) & _MASK, (h2 >> shift) & _MASK
+    if i1 == i2:
+        return _Node(1 << i1, [_pair_node(shift + _BITS, h1, pair1, h2, pair2)])
+    entries = [pair1, pair2] if i1 < i2 else [pair2, pair1]
+    return _Node((1 << i1) | (1 << i2), entries)
+
+
+def _assoc(node, shift: int, h: int, key, value):
+    """Return the node with key mapped to value
+    and whether the key is new in the node"""
+    if type(node) is _Collision:
+        entries = node.entries.copy()
+        for i, (k, _) in enumerate(entries):
+            if k == key:
+                entries[i] = (key, value)
+                return _Collision(entries), False
+        entries.append((key, value))
+        return _Collision(entries), True
+
+    bit = 1 << ((h >> shift) & _MASK)
+    idx = (node.bitmap & (bit - 1)).bit_count()
+    entries = node.entries.copy()
+    if not node.bitmap & bit:
+        entries.insert(idx, (key, value))
+        return _Node(node.bitmap | bit, entries), True
+
+    entry = entries[idx]
+    added = False
+    if type(entry) is tuple:
+        if entry[0] == key:
+            if entry[1] is value:
+                return node, False
+            entries[idx] = (key, value)
+        else:
+            entries[idx] = _pair_node(
+                shift + _BITS, _hash(entry[0]), entry, h, (key, value)
+            )
+            added = True
+    else:
+        sub, added = _assoc(entry, shift + _BITS, h, key, value)
+        if sub is entry:
+            return node, False
+        entries[idx] = sub
+    return _Node(node.bitmap, entries), added
+
+
+def _without(node, shift: int, h: int, key):
+    """Return the node without the key (the same node if the key is not
+    in the node). The result may be a single pair that replaces
+    the node in its parent or None if the node became empty."""
+    if type(node) is _Collision:
+        entries = [e for e in node.entries if e[0] != key]
+        if len(entries) == len(node.entries):
+            return node
+        return entries[0] if len(entries) == 1 else _Collision(entries)
+
+    bit = 1 << ((h >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node
+    idx = (node.bitmap & (bit - 1)).bit_count()
+    entry = node.entries[idx]
+    if type(entry) is tuple:
+        if entry[0] != key:
+            return node
+        sub = None
+    else:
+        sub = _without(entry, shift + _BITS, h, key)
+        if sub is entry:
+            return node
+
+    entries = node.entries.copy()
+    if sub is None:
+        del entries[idx]
+        bitmap = node.bitmap & ~bit
+        if not entries:
+            return None
+        if len(entries) == 1 and type(entries[0]) is tuple and shift > 0:
+            # pull the last pair up into the parent
+            return entries[0]
+        return _Node(bitmap, entries)
+    if type(sub) is tuple and len(entries) == 1 and shift > 0:
+        return sub
+    entries[idx] = sub
+    return _Node(node.bitmap, entries)
+
+
+def _iter_items(node) -> Iterator[tuple]:
+    for entry in node.entries:
+        if type(entry) is tuple:
+            yield entry
+        else:
+            yield from _iter_items(entry)
+
+
+_EMPTY_NODE = _Node(0, [])
+
+
+class PersistentMap:
+    """
+    Immutable map backed by a HAMT. The map has the read-only interface
+    of dict, the updates return a new map that shares the unchanged parts
+    of the trie with this map.
+    """
+
+    __slots__ = "_root", "_len"
+
+    def __init__(self, items=None) -> None:
+        self._root = _EMPTY_NODE
+        self._len = 0
+        if items is not None:
+            root, n = _EMPTY_NODE, 0
+            for key, value in items.items() if isinstance(items, dict) else items:
+                root, added = _assoc(root, 0, _hash(key), key, value)
+                n += added
+            self._root, self._len = root, n
+
+    @staticmethod
+    def _make(root, n: int) -> "PersistentMap":
+        new = PersistentMap.__new__(PersistentMap)
+        new._root = root
+        new._len = n
+        return new
+
+    def set(self, key, value) -> "PersistentMap":
+        """Return the map with key mapped to value"""
+        root, added = _assoc(self._root, 0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PersistentMap._make(root, self._len + added)
+
+    def delete(self, key) -> "PersistentMap":
+        """Return the map without key (the key does not need to be present)"""
+        root = _without(self._root, 0, _hash(key), key)
+        if root is self._root:
+            return self
+        if root is None:
+            root = _EMPTY_NODE
+        return PersistentMap._make(root, self._len - 1)
+
+    def get(self, key, default: Optional[Any] = None):
+        return _get(self._root, _hash(key), key, default)
+
+    def __getitem__(self, key):
+        missing = _MISSING
+        value = _get(self._root, _hash(key), key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return _get(self._root, _hash(key), key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __bool__(self) -> bool:
+        return self._len > 0
+
+    def items(self) -> Iterator[tuple]:
+        return _iter_items(self._root)
+
+    def keys(self) -> Iterator:
+        return (k for k, _ in _iter_items(self._root))
+
+    def values(self) -> Iterator:
+        return (v for _, v in _iter_items(self._root))
+
+    def __iter__(self) -> Iterator:
+        return self.keys()
+
+    def __eq__(self, rhs: object) -> bool:
+        if not isinstance(rhs, (PersistentMap, dict)) or len(self) != len(rhs):
+            return False
+        if isinstance(rhs, PersistentMap) and self._root is rhs._root:
+            return True
+        missing = _MISSING
+        return all(rhs.get(k, missing) == v for k, v in self.items())
+
+    def __repr__(self) -> str:
+        return f"PersistentMap({{{', '.join(f'{k!r}: {v!r}' for k, v in self.items())}}})"
+
+
+_MISSING = object()
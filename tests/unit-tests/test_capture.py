@@ -0,0 +1,94 @@
+import pytest
+from z3 import And, BitVec, Bool, Not, Solver, unsat
+
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.ir.types import type_mgr
+from slowbeast.solvers import capture
+from slowbeast.solvers.capture import (
+    CAPTURE_DIR,
+    REPLAY_LAYERS,
+    QueryCapture,
+    load_queries,
+    replay,
+)
+from slowbeast.solvers.symcrete import SymbolicSolver, global_expr_mgr
+
+
+def equivalent(formulas, other):
+    solver = Solver()
+    solver.add(Not(And(formulas) == And(other)))
+    return solver.check() == unsat
+
+
+def queries():
+    """Queries with their verdicts, the last verdict is wrong"""
+    x, a = BitVec("x", 32), Bool("a")
+    return [
+        ("sat", [x > 3, x < 5], True),
+        ("unsat", [x > 5, x < 3], False),
+        ("bool", [a, Not(a)], False),
+        ("unknown", [a, x == 7], None),
+        ("wrong", [x * 2 == 3], True),
+    ]
+
+
+@pytest.fixture
+def captured(tmp_path):
+    c = QueryCapture()
+    assert not c.enabled
+    c.enable(str(tmp_path))
+    for site, formulas, verdict in queries():
+        c.add(site, formulas, verdict, 0.25)
+    return tmp_path
+
+
+def test_load(captured):
+    loaded = load_queries([str(captured)])
+    # in the order of capturing
+    assert [q.site for q in loaded] == [site for site, _, _ in queries()]
+    for q, (_, formulas, verdict) in zip(loaded, queries()):
+        assert q.verdict is verdict
+        assert q.time == 0.25
+        assert equivalent(q.formulas, formulas)
+    # the directory with the queries and the files themselves
+    queries_dir = captured / CAPTURE_DIR
+    assert [q.path for q in load_queries([str(queries_dir)])] == [
+        q.path for q in loaded
+    ]
+    assert [q.site for q in load_queries([loaded[1].path, loaded[0].path])] == [
+        "sat",
+        "unsat",
+    ]
+
+
+@pytest.mark.parametrize("layer", sorted(REPLAY_LAYERS))
+def test_replay(captured, layer):
+    loaded = load_queries([str(captured)])
+    result = replay(loaded, layer)
+    assert result.layer == layer
+    assert result.queries == len(loaded)
+    assert result.unknown == 0
+    # the unknown verdict is not compared
+    assert result.mismatches == [loaded[-1].path]
+    assert result.time > 0
+
+
+def test_capture_solver_queries(tmp_path, monkeypatch):
+    """The queries of the solver layer are captured and replay
+    with the same verdicts"""
+    c = QueryCapture()
+    c.enable(str(tmp_path))
+    monkeypatch.setattr(capture, "_query_capture", c)
+    em = global_expr_mgr()
+    x = em.symbolic_value("x", type_mgr().bv_ty(32))
+    v = lambda n: concrete_value(n, 32)
+    solver = SymbolicSolver()
+    assert solver.is_sat(em.Lt(x, v(5)), em.Gt(x, v(3))) is True
+    assert solver.is_sat(em.Lt(x, v(3)), em.Gt(x, v(5))) is False
+    monkeypatch.undo()
+    loaded = load_queries([str(tmp_path)])
+    assert len(loaded) >= 2
+    assert {q.verdict for q in loaded} == {True, False}
+    for layer in REPLAY_LAYERS:
+        result = replay(loaded, layer)
+        assert (result.unknown, result.mismatches) == (0, [])
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+from z3 import is_false, is_true
+
+from slowbeast.domains.symbolic_helpers import symbols
+from slowbeast.ir.types import type_mgr
+from slowbeast.solvers.symcrete import global_expr_mgr
+from slowbeast.symexe.constraints import ConstraintsSet
+
+EM = global_expr_mgr()
+VARS = [EM.symbolic_value(f"x{i}", type_mgr().bv_ty(8)) for i in range(8)]
+
+
+def random_constraint(rnd):
+    a, b = rnd.choice(VARS), rnd.choice(VARS)
+    r = rnd.random()
+    if r < 0.3:
+        return EM.Lt(a, EM.concrete_value(rnd.randrange(1, 256), 8), unsigned=True)
+    if r < 0.6:
+        return EM.Ne(a, b)
+    if r < 0.8:
+        return EM.Le(EM.Add(a, b), EM.concrete_value(rnd.randrange(256), 8))
+    return EM.And(random_constraint(rnd), random_constraint(rnd))
+
+
+def names(e):
+    """Names of the symbols of the expression (the constants True and False
+    are not symbols)"""
+    return {
+        s.decl().name()
+        for s in symbols(e.unwrap())
+        if not (is_true(s) or is_false(s))
+    }
+
+
+def expected_relevant(constraints, E, names=names):
+    """The constraints whose symbols are connected with the symbols of E
+    via the symbols of the constraints (union-find)"""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            x = parent[x]
+        return x
+
+    for c in constraints:
+        syms = [find(s) for s in names(c)]
+        for s in syms[1:]:
+            parent[s] = syms[0]
+    comps = {find(s) for e in E for s in names(e) if s in parent}
+    return [
+        c for c in constraints if not names(c) or find(min(names(c))) in comps
+    ]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_relevant(seed):
+    rnd = random.Random(seed)
+    family = [ConstraintsSet()]
+    known = {}
+
+    def cached_names(c):
+        if id(c) not in known:
+            known[id(c)] = (c, names(c))
+        return known[id(c)][1]
+
+    for _ in range(30):
+        C = rnd.choice(family)
+        if rnd.random() < 0.2:
+            family.append(C.copy())
+        else:
+            C.add(random_constraint(rnd))
+        for C in family:
+            constraints = C.get()
+            E = [EM.Eq(v, EM.concrete_value(0, 8)) for v in rnd.sample(VARS, 2)]
+            relevant = C.relevant(*E)
+            expected = expected_relevant(constraints, E, cached_names)
+            assert {id(c) for c in relevant} == {id(c) for c in expected}
+            assert len(relevant) == len(expected)
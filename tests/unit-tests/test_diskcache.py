@@ -0,0 +1,107 @@
+import os
+import sqlite3
+
+from z3 import BitVec, Bool, Int, Not
+
+from slowbeast.solvers import diskcache
+from slowbeast.solvers.diskcache import DiskQueryCache, query_hash
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_query_hash():
+    a, b = Bool("a"), Bool("b")
+    assert query_hash([a, Not(b)]) == query_hash([Not(b), a, a])
+    assert query_hash([a, Not(b)]) != query_hash([a, b])
+    # the same formula created again (with another id)
+    assert query_hash([Int("x") + 1 > 0]) == query_hash([Int("x") + 1 > 0])
+    # the formulas print the same, but the symbols have other sorts
+    assert str(Int("x") == Int("y")) == str(BitVec("x", 8) == BitVec("y", 8))
+    assert query_hash([Int("x") == Int("y")]) != query_hash(
+        [BitVec("x", 8) == BitVec("y", 8)]
+    )
+    assert query_hash([BitVec("x", 8) == 0]) != query_hash([BitVec("x", 16) == 0])
+
+
+def test_flush(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = DiskQueryCache(path)
+    a, b = Bool("a"), Bool("b")
+    cache.put([a], True)
+    cache.put([a, Not(a)], False)
+    cache.put([b], None)
+    assert cache.get([a]) is True and cache.get([Not(a), a]) is False
+    assert cache.get([b]) is None
+    # the results are not written until a flush
+    other = DiskQueryCache(path)
+    assert other.get([a]) is None
+    cache.flush()
+    assert rows(path) == 2
+    assert other.get([a]) is True and other.get([a, Not(a)]) is False
+    assert (other.hits, other.misses) == (2, 1)
+    cache.close()
+    other.close()
+
+
+def test_flush_after_commit_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(diskcache, "_COMMIT_INTERVAL", 3)
+    path = str(tmp_path / "cache.db")
+    cache = DiskQueryCache(path)
+    for i in range(3):
+        cache.put([Bool(f"x{i}")], True)
+    assert rows(path) == 3
+    cache.close()
+
+
+def test_eviction(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = DiskQueryCache(path, capacity=3)
+    xs = [Bool(f"x{i}") for i in range(5)]
+    for x in xs[:3]:
+        cache.put([x], True)
+    cache.flush()
+    # x0 is used, so x1 and x2 are the least recently used queries
+    assert cache.get([xs[0]]) is True
+    cache.put([xs[3]], True)
+    cache.put([xs[4]], False)
+    cache.flush()
+    assert rows(path) == 3
+    assert [cache.get([x]) for x in xs] == [True, None, None, True, False]
+    cache.close()
+    # the times of the uses survive reopening the file
+    cache = DiskQueryCache(path, capacity=3)
+    assert cache.get([xs[3]]) is True
+    cache.put([xs[1]], True)
+    cache.flush()
+    assert [cache.get([x]) for x in xs] == [None, True, None, True, False]
+    cache.close()
+
+
+def test_fork(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = DiskQueryCache(path)
+    a, b = Bool("a"), Bool("b")
+    cache.put([a], True)
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            # the child has its own connection and does not see (nor write)
+            # the changes of the parent that were not flushed
+            ok = cache.get([a]) is None
+            cache.put([b], False)
+            cache.flush()
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert cache.get([b]) is False
+    cache.flush()
+    assert rows(path) == 2
+    cache.close()
@@ -1,11 +1,13 @@
 import pytest
 import os
 import glob
+import shutil
 
 from tests.utils.utils import *
 
-IN_DIR = os.path.abspath("/workspaces/slowbeast-no-data-race/tests/unit-tests/input-files") + os.sep
-OUT_DIR = os.path.abspath("/workspaces/slowbeast-no-data-race/tests/unit-tests/output-files") + os.sep
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+IN_DIR = os.path.join(TESTS_DIR, "input-files") + os.sep
+OUT_DIR = os.path.join(TESTS_DIR, "output-files") + os.sep
 
 def get_input_files():
     """Returns file ids for indexing tests"""
@@ -15,11 +17,24 @@ def get_input_files():
 def file_id(filename):
     return os.path.basename(str(filename).split('.')[0])
 
+# the options of the exploration must not change the verdicts
+OPTIONS = {
+    "default": [],
+    "jobs": ["-threads-dpor-jobs", "2"],
+    "stateful": ["-threads-dpor-stateful"],
+    "coalesce": ["-threads-coalesce-invisible"],
+    "no-escape": ["-threads-no-escape-analysis"],
+}
+
+@pytest.mark.skipif(shutil.which("clang") is None, reason="clang is needed")
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
 @pytest.mark.parametrize("input_file", get_input_files(), ids=file_id)
-def test_all_units(input_file):
+def test_all_units(input_file, options):
+    os.makedirs(OUT_DIR, exist_ok=True)
     target_file, expected_verdict, out_dir_target = get_verdict(input_file, OUT_DIR)
-    print(os.getcwd())
-    output = run_sb(target_file, out_dir_target, IN_DIR)
+    if options:
+        out_dir_target += "".join(options)
+    output = run_sb(target_file, out_dir_target, IN_DIR, options)
     
     write_output_log(out_dir_target, output)
     
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from slowbeast.util.hamt import PersistentMap, _Collision, _EMPTY_NODE, _Node
+
+
+class Key:
+    """A key with a given hash, so that the hashes of keys collide"""
+
+    __slots__ = "name", "h"
+
+    def __init__(self, name: int, h: int) -> None:
+        self.name = name
+        self.h = h
+
+    def __hash__(self) -> int:
+        return self.h
+
+    def __eq__(self, rhs: object) -> bool:
+        return isinstance(rhs, Key) and self.name == rhs.name
+
+    def __repr__(self) -> str:
+        return f"Key({self.name}, {self.h})"
+
+
+def random_keys(rnd, n):
+    """Keys whose hashes agree on the lowest bits, on all but the highest
+    bits and on all the bits"""
+    hashes = [rnd.getrandbits(64) for _ in range(4)]
+    hashes += [h ^ (rnd.getrandbits(4) << 60) for h in hashes]
+    hashes += [rnd.randrange(-8, 8) for _ in range(4)]
+    hashes += [hashes[0] ^ (rnd.getrandbits(20) << 5) for _ in range(4)]
+    return [Key(i, rnd.choice(hashes)) for i in range(n)]
+
+
+def check_node(node, shift):
+    if type(node) is _Collision:
+        assert shift >= 64 and len(node.entries) > 1
+        return
+    assert node.bitmap.bit_count() == len(node.entries)
+    if shift > 0:
+        # a single pair is kept in the parent
+        assert len(node.entries) > 1 or type(node.entries[0]) is not tuple
+    for entry in node.entries:
+        if type(entry) is not tuple:
+            check_node(entry, shift + 5)
+
+
+def check_map(m, model):
+    assert len(m) == len(model)
+    assert bool(m) == bool(model)
+    assert dict(m.items()) == model
+    assert len(list(m.items())) == len(model)
+    assert set(m) == set(model)
+    assert m == model
+    for k, v in model.items():
+        assert m[k] is v
+        assert m.get(k) is v
+        assert k in m
+    if m._root is not _EMPTY_NODE:
+        assert m._root.entries
+        check_node(m._root, 0)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_persistent_map(seed):
+    rnd = random.Random(seed)
+    keys = random_keys(rnd, 40)
+    versions = [(PersistentMap(), {})]
+    for _ in range(300):
+        m, model = rnd.choice(versions)
+        k = rnd.choice(keys)
+        r = rnd.random()
+        if r < 0.6:
+            v = object()
+            m, model = m.set(k, v), {**model, k: v}
+        elif r < 0.9:
+            m, model = m.delete(k), {x: v for x, v in model.items() if x != k}
+        else:
+            m, model = PersistentMap(model), model
+        versions.append((m, model))
+        check_map(m, model)
+        for k in keys:
+            if k not in model:
+                assert k not in m
+                assert m.get(k, 1) == 1
+                with pytest.raises(KeyError):
+                    m[k]
+    # the updates did not change the older versions
+    for m, model in versions:
+        check_map(m, model)
@@ -0,0 +1,221 @@
+import random
+
+import pytest
+
+from slowbeast.core.memoryobject import MemoryObject
+from slowbeast.domains.concrete_bitvec import ConcreteBitVec
+from slowbeast.domains.concrete_floats import ConcreteFloat
+from slowbeast.domains.pointer import Pointer
+from slowbeast.ir.instruction import GlobalVariable
+from slowbeast.ir.types import get_offset_type
+from slowbeast.symexe.memory import Memory as SEMemory
+from slowbeast.symexe.memoryobject import MemoryObject as SEMemoryObject, bytes_items
+
+SIZE = 32
+OFFSET_BITS = get_offset_type().bitwidth()
+
+
+def offset(n):
+    return ConcreteBitVec(n, OFFSET_BITS)
+
+
+def new_object(zeroed):
+    mo = MemoryObject(offset(SIZE), is_global=zeroed)
+    if zeroed:
+        g = GlobalVariable(offset(SIZE), "g")
+        g.set_zeroed()
+        mo.set_allocation(g)
+    return mo
+
+
+def check_index(rnd, mo):
+    """The sorted offsets index the stored values that do not overlap"""
+    values = mo._values
+    assert mo._offsets == sorted(values)
+    for a, b in zip(mo._offsets, mo._offsets[1:]):
+        assert a + values[a].bytewidth() <= b
+    h = 0
+    for o, v in values.items():
+        h ^= hash((o, v))
+    assert mo._values_hash == h
+    for _ in range(10):
+        off, bts = rnd.randrange(SIZE), rnd.randrange(1, 9)
+        assert mo._overlapping(off, bts) == [
+            o
+            for o in mo._offsets
+            if o < off + bts and off < o + values[o].bytewidth()
+        ]
+
+
+def write(rnd, mo, model):
+    """Write a random value to the object and the bytes of the model.
+    A byte of the model is None (not written), an int or a pair
+    of a pointer and the index of the byte in it."""
+    if rnd.random() < 0.2:
+        x, width = Pointer(offset(rnd.randrange(1, 100))), 8
+    else:
+        width = rnd.choice((1, 2, 4, 8))
+        x = ConcreteBitVec(rnd.getrandbits(8 * width), 8 * width)
+    off = rnd.randrange(SIZE - width + 1)
+    end = off + width
+    # pointers cannot be split, so they can be overwritten only as a whole
+    splits = any(
+        isinstance(model[i], tuple)
+        and not off <= i - model[i][1] < i - model[i][1] + 8 <= end
+        for i in range(off, end)
+    )
+    err = mo.write(x, offset(off))
+    if splits:
+        assert err is not None and err.is_unsupported()
+        return
+    assert err is None
+    for i in range(width):
+        if isinstance(x, Pointer):
+            model[off + i] = (x, i)
+        else:
+            model[off + i] = (x.value() >> (8 * i)) & 0xFF
+
+
+def read(rnd, mo, model, zeroed):
+    bts = rnd.choice((1, 2, 3, 4, 8))
+    off = rnd.randrange(SIZE - bts + 1)
+    val, err = mo.read(bts, offset(off))
+    data = model[off : off + bts]
+    if isinstance(data[0], tuple) and data[0][1] == 0 and bts == 8:
+        ptr = data[0][0]
+        if all(b == (ptr, i) for i, b in enumerate(data)):
+            assert err is None and val is ptr
+            return
+    if any(isinstance(b, tuple) for b in data):
+        assert val is None and (err.is_unsupported() or err.is_uninit_read())
+        return
+    if None in data and not zeroed:
+        assert val is None and err.is_uninit_read()
+        return
+    assert err is None
+    assert val.bytewidth() == bts
+    assert val.value() == sum((b or 0) << (8 * i) for i, b in enumerate(data))
+
+
+@pytest.mark.parametrize("zeroed", [False, True])
+@pytest.mark.parametrize("seed", range(30))
+def test_read_and_write(seed, zeroed):
+    rnd = random.Random(seed)
+    mo, model = new_object(zeroed), [None] * SIZE
+    copies = []
+    for _ in range(200):
+        if rnd.random() < 0.5:
+            write(rnd, mo, model)
+            check_index(rnd, mo)
+        else:
+            read(rnd, mo, model, zeroed)
+        if rnd.random() < 0.05:
+            copies.append((mo.writable_copy(), model.copy()))
+    # the copies are not changed by the writes to the object
+    for mo, model in copies:
+        check_index(rnd, mo)
+        for _ in range(20):
+            read(rnd, mo, model, zeroed)
+
+
+def values_hash(mo):
+    """The hash of the values of the object computed from scratch"""
+    vals = mo._values
+    h = 0
+    for o, v in bytes_items(vals) if isinstance(vals, list) else vals.items():
+        h ^= hash((o, v))
+    return h
+
+
+def random_value(rnd):
+    """A random integer or float. Floats cannot be split, so their partial
+    overwrites promote the object to bytes."""
+    if rnd.random() < 0.2:
+        return ConcreteFloat(rnd.random(), rnd.choice((32, 64)))
+    width = rnd.choice((1, 2, 4, 8))
+    return ConcreteBitVec(rnd.getrandbits(8 * width), 8 * width)
+
+
+def random_write(rnd, write, size=SIZE):
+    x = random_value(rnd)
+    return write(x, offset(rnd.randrange(size - x.bytewidth() + 1)))
+
+
+def test_promotion_hash():
+    mo = SEMemoryObject(offset(SIZE))
+    assert mo.write(ConcreteFloat(1.5, 64), offset(0)) is None
+    assert mo.write(ConcreteBitVec(7, 32), offset(8)) is None
+    assert not mo._is_bytes()
+    # a partial overwrite of the float
+    assert mo.write(ConcreteBitVec(0xAB, 16), offset(6)) is None
+    assert mo._is_bytes()
+    assert mo._values_hash == values_hash(mo)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_symexe_values_hash(seed):
+    rnd = random.Random(seed)
+    mo = SEMemoryObject(offset(SIZE))
+    copies = []
+    for _ in range(100):
+        assert random_write(rnd, mo.write) is None
+        assert mo._values_hash == values_hash(mo)
+        if rnd.random() < 0.1:
+            copies.append((mo.writable_copy(), mo._values_hash))
+    # the writes to the object do not change the copies
+    for copy, h in copies:
+        assert copy._values_hash == h == values_hash(copy)
+
+
+def objects_hash(mem):
+    """The hash of the objects of the memory computed from scratch"""
+    h = 0
+    for objects in (mem._objects, mem._glob_objects):
+        for o in objects.values():
+            o = mem._materialized(o)
+            assert o._values_hash == values_hash(o)
+            h ^= o.structural_hash()
+    return h
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_objects_hash(seed):
+    rnd = random.Random(seed)
+    mem = SEMemory()
+    mem.push_call(None, None, {})
+    ptrs = [
+        mem.allocate_global(GlobalVariable(offset(SIZE), f"g{i}"), zeroed=i == 0)
+        for i in range(3)
+    ]
+    scopes = []
+    for _ in range(200):
+        r = rnd.random()
+        if r < 0.4:
+            ptr = rnd.choice(ptrs)
+            random_write(rnd, lambda x, off: mem.write(Pointer(ptr.object(), off), x))
+        elif r < 0.5:
+            assert mem.read(rnd.choice(ptrs), 1) is not None
+        elif r < 0.6:
+            mem.defer_init(rnd.choice(ptrs), random_value(rnd))
+        elif r < 0.65:
+            mem.havoc_obj(rnd.choice(ptrs).object().value())
+        elif r < 0.7:
+            objs = [mem.get_obj(p.object()) for p in rnd.sample(ptrs, 2)]
+            mem.havoc(objs, without=objs[:1])
+        elif r < 0.8:
+            mem.push_call(None, None, {})
+            scopes.append(len(ptrs))
+            ptrs.append(mem.allocate(offset(SIZE)))
+        elif r < 0.85 and scopes:
+            mem.pop_call()
+            del ptrs[scopes.pop() :]
+        elif r < 0.9:
+            ptrs.append(mem.allocate(offset(SIZE), zeroed=rnd.random() < 0.5))
+        elif r < 0.95:
+            # the copy and the original continue independently
+            mem = rnd.choice((mem, mem.copy()))
+        else:
+            snapshot, h = mem.snapshot(), mem.objects_hash()
+            random_write(rnd, lambda x, off: mem.write(ptrs[0], x))
+            assert snapshot.objects_hash() == h == objects_hash(snapshot)
+        assert mem.objects_hash() == objects_hash(mem)
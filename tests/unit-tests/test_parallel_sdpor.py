@@ -0,0 +1,184 @@
+import os
+
+import pytest
+
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.ir.bblock import BBlock
+from slowbeast.ir.function import Function
+from slowbeast.ir.instruction import Return
+from slowbeast.ir.program import Program
+from slowbeast.ir.types import type_mgr
+from slowbeast.symexe.options import SEOptions
+from slowbeast.symexe.threads import interpreterParallelSDPOR as parallel
+from slowbeast.symexe.threads.interpreterParallelSDPOR import (
+    ParallelSPORSymbolicInterpreter,
+    SharedNode,
+    WorkerError,
+)
+
+I32 = type_mgr().bv_ty(32)
+
+
+def coordinator():
+    """An interpreter used only for the tree of shared nodes"""
+    return ParallelSPORSymbolicInterpreter.__new__(ParallelSPORSymbolicInterpreter)
+
+
+def node(sleep=(), scheduled=()):
+    return frozenset(sleep), frozenset(scheduled)
+
+
+def test_schedule_thread_once():
+    c, root = coordinator(), SharedNode()
+    item = c._schedule_thread(root, (), (node({2}),), 1)
+    assert item == ((), (node({2}),), 1)
+    assert root.scheduled == {1}
+    # scheduled already
+    assert c._schedule_thread(root, (), (node(),), 1) is None
+    # asleep
+    assert c._schedule_thread(root, (), (node(),), 2) is None
+    assert c._schedule_thread(root, (), (node(),), 0) == ((), (node({2}, {1}),), 0)
+
+
+def test_schedule_thread_on_path():
+    c, root = coordinator(), SharedNode()
+    steps = ((0, 0), (1, 1))
+    nodes = (node({3}), node(), node({0}, {2}))
+    assert c._schedule_thread(root, steps, nodes, 1) == (
+        steps,
+        (node({3}, {0}), node((), {1}), node({0}, {2})),
+        1,
+    )
+    child = root.children[(0, 0)]
+    leaf = child.children[(1, 1)]
+    assert leaf.scheduled == {1, 2}
+    # the threads of the steps are scheduled at the nodes of the path
+    assert c._schedule_thread(root, (), (node(),), 0) is None
+    assert c._schedule_thread(root, steps[:1], nodes[:2], 1) is None
+    # another successor of the same step is another node
+    other = ((0, 0), (1, 0))
+    assert c._schedule_thread(root, other, (node(), node(), node()), 1) is not None
+    assert len(child.children) == 2
+    # the sleep sets reported for a node are merged
+    assert c._schedule_thread(root, steps, (node(), node(), node({1})), 3) == (
+        steps,
+        (node({3}, {0}), node((), {1}), node({0, 1}, {1, 2})),
+        3,
+    )
+    assert c._schedule_thread(root, steps, (node(), node(), node()), 0) is None
+
+
+def test_schedule_successor():
+    c, root = coordinator(), SharedNode()
+    steps = ((0, 1),)
+    item = c._schedule_successor(root, steps, (node(), node({1})))
+    assert item == (steps, (node((), {0}), node({1})), None)
+    # the successor is a node of the tree, threads scheduled there later
+    # are not scheduled again
+    assert c._schedule_thread(root, steps, (node(), node()), 2) is not None
+    assert c._schedule_thread(root, steps, (node(), node()), 2) is None
+    assert c._schedule_thread(root, steps, (node(), node()), 1) is None
+
+
+class Process:
+    def __init__(self, pid):
+        self.pid = pid
+
+
+class Context:
+    def __init__(self, *pids):
+        self.pids = pids
+
+    def active_children(self):
+        return [Process(pid) for pid in self.pids]
+
+
+class Result:
+    def __init__(self, ready, error=None):
+        self._ready = ready
+        self._error = error
+
+    def ready(self):
+        return self._ready
+
+    def successful(self):
+        assert self._ready
+        return self._error is None
+
+    def get(self):
+        if self._error is not None:
+            raise self._error
+
+
+def test_check_workers():
+    pending, done = Result(False), Result(True)
+    results = [pending, done]
+    assert parallel._check_workers(Context(1, 2), {1, 2}, results) is None
+    assert results == [pending]
+    failed = Result(True, ValueError("boom"))
+    results = [pending, failed]
+    assert parallel._check_workers(Context(1, 2), {1, 2}, results) == repr(
+        ValueError("boom")
+    )
+    # the pool replaces a dead worker, the new one does not hide the death
+    assert "died" in parallel._check_workers(Context(1, 3), {1, 2}, [])
+
+
+class Queue(list):
+    put = list.append
+
+
+class FailingWorker:
+    def __init__(self):
+        self._queue = Queue()
+
+    def explore_item(self, item):
+        raise ValueError("boom")
+
+
+def test_explore_item_reports_error(monkeypatch):
+    worker = FailingWorker()
+    monkeypatch.setattr(parallel, "_worker", worker)
+    with pytest.raises(ValueError):
+        parallel._explore_item(((), (node(),), None))
+    assert worker._queue == [("error", repr(ValueError("boom")))]
+
+
+def program():
+    P = Program()
+    main = Function("main", [], I32)
+    P.add_fun(main)
+    BBlock(main).append(Return(concrete_value(0, I32), I32))
+    P.set_entry(main)
+    return P
+
+
+def interpreter(cls):
+    opts = SEOptions()
+    opts.threads = True
+    opts.threads_dpor_jobs = 2
+    return cls(program(), None, opts)
+
+
+class RaisingInterpreter(ParallelSPORSymbolicInterpreter):
+    def explore_item(self, item):
+        raise ValueError("boom")
+
+
+class DyingInterpreter(ParallelSPORSymbolicInterpreter):
+    def explore_item(self, item):
+        os._exit(1)
+
+
+def test_run():
+    I = interpreter(ParallelSPORSymbolicInterpreter)
+    assert I.run() == 0
+    assert not I.data_race
+    assert I.stats.paths == 1
+
+
+@pytest.mark.parametrize("cls", [RaisingInterpreter, DyingInterpreter])
+def test_run_fails_with_worker(cls):
+    I = interpreter(cls)
+    with pytest.raises(WorkerError):
+        I.run()
@@ -0,0 +1,69 @@
+from z3 import Bool, Solver, sat
+
+from slowbeast.solvers import pool
+from slowbeast.solvers.pool import NO_TIMEOUT, SolverPool
+
+
+class RecordingSolver(Solver):
+    """Z3 solver that records the parameters set to it"""
+
+    def __init__(self):
+        super().__init__()
+        self.params = []
+
+    def set(self, *args, **keys):
+        self.params.append(args)
+        super().set(*args, **keys)
+
+
+def test_reset_interval(monkeypatch):
+    monkeypatch.setattr(pool, "POOL_RESET_INTERVAL", 3)
+    p = SolverPool()
+    a = Bool("a")
+    solver = None
+    for n in range(1, 8):
+        with p.solver() as s:
+            assert solver is None or s is solver
+            solver = s
+            assert len(s.assertions()) == 0
+            s.add(a)
+            assert s.check() == sat
+        assert len(solver.assertions()) == 0 and solver.num_scopes() == 0
+        assert p.resets == n // 3
+        assert p._uses[id(solver)] == n % 3
+    assert (p.created, p.acquired) == (1, 7)
+
+
+def test_timeout_of_solver_from_other_bucket(monkeypatch):
+    monkeypatch.setattr(pool, "Z3Solver", RecordingSolver)
+    p = SolverPool()
+    with p.solver(100) as s:
+        assert s.params == [("timeout", 100)]
+    # the only free solver has another timeout
+    with p.solver(200) as t:
+        assert t is s
+        assert s.params[-1] == ("timeout", 200)
+    assert p._free[100] == [] and p._free[200] == [s]
+    # taken from its bucket, the timeout is not set again
+    with p.solver(200) as t:
+        assert t is s and len(s.params) == 2
+        # setting the same timeout does nothing
+        p.set_timeout(s, 200)
+        assert len(s.params) == 2
+        p.set_timeout(s, None)
+        assert s.params[-1] == ("timeout", NO_TIMEOUT)
+    assert p._free[NO_TIMEOUT] == [s]
+    with p.solver() as t:
+        assert t is s and len(s.params) == 3
+    assert p.created == 1
+
+
+def test_capacity():
+    p = SolverPool(capacity=2)
+    solvers = [p.acquire(10) for _ in range(3)]
+    assert p.created == 3
+    for s in solvers:
+        p.release(s)
+    assert p._free[10] == solvers[:2]
+    # the dropped solver is forgotten
+    assert set(p._uses) == set(p._timeouts) == {id(s) for s in solvers[:2]}
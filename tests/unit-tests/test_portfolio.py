@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.ir.types import type_mgr
+from slowbeast.solvers import portfolio
+from slowbeast.solvers.portfolio import solve_portfolio
+from slowbeast.solvers.symcrete import global_expr_mgr
+
+
+def _unknown(expr, em, to2):
+    return None
+
+
+def _raising(expr, em, to2):
+    raise ValueError("boom")
+
+
+def _dying(expr, em, to2):
+    os._exit(1)
+
+
+def _false(expr, em, to2):
+    return False
+
+
+def _slow_true(expr, em, to2):
+    time.sleep(0.5)
+    return True
+
+
+def _hanging_true(expr, em, to2):
+    time.sleep(60)
+    return True
+
+
+def expr():
+    em = global_expr_mgr()
+    x = em.symbolic_value("x", type_mgr().bv_ty(32))
+    return em.Lt(x, concrete_value(5, 32))
+
+
+def solve(monkeypatch, *strategies):
+    monkeypatch.setattr(portfolio, "STRATEGIES", strategies)
+    return solve_portfolio(expr(), global_expr_mgr())
+
+
+def test_unknown_wins_nothing(monkeypatch):
+    assert solve(monkeypatch, _unknown, _raising, _slow_true) is True
+    assert solve(monkeypatch, _slow_true, _unknown) is True
+
+
+def test_first_definite_answer_wins(monkeypatch):
+    start = time.perf_counter()
+    assert solve(monkeypatch, _hanging_true, _unknown, _false) is False
+    # the other strategies are killed
+    assert time.perf_counter() - start < 30
+
+
+@pytest.mark.parametrize(
+    "strategies",
+    [(_unknown,), (_unknown, _raising), (_dying, _unknown), (_dying, _dying)],
+)
+def test_no_definite_answer(monkeypatch, strategies):
+    assert solve(monkeypatch, *strategies) is None
+
+
+def test_strategies():
+    em = global_expr_mgr()
+    x = em.symbolic_value("x", type_mgr().bv_ty(32))
+    c = lambda v: concrete_value(v, 32)
+    assert solve_portfolio(em.And(em.Lt(x, c(5)), em.Gt(x, c(3))), em) is True
+    assert solve_portfolio(em.And(em.Lt(x, c(3)), em.Gt(x, c(5))), em) is False
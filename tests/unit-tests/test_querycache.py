@@ -0,0 +1,149 @@
+import random
+from itertools import combinations
+
+import pytest
+from z3 import And, Bool, Not, Solver, sat
+
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.ir.types import type_mgr
+from slowbeast.solvers.querycache import QueryCache
+from slowbeast.solvers.symcrete import SymbolicSolver, global_expr_mgr
+
+
+def random_conflicts(rnd, n):
+    """A query (a set of formula ids) is unsatisfiable iff it contains
+    one of these pairs, so the unsatisfiability is monotone"""
+    return [pair for pair in combinations(range(n), 2) if rnd.random() < 0.1]
+
+
+def is_sat(key, conflicts):
+    return not any(i in key and j in key for i, j in conflicts)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_subsumption(seed):
+    """Without evictions, the cache knows exactly the results that follow
+    from the queries put into it"""
+    rnd = random.Random(seed)
+    conflicts = random_conflicts(rnd, 12)
+    cache = QueryCache(10000)
+    known = {}
+    for _ in range(300):
+        key = frozenset(rnd.sample(range(12), rnd.randrange(1, 7)))
+        if rnd.random() < 0.4:
+            result = is_sat(key, conflicts)
+            cache.put(key, (), result)
+            known[key] = result
+        if key in known:
+            expected = known[key]
+        elif any(not r and k <= key for k, r in known.items()):
+            expected = False
+        elif any(r and key <= k for k, r in known.items()):
+            expected = True
+        else:
+            expected = None
+        assert cache.get(key) is expected
+        assert len(cache) == len(known)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_eviction(seed):
+    rnd = random.Random(seed)
+    conflicts = random_conflicts(rnd, 12)
+    capacity = rnd.randrange(1, 20)
+    cache = QueryCache(capacity)
+    for _ in range(300):
+        key = frozenset(rnd.sample(range(12), rnd.randrange(1, 7)))
+        result = cache.get(key)
+        assert result is None or result == is_sat(key, conflicts)
+        if rnd.random() < 0.5:
+            cache.put(key, (), is_sat(key, conflicts))
+        assert len(cache) <= capacity
+        # the indices refer exactly to the cached queries
+        entries = cache._entries
+        sat_index = {}
+        for k, (r, _) in entries.items():
+            if r:
+                for i in k:
+                    sat_index.setdefault(i, set()).add(k)
+        assert cache._sat_index == sat_index
+        unsat = {k for k, (r, _) in entries.items() if not r}
+        assert {k for keys in cache._unsat_index.values() for k in keys} == unsat
+        assert all(max(k) == i for i, ks in cache._unsat_index.items() for k in ks)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_models(seed):
+    """The results of queries answered by the models agree with the solver"""
+    rnd = random.Random(seed)
+    atoms = [Bool(f"b{i}") for i in range(5)]
+    literals = atoms + [Not(a) for a in atoms]
+    cache = QueryCache()
+    for _ in range(100):
+        formulas = rnd.sample(literals, rnd.randrange(1, 5))
+        if rnd.random() < 0.3:
+            formulas = [And(formulas)]
+        key, conjuncts = QueryCache.query(formulas)
+        solver = Solver()
+        solver.add(*conjuncts)
+        expected = solver.check() == sat
+        result = cache.get(key, conjuncts)
+        assert result is None or result == expected
+        if result is None:
+            cache.put(key, conjuncts, expected)
+            if expected:
+                cache.add_model(solver.model())
+    assert cache.model_hits > 0
+
+
+def cache_state(cache):
+    return (
+        cache.hits,
+        cache.subsumed,
+        cache.model_hits,
+        cache.misses,
+        list(cache._entries),
+        list(cache._models),
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_peek(seed):
+    """peek() answers as get() does, but it does not change the cache"""
+    rnd = random.Random(seed)
+    atoms = [Bool(f"b{i}") for i in range(5)]
+    literals = atoms + [Not(a) for a in atoms]
+    cache = QueryCache(20)
+    for _ in range(100):
+        key, conjuncts = QueryCache.query(rnd.sample(literals, rnd.randrange(1, 5)))
+        state = cache_state(cache)
+        result = cache.peek(key, conjuncts)
+        assert cache_state(cache) == state
+        assert cache.get(key, conjuncts) is result
+        if result is None:
+            solver = Solver()
+            solver.add(*conjuncts)
+            r = solver.check() == sat
+            cache.put(key, conjuncts, r)
+            if r:
+                cache.add_model(solver.model())
+    assert cache.model_hits > 0 and cache.subsumed > 0
+
+
+def test_check_branch_statistics():
+    """The path condition known to be satisfiable decides the other
+    direction of a branch, the lookup is not counted as a hit"""
+    em = global_expr_mgr()
+    x = em.symbolic_value("x", type_mgr().bv_ty(32))
+    pc = em.Lt(x, concrete_value(5, 32))
+    solver = SymbolicSolver()
+    cache = solver._cache
+    # the path condition is satisfiable, but no model is known
+    cache.put(*QueryCache.query([pc.unwrap()]), True)
+    assert solver.check_branch([pc], em.Gt(x, concrete_value(7, 32))) == (
+        False,
+        True,
+    )
+    assert (cache.hits, cache.subsumed, cache.model_hits) == (0, 0, 0)
+    # the misses of the two directions
+    assert cache.misses == 2
@@ -0,0 +1,221 @@
+from slowbeast.ir.instruction import Call, Load
+from slowbeast.symexe.threads.interpreterSDPOR import (
+    ExplorationFrame,
+    SPORSymbolicInterpreter,
+    VisitedState,
+)
+from slowbeast.symexe.threads.trace import Action, Trace
+from tests.utils.traces import I32, LOCATIONS, LOCK, MUTEXES, PTR, UNLOCK
+
+M0, M1 = MUTEXES
+
+
+class State:
+    """The part of a state that the bookkeeping of the exploration uses"""
+
+    def __init__(self, trace, threads=(0, 1), fingerprint=("state",)):
+        self.trace = trace
+        self._threads = threads
+        self._fingerprint = fingerprint
+
+    def fingerprint(self):
+        return self._fingerprint
+
+    def is_ready(self):
+        return True
+
+    def thread_ids(self):
+        return self._threads
+
+    def thread_ro(self, tid):
+        return self
+
+    def is_paused(self):
+        return False
+
+    def is_detached(self):
+        return False
+
+
+class Interpreter(SPORSymbolicInterpreter):
+    """Stateful SDPOR that does not execute anything. The threads enabled
+    after a prefix of the trace are its length and 7."""
+
+    def __init__(self) -> None:
+        self._visited = {}
+        self._frames = []
+        self._base = 0
+        self.data_race = False
+        self.log_trace = []
+
+    def enabled_threads_at(self, node):
+        return {node.pos + 1, 7}
+
+
+def lock(tid, mutex):
+    instr = Call(LOCK, I32, [mutex], [PTR])
+    instr.succ = True
+    return Action(tid, instr)
+
+
+def unlock(tid, mutex):
+    return Action(tid, Call(UNLOCK, I32, [mutex], [PTR]))
+
+
+def read(tid):
+    return Action(tid, Load(LOCATIONS[0], I32, [PTR]))
+
+
+def trace_of(*actions):
+    """A trace of the actions with an empty backtrack set at every prefix"""
+    trace = Trace()
+    trace.set_backtrack(set())
+    for e in actions:
+        trace.append_in_place(e)
+        trace.set_backtrack(set())
+    return trace
+
+
+def prefix(trace, length):
+    trace = trace.copy()
+    while len(trace) > length:
+        trace.trim()
+    return trace
+
+
+def locks_trace():
+    # 0: read 0, 1: lock m0 by 0, 2: read 1, 3: lock m1 by 1, 4: unlock m0 by 0
+    return trace_of(read(0), lock(0, M0), read(1), lock(1, M1), unlock(0, M0))
+
+
+def frame(interpreter, trace, sleep, fingerprint):
+    f = ExplorationFrame(State(trace), set(sleep))
+    f.fingerprint = fingerprint
+    f.visited = VisitedState(sleep, f.depth)
+    f.races = set()
+    interpreter._visited[fingerprint] = f.visited
+    return f
+
+
+def test_leave_passes_races_to_parent():
+    interpreter = Interpreter()
+    trace = locks_trace()
+    parent = frame(interpreter, prefix(trace, 3), {0}, "parent")
+    child = frame(interpreter, trace, {1}, "child")
+    child.races.update(
+        {(1, Action.LOCK, M0, 0), (3, Action.LOCK, M1, 1), (4, Action.UNLOCK, M0, 0)}
+    )
+    stack = [parent, child]
+    interpreter._leave(stack)
+    assert stack == [parent]
+    # only the races with the prefix of the parent are races of the parent
+    assert parent.races == {(1, Action.LOCK, M0, 0)}
+    assert not parent.partial
+    entry = interpreter._visited["child"]
+    assert entry is child.visited and entry.explored
+    assert entry.races == {
+        (Action.LOCK, M0, 0),
+        (Action.LOCK, M1, 1),
+        (Action.UNLOCK, M0, 0),
+    }
+    interpreter._leave(stack)
+    assert stack == []
+    assert interpreter._visited["parent"].races == {(Action.LOCK, M0, 0)}
+
+
+def test_leave_forgets_partially_explored_states():
+    interpreter = Interpreter()
+    trace = locks_trace()
+    parent = frame(interpreter, prefix(trace, 3), {0}, "parent")
+    child = frame(interpreter, trace, {1}, "child")
+    child.races.add((1, Action.LOCK, M0, 0))
+    child.partial = True
+    stack = [parent, child]
+    interpreter._leave(stack)
+    assert "child" not in interpreter._visited
+    assert parent.partial
+    assert parent.races == {(1, Action.LOCK, M0, 0)}
+    interpreter._leave(stack)
+    assert interpreter._visited == {}
+
+
+def test_leave_keeps_the_smaller_sleep_set():
+    interpreter = Interpreter()
+    trace = locks_trace()
+    # explored with a smaller sleep set: the old entry subsumes the new one
+    old = VisitedState({1}, 5)
+    old.explored = True
+    f = frame(interpreter, trace, {1, 2}, "state")
+    interpreter._visited["state"] = old
+    interpreter._leave([f])
+    assert interpreter._visited["state"] is old
+    # explored with a bigger sleep set: the new entry subsumes the old one
+    old = VisitedState({1, 2}, 5)
+    old.explored = True
+    f = frame(interpreter, trace, {1}, "state")
+    interpreter._visited["state"] = old
+    interpreter._leave([f])
+    assert interpreter._visited["state"] is f.visited
+    # the old entry is not explored
+    old = VisitedState(set(), 5)
+    f = frame(interpreter, trace, {1}, "state")
+    interpreter._visited["state"] = old
+    interpreter._leave([f])
+    assert interpreter._visited["state"] is f.visited
+
+
+def test_revisit_explored_state():
+    interpreter = Interpreter()
+    trace = locks_trace()
+    parent = frame(interpreter, prefix(trace, 3), {0}, "parent")
+    entry = VisitedState({0}, 5)
+    entry.explored = True
+    entry.races = frozenset({(Action.LOCK, M0, 0), (Action.LOCK, M1, 1)})
+    interpreter._revisit([parent], State(trace), entry)
+    actions = list(trace)
+    # the threads enabled before the racing heads are scheduled there
+    assert trace.get_backtrack(actions[1]) == {1, 7}
+    assert trace.get_backtrack(actions[3]) == {3, 7}
+    for e in (actions[0], actions[2], actions[4]):
+        assert trace.get_backtrack(e) == set()
+    # only the head on the prefix of the parent is its race
+    assert parent.races == {(1, Action.LOCK, M0, 0)}
+
+
+def test_revisit_closes_cycle():
+    """A state on the explored path is fully expanded and the state
+    is assumed to race with all the heads of locks"""
+    interpreter = Interpreter()
+    trace = trace_of(read(0), lock(0, M0), read(1), unlock(0, M0), read(1))
+    parent = frame(interpreter, prefix(trace, 4), {0}, "parent")
+    # the state after the first two actions is on the path, not explored
+    entry = VisitedState(set(), 2)
+    interpreter._revisit([parent], State(trace), entry)
+    actions = list(trace)
+    assert trace.get_backtrack(actions[0]) == set()
+    # the state on the path: all its enabled threads are scheduled
+    assert trace.get_backtrack(actions[2]) == {2, 7}
+    # the head of the lock
+    assert trace.get_backtrack(actions[1]) == {1, 7}
+    assert parent.races == {(1, Action.LOCK, M0, 0)}
+    assert trace.get_backtrack(actions[3]) == set()
+
+
+def test_enter_subsumed_by_smaller_sleep_set():
+    interpreter = Interpreter()
+    trace = locks_trace()
+    entry = VisitedState({0}, 5)
+    entry.explored = True
+    entry.races = frozenset({(Action.LOCK, M1, 1)})
+    interpreter._visited[("state",)] = entry
+    stack = []
+    # a bigger sleep set: the state is not explored again
+    interpreter._enter(stack, State(trace, (0, 1, 2)), {0, 1})
+    assert stack == []
+    assert trace.get_backtrack(list(trace)[3]) == {3, 7}
+    assert interpreter._visited[("state",)] is entry
+    # a sleep set that is not bigger: the state is explored
+    interpreter._enter(stack, State(trace, (0, 1, 2)), {1})
+    assert len(stack) == 1
+    assert stack[0].visited.sleep == {1} and not stack[0].visited.explored
+    assert interpreter._visited[("state",)] is stack[0].visited
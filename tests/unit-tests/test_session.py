@@ -0,0 +1,92 @@
+import random
+
+import pytest
+from z3 import Solver, sat
+
+from slowbeast.solvers.session import SolverSession
+from slowbeast.solvers.symcrete import global_expr_mgr
+
+
+def literals(n):
+    em = global_expr_mgr()
+    atoms = [em.symbolic_bool(f"s{i}") for i in range(n)]
+    return atoms + [em.Not(a) for a in atoms]
+
+
+def check_activation(session, solver, formulas):
+    """The Z3 solver of the session asserts exactly the formulas
+    added to the solver"""
+    z3solver = session.activate(solver._scope)
+    assert [a.get_id() for a in z3solver.assertions()] == [
+        f.unwrap().get_id() for f in formulas
+    ]
+
+
+def expected(formulas, query):
+    solver = Solver()
+    solver.add(*(f.unwrap() for f in formulas + query))
+    return solver.check() == sat
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_scope_tree(seed):
+    """Random forks, additions and queries of solvers in one session
+    agree with solvers that assert the formulas from scratch"""
+    rnd = random.Random(seed)
+    lits = literals(6)
+    session = SolverSession()
+    # the solvers with the formulas added to them
+    solvers = [(session.solver(), [])]
+    for _ in range(200):
+        idx = rnd.randrange(len(solvers))
+        solver, formulas = solvers[idx]
+        r = rnd.random()
+        if r < 0.3:
+            f = rnd.choice(lits)
+            solver.add(f)
+            formulas.append(f)
+        elif r < 0.5:
+            solvers.append((solver.copy(), formulas.copy()))
+        elif r < 0.6 and len(solvers) > 1:
+            del solvers[idx]
+        else:
+            query = rnd.sample(lits, rnd.randrange(0, 3))
+            assert solver.is_sat(*query) is expected(formulas, query)
+            check_activation(session, solver, formulas)
+        assert len(session._stack) <= max(len(f) for _, f in solvers) + 1
+
+
+def test_activate_pops_to_common_ancestor():
+    a, b, c = literals(3)[:3]
+    session = SolverSession()
+    root = session.solver()
+    root.add(a)
+    left, right = root.copy(), root.copy()
+    left.add(b)
+    right.add(c)
+    check_activation(session, left, [a, b])
+    assert (session.pushes, session.pops) == (2, 0)
+    # the scope of root is shared, only the child scope is switched
+    check_activation(session, right, [a, c])
+    assert (session.pushes, session.pops) == (3, 1)
+    check_activation(session, right, [a, c])
+    assert (session.pushes, session.pops) == (3, 1)
+    check_activation(session, root, [a])
+    assert (session.pushes, session.pops) == (3, 2)
+    # a solver with no assertions resets the Z3 solver
+    check_activation(session, session.solver(), [])
+    assert (session.pushes, session.pops) == (3, 3)
+
+
+def test_activate_adds_formulas_of_grown_scope():
+    a, b, c = literals(3)[:3]
+    session = SolverSession()
+    solver = session.solver()
+    solver.add(a)
+    check_activation(session, solver, [a])
+    # the scope is not shared, so it grows instead of getting a child
+    solver.add(b)
+    check_activation(session, solver, [a, b])
+    assert session.pushes == 1
+    assert solver.is_sat(c) is True
+    assert solver.is_sat(global_expr_mgr().Not(b)) is False
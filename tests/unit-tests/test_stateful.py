@@ -0,0 +1,100 @@
+import pytest
+
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.ir.bblock import BBlock
+from slowbeast.ir.function import Function
+from slowbeast.ir.instruction import Branch, Call, Cmp, Return
+from slowbeast.ir.program import Program
+from slowbeast.ir.types import type_mgr
+from slowbeast.symexe.options import SEOptions
+from slowbeast.symexe.stateful import interpreter as stateful
+from slowbeast.symexe.stateful.interpreter import (
+    StatefulSymbolicInterpreter,
+    implies_constraints,
+)
+
+I32 = type_mgr().bv_ty(32)
+TRUE = concrete_value(True, type_mgr().bool_ty())
+
+
+def c32(v):
+    return concrete_value(v, I32)
+
+
+def loop_program(bound):
+    """x = nondet(); while (x < bound) ; return 0"""
+    P = Program()
+    nondet = Function("__VERIFIER_nondet_int", [], I32)
+    main = Function("main", [], I32)
+    P.add_fun(nondet)
+    P.add_fun(main)
+    entry, head, exit = BBlock(main), BBlock(main), BBlock(main)
+    x = Call(nondet, I32, [], [])
+    entry.append(x)
+    entry.append(Branch(TRUE, head, head))
+    c = Cmp(Cmp.LT, x, c32(bound), [I32, I32])
+    head.append(c)
+    head.append(Branch(c, head, exit))
+    exit.append(Return(c32(0), I32))
+    P.set_entry(main)
+    return P
+
+
+def run(P):
+    I = StatefulSymbolicInterpreter(P, None, SEOptions())
+    I.run()
+    return I
+
+
+def test_implies_constraints():
+    I = StatefulSymbolicInterpreter(loop_program(5), None, SEOptions())
+    state = I.executor().create_state()
+    em = state.expr_manager()
+    x = em.symbolic_value("x", I32)
+    state.add_constraint(em.Lt(x, c32(5)))
+    assert implies_constraints(state, [])
+    # the same constraint
+    assert implies_constraints(state, [em.Lt(x, c32(5))])
+    # implied, but not syntactically
+    assert implies_constraints(state, [em.Lt(x, c32(10))])
+    assert implies_constraints(state, [em.Lt(x, c32(5)), em.Ne(x, c32(7))])
+    assert not implies_constraints(state, [em.Lt(x, c32(3))])
+    assert not implies_constraints(state, [em.Lt(x, c32(5)), em.Gt(x, c32(0))])
+
+
+def test_is_subsumed():
+    P = loop_program(5)
+    I = StatefulSymbolicInterpreter(P, None, SEOptions())
+    pc, other_pc = P.entry().bblock(1).instructions()
+    explored = I.executor().create_state(pc)
+    em = explored.expr_manager()
+    x = em.symbolic_value("x", I32)
+    explored.add_constraint(em.Lt(x, c32(10)))
+    assert not I.is_subsumed(explored)
+    # stronger constraints
+    state = explored.copy()
+    state.add_constraint(em.Lt(x, c32(5)))
+    assert I.is_subsumed(state)
+    state = I.executor().create_state(pc)
+    state.add_constraint(em.Lt(x, c32(3)))
+    assert I.is_subsumed(state)
+    # weaker constraints
+    state = I.executor().create_state(pc)
+    assert not I.is_subsumed(state)
+    # another location
+    state = explored.copy()
+    state.pc = other_pc
+    assert not I.is_subsumed(state)
+
+
+def test_run():
+    I = run(loop_program(5))
+    assert I.stats.exited_paths == 1
+
+
+def test_explored_states_are_bounded(monkeypatch):
+    monkeypatch.setattr(stateful, "EXPLORED_STATES_SIZE", 2)
+    I = run(loop_program(5))
+    assert I.stats.exited_paths == 1
+    assert sum(map(len, I.explored_states.values())) <= 2
+    assert I._explored_num == sum(map(len, I.explored_states.values()))
@@ -0,0 +1,244 @@
+from slowbeast.analysis.threadescape import ThreadEscape
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.ir.argument import Argument
+from slowbeast.ir.bblock import BBlock
+from slowbeast.ir.function import Function
+from slowbeast.ir.instruction import (
+    Alloc,
+    Call,
+    GlobalVariable,
+    Load,
+    Return,
+    Store,
+    Thread,
+    ThreadJoin,
+)
+from slowbeast.ir.program import Program
+from slowbeast.ir.types import get_size_type, type_mgr
+
+PTR = type_mgr().pointer_ty()
+I32 = type_mgr().bv_ty(32)
+
+
+def function(name, nargs=0):
+    return Function(name, [Argument(PTR) for _ in range(nargs)], PTR)
+
+
+def body(fun, *instrs):
+    """Put the instructions into a block of the function, returning
+    from it if the last instruction is not a return"""
+    block = BBlock(fun)
+    for I in instrs:
+        block.append(I)
+    if not isinstance(instrs[-1], Return):
+        block.append(Return())
+
+
+def program(main, *funs, globs=()):
+    P = Program()
+    for f in (main, *funs):
+        P.add_fun(f)
+    for g in globs:
+        P.add_global(g)
+    P.set_entry(main)
+    return P
+
+
+def alloc():
+    return Alloc(concrete_value(4, get_size_type()))
+
+
+def global_var(name):
+    return GlobalVariable(concrete_value(4, get_size_type()), name)
+
+
+def store(val, ptr):
+    return Store(val, ptr, [val.type(), PTR])
+
+
+def load(ptr, ty=I32):
+    return Load(ptr, ty, [PTR])
+
+
+def thread(fun, arg):
+    return Thread(fun, [arg], [PTR])
+
+
+def call(fun, *args):
+    return Call(fun, PTR, list(args), [PTR] * len(args))
+
+
+def one():
+    return concrete_value(1, I32)
+
+
+def test_address_passed_to_thread():
+    main, worker = function("main"), function("worker", 1)
+    a, b = alloc(), alloc()
+    sa, sb = store(one(), a), store(one(), b)
+    body(main, a, b, thread(worker, a), sa, sb)
+    body(worker, store(one(), worker.argument(0)))
+    te = ThreadEscape(program(main, worker))
+    assert te.escapes(a)
+    assert not te.is_thread_local(a)
+    assert not te.is_thread_local(worker.argument(0))
+    assert not te.escapes(b)
+    assert te.is_thread_local(b)
+    assert te.thread_local_pointers() == frozenset((b,))
+
+
+def test_address_stored_into_shared_global():
+    main, worker = function("main"), function("worker", 1)
+    g, a, b = global_var("g"), alloc(), alloc()
+    body(
+        main, a, b, store(a, g), store(one(), a), store(one(), b), thread(worker, b)
+    )
+    ptr = load(g, PTR)
+    body(worker, ptr, load(ptr))
+    te = ThreadEscape(program(main, worker, globs=(g,)))
+    assert te.escapes(g)
+    assert te.escapes(a)
+    assert not te.is_thread_local(a)
+
+
+def test_address_stored_into_unknown_memory():
+    main, ext = function("main"), function("external")
+    a, b = alloc(), alloc()
+    ptr = call(ext)
+    body(main, a, b, ptr, store(a, ptr), store(one(), a), store(one(), b))
+    te = ThreadEscape(program(main))
+    assert te.escapes(a)
+    assert not te.is_thread_local(a)
+    assert not te.is_thread_local(ptr)
+    assert te.is_thread_local(b)
+
+
+def test_address_stored_into_local_object():
+    """An object whose address is stored only in a thread-local object
+    does not escape, but it escapes with the object that holds it"""
+    main, worker = function("main"), function("worker", 1)
+    a, b, c, d = alloc(), alloc(), alloc(), alloc()
+    body(main, a, b, c, d, store(a, b), store(c, d), thread(worker, d))
+    body(worker, store(one(), worker.argument(0)))
+    te = ThreadEscape(program(main, worker))
+    assert not te.escapes(a) and not te.escapes(b)
+    assert te.escapes(c) and te.escapes(d)
+
+
+def test_address_passed_to_undefined_function():
+    main, worker = function("main"), function("worker", 1)
+    ext, lock = function("external", 1), function("pthread_mutex_lock", 1)
+    a, m = alloc(), alloc()
+    body(
+        main,
+        a,
+        m,
+        call(ext, a),
+        call(lock, m),
+        store(one(), a),
+        store(one(), m),
+        thread(worker, m),
+    )
+    body(worker, call(lock, worker.argument(0)))
+    te = ThreadEscape(program(main, worker))
+    assert te.escapes(a)
+    assert not te.is_thread_local(a)
+    # the mutex escapes only because it is passed to the thread
+    assert te.escapes(m)
+
+
+def test_address_passed_to_non_capturing_function():
+    main = function("main")
+    lock = function("pthread_mutex_lock", 1)
+    m = alloc()
+    body(main, m, call(lock, m), store(one(), m))
+    te = ThreadEscape(program(main))
+    assert not te.escapes(m)
+    assert te.is_thread_local(m)
+
+
+def test_address_returned_from_thread():
+    main, worker = function("main"), function("worker", 1)
+    helper = function("helper")
+    a, b = alloc(), alloc()
+    body(worker, a, store(one(), a), Return(a, PTR))
+    body(helper, b, store(one(), b), Return(b, PTR))
+    ret = call(helper)
+    join = ThreadJoin(PTR, [], [])
+    body(main, ret, thread(worker, ret), join, store(one(), ret), store(one(), join))
+    te = ThreadEscape(program(main, worker, helper))
+    assert te.escapes(a)
+    assert not te.is_thread_local(a)
+    # the value returned from a thread is unknown
+    assert not te.is_thread_local(join)
+    # b is returned from a function, but it escapes only via the thread
+    assert te.escapes(b)
+
+
+def test_address_returned_from_function():
+    main, helper = function("main"), function("helper")
+    b = alloc()
+    body(helper, b, Return(b, PTR))
+    ret = call(helper)
+    body(main, ret, store(one(), ret))
+    te = ThreadEscape(program(main, helper))
+    assert not te.escapes(b)
+    assert te.is_thread_local(ret)
+
+
+def test_globals_used_only_by_main():
+    main, worker, helper = function("main"), function("worker", 1), function("h")
+    g, h, k = global_var("g"), global_var("h"), global_var("k")
+    sg, sh, sk = store(one(), g), store(one(), h), store(one(), k)
+    body(main, sg, sh, sk, thread(worker, g))
+    body(worker, call(helper))
+    body(helper, load(h))
+    te = ThreadEscape(program(main, worker, helper, globs=(g, h, k)))
+    # passed to the thread
+    assert te.escapes(g)
+    # used by a function that the thread calls
+    assert te.escapes(h)
+    assert not te.is_thread_local(h)
+    # used only by main
+    assert not te.escapes(k)
+    assert te.is_thread_local(k)
+
+
+def test_globals_when_thread_calls_entry():
+    main, worker = function("main"), function("worker", 1)
+    g = global_var("g")
+    body(main, store(one(), g), thread(worker, g))
+    body(worker, call(main))
+    te = ThreadEscape(program(main, worker, globs=(g,)))
+    assert te.escapes(g)
+    assert not te.is_thread_local(g)
+
+
+def test_calls_through_address_taken_functions():
+    main, worker = function("main"), function("worker", 1)
+    helper, other = function("helper", 1), function("other")
+    fp, g, h = global_var("fp"), global_var("g"), global_var("h")
+    a = alloc()
+    body(
+        main,
+        a,
+        store(helper, fp),
+        store(one(), g),
+        store(one(), h),
+        store(one(), a),
+        thread(worker, a),
+    )
+    # a call via a function pointer may call any address-taken function
+    fun = load(fp, PTR)
+    body(worker, fun, call(fun, worker.argument(0)))
+    body(helper, store(one(), helper.argument(0)), load(g))
+    body(other, load(h))
+    te = ThreadEscape(program(main, worker, helper, other, globs=(fp, g, h)))
+    assert te.escapes(g)
+    assert not te.is_thread_local(g)
+    # other is neither address-taken nor called by the thread
+    assert not te.escapes(h)
+    assert te.is_thread_local(h)
+    # address-taken functions may get any arguments
+    assert te.points_to(helper.argument(0)) == frozenset((None,))
+    assert not te.is_thread_local(helper.argument(0))
@@ -0,0 +1,207 @@
+import random
+
+import pytest
+
+from slowbeast.symexe.threads.trace import Action, Trace
+from tests.utils.traces import (
+    random_action,
+    random_instruction,
+    random_trace,
+    same_action,
+)
+
+KINDS = (
+    Action.READ,
+    Action.WRITE,
+    Action.LOCK,
+    Action.UNLOCK,
+    Action.FORK,
+    Action.RETURN,
+)
+
+
+def naive_heads(actions):
+    """The last action of each thread and of each thread, kind and object"""
+    thread_last, heads = {}, {}
+    for e in actions:
+        thread_last[e.tid] = e
+        key = Trace._head_key(e)
+        if key is not None:
+            heads.setdefault(key, {})[e.tid] = e
+    return thread_last, heads
+
+
+def check_heads(trace):
+    thread_last, heads = naive_heads(list(trace))
+    assert trace._thread_last == thread_last
+    assert trace._heads == heads
+    for (kind, obj), last in heads.items():
+        for tid in (0, 1, 2):
+            assert trace.head(kind, obj, tid) is last.get(tid)
+    for kind in KINDS:
+        expected = [
+            e for (k, _), last in heads.items() if k == kind for e in last.values()
+        ]
+        assert sorted(e.pos for e in trace.heads_of_kind(kind)) == sorted(
+            e.pos for e in expected
+        )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_heads(seed):
+    rnd = random.Random(seed)
+    traces = [random_trace(rnd, rnd.randrange(0, 10))]
+    for _ in range(100):
+        trace = rnd.choice(traces)
+        r = rnd.random()
+        if r < 0.5:
+            trace.append_in_place(random_action(rnd, (0, 1, 2)))
+        elif r < 0.7 and len(trace) > 0:
+            trace.trim()
+        elif r < 0.85:
+            traces.append(trace.copy())
+        else:
+            traces.append(trace.append(random_action(rnd, (0, 1, 2))))
+        for t in traces:
+            check_heads(t)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_persistence(seed):
+    """Copies, appends and trims of a family of traces against lists"""
+    rnd = random.Random(seed)
+    trace = random_trace(rnd, rnd.randrange(0, 10))
+    family = [(trace, list(trace))]
+    clocks = {e: dict(e.clock) for e in trace}
+    for _ in range(100):
+        i = rnd.randrange(len(family))
+        trace, model = family[i]
+        r = rnd.random()
+        if r < 0.5:
+            e = random_action(rnd, (0, 1, 2))
+            trace.append_in_place(e)
+            model.append(e)
+            clocks[e] = dict(e.clock)
+        elif r < 0.7 and model:
+            trace.trim()
+            model.pop()
+        elif r < 0.85:
+            family.append((trace.copy(), model.copy()))
+        else:
+            e = random_action(rnd, (0, 1, 2))
+            family.append((trace.append(e), model + [e]))
+            clocks[e] = dict(e.clock)
+        for trace, model in family:
+            actions = list(trace)
+            assert len(actions) == len(model)
+            assert all(e is f for e, f in zip(actions, model))
+            assert len(trace) == len(model)
+            if model:
+                assert trace.last() is model[-1]
+            for pos, e in enumerate(model):
+                assert e.pos == pos
+                assert e.occurrence == 1 + sum(f.tid == e.tid for f in model[:pos])
+                assert e.clock == clocks[e]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_find_and_index(seed):
+    """The skew-binary jumps against a dict of the keys of the actions"""
+    rnd = random.Random(seed)
+    tids = (0, 1) if seed % 2 else (0, 1, 2, 3)
+    trace = random_trace(rnd, rnd.randrange(1, 300), tids=tids)
+    keys = {e.key(): e for e in trace}
+    most = max(e.occurrence for e in trace)
+    for tid in tids + (7,):
+        for occ in range(0, most + 2):
+            assert trace.find(tid, occ) is keys.get((tid, occ))
+    # a trace that shares a prefix with the trace
+    other = trace.copy()
+    for _ in range(rnd.randrange(len(trace))):
+        other.trim()
+    for _ in range(rnd.randrange(30)):
+        other.append_in_place(random_action(rnd, tids))
+    for e in other:
+        f = keys.get(e.key())
+        assert trace.index(e) == (None if f is None else f.pos)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_prefix_backtrack(seed):
+    rnd = random.Random(seed)
+    trace = Trace()
+    trace.set_backtrack(set())
+    # the backtrack sets of the prefixes of the trace, by their length
+    model = [set()]
+    for _ in range(rnd.randrange(1, 50)):
+        trace.append_in_place(random_action(rnd, (0, 1, 2)))
+        trace.set_backtrack(set())
+        model.append(set())
+    copy = trace.copy()
+    actions = list(trace)
+    for _ in range(50):
+        e = rnd.choice(actions)
+        t = rnd.randrange(3)
+        trace.add_to_prefix_backtrack(e, t)
+        model[e.pos].add(t)
+        for f in actions:
+            assert trace.get_backtrack(f) == model[f.pos]
+            assert copy.get_backtrack(f) == model[f.pos]
+    while len(trace) > 0:
+        assert trace.get_backtrack() == model[len(trace)]
+        trace.trim()
+    assert trace.get_backtrack() == model[0]
+    assert copy.get_backtrack() == model[-1]
+
+
+def frontier_actions(trace):
+    """The actions of the frontier of the trace, ordered by their positions"""
+    thread_last, heads = naive_heads(list(trace))
+    actions = {e.pos: e for e in thread_last.values()}
+    for last in heads.values():
+        actions.update((e.pos, e) for e in last.values())
+    return [actions[pos] for pos in sorted(actions)]
+
+
+def suffix_relations(trace, suffix):
+    """Races and causality of the suffix appended to the trace, with
+    the actions of the trace named by their rank in its frontier"""
+    names = {e: ("frontier", i) for i, e in enumerate(frontier_actions(trace))}
+    relations = []
+    for i, p in enumerate(suffix):
+        trace.append_in_place(p)
+        names[p] = ("suffix", i)
+        relations.append(
+            (
+                frozenset(names[e] for e in p.racist or ()),
+                frozenset(n for e, n in names.items() if p.happens_after(e)),
+            )
+        )
+    return relations
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_equal_frontiers(seed):
+    """Appending the same actions to traces with equal frontiers
+    yields the same races and causality"""
+    rnd = random.Random(seed)
+    tids = (0, 1, 2) if seed % 2 else (0, 1)
+    # few instructions executed repeatedly (as in loops), so that
+    # different traces have equal frontiers
+    instrs = [random_instruction(rnd, tids) for _ in range(4)]
+
+    def action():
+        return Action(rnd.choice(tids), rnd.choice(instrs))
+
+    groups = {}
+    for _ in range(300):
+        trace = Trace([action() for _ in range(rnd.randrange(0, 10))])
+        groups.setdefault(trace.frontier(), []).append(trace)
+    equal = [traces for traces in groups.values() if len(traces) > 1]
+    assert equal
+    for traces in equal:
+        suffix = [action() for _ in range(rnd.randrange(1, 8))]
+        expected = suffix_relations(traces[0].copy(), suffix)
+        for trace in traces[1:]:
+            copies = [same_action(e) for e in suffix]
+            assert suffix_relations(trace.copy(), copies) == expected
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from tests.utils.traces import random_trace
+
+
+def caused_by_closure(action):
+    """The actions that are transitively immediate causes of the action"""
+    causes, stack = set(), list(action.caused_by)
+    while stack:
+        e = stack.pop()
+        if e not in causes:
+            causes.add(e)
+            stack.extend(e.caused_by)
+    return causes
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_clocks_match_causality(seed):
+    rnd = random.Random(seed)
+    trace = random_trace(rnd, rnd.randrange(1, 40), races=False)
+    actions = list(trace)
+    closures = {p: caused_by_closure(p) for p in actions}
+    for p in actions:
+        for e in actions:
+            assert p.happens_after(e) == (e in closures[p]), (p.key(), e.key())
+        assert trace.get_caused_by(p) == closures[p]
+        assert trace.get_causes(p) == {q for q in actions if p in closures[q]}
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_independent_suffix_set(seed):
+    rnd = random.Random(seed)
+    trace = random_trace(rnd, rnd.randrange(2, 40), races=False)
+    actions = list(trace)
+    for e in actions[:-1]:
+        after = actions[actions.index(e) + 1 :]
+        suffix = [f for f in after[:-1] if not f.happens_after(e)] + after[-1:]
+        expected = set()
+        for i, f in enumerate(suffix):
+            if any(g.tid == f.tid for g in suffix[:i]):
+                continue
+            if not any(g is not f and f.happens_after(g) for g in suffix):
+                expected.add(f.tid)
+        assert trace.independent_suffix_set(e) == expected
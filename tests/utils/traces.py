@@ -0,0 +1,82 @@
+"""Random actions and traces for the tests of the threads' Trace"""
+
+from slowbeast.domains.concrete import concrete_value
+from slowbeast.domains.concrete_bitvec import ConcreteBitVec
+from slowbeast.domains.pointer import Pointer
+from slowbeast.ir.argument import Argument
+from slowbeast.ir.function import Function
+from slowbeast.ir.instruction import (
+    Call,
+    GlobalVariable,
+    Load,
+    Return,
+    Store,
+    Thread,
+    ThreadJoin,
+)
+from slowbeast.ir.types import get_offset_type, get_size_type, type_mgr
+from slowbeast.symexe.threads.trace import Action, Trace
+
+PTR = type_mgr().pointer_ty()
+I32 = type_mgr().bv_ty(32)
+
+LOCATIONS = [
+    GlobalVariable(concrete_value(4, get_size_type()), f"g{i}") for i in range(3)
+]
+MUTEXES = [
+    GlobalVariable(concrete_value(40, get_size_type()), f"m{i}") for i in range(2)
+]
+LOCK = Function("pthread_mutex_lock", [Argument(PTR)], I32)
+UNLOCK = Function("pthread_mutex_unlock", [Argument(PTR)], I32)
+WORKER = Function("worker", [Argument(PTR)], PTR)
+NULL = Pointer(ConcreteBitVec(0, get_offset_type().bitwidth()))
+
+
+def random_instruction(rnd, tids):
+    """A fresh instruction of a random kind. The thread instructions
+    get the id of a random thread as their operand."""
+    r = rnd.random()
+    if r < 0.35:
+        return Load(rnd.choice(LOCATIONS), I32, [PTR])
+    if r < 0.6:
+        return Store(concrete_value(1, I32), rnd.choice(LOCATIONS), [I32, PTR])
+    if r < 0.7:
+        instr = Call(LOCK, I32, [rnd.choice(MUTEXES)], [PTR])
+        instr.succ = rnd.random() < 0.8
+        return instr
+    if r < 0.8:
+        return Call(UNLOCK, I32, [rnd.choice(MUTEXES)], [PTR])
+    if r < 0.85:
+        instr = Thread(WORKER, [NULL], [PTR])
+    elif r < 0.9:
+        instr = ThreadJoin(PTR, [], [])
+    elif r < 0.95:
+        return Return(NULL, PTR)
+    else:
+        return Call(WORKER, PTR, [NULL], [PTR])
+    instr._operand_tid = rnd.choice(tids)
+    return instr
+
+
+def random_action(rnd, tids) -> Action:
+    return Action(rnd.choice(tids), random_instruction(rnd, tids))
+
+
+def random_trace(
+    rnd, length: int, tids=(0, 1, 2), local=frozenset(), races: bool = True
+) -> Trace:
+    """A trace of random actions. If races is False, the actions that would
+    be in a data race are left out (the trace stops updating the causality
+    of an action when it finds the race, the exploration ends there)."""
+    trace = Trace(local=local)
+    while len(trace) < length:
+        trace.append_in_place(random_action(rnd, tids))
+        if trace.data_race and not races:
+            trace.trim()
+            trace.data_race = False
+    return trace
+
+
+def same_action(action: Action) -> Action:
+    """A fresh action of the same thread with the same instruction"""
+    return Action(action.tid, action.instr)
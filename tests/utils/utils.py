@@ -1,5 +1,14 @@
-import yaml
+import os
 import subprocess
+import sys
+
+import yaml
+
+# sb-main in the root of the repository
+SB_MAIN = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "sb-main",
+)
 
 def evaluate_result(expected_verdict, output):
     noresult = True
@@ -30,9 +39,9 @@ def get_verdict(input_file, out_dir):
     return target_file, expected_verdict, out_dir_target
 
 
-def run_sb(target_file, out_dir_target, base_dir):
+def run_sb(target_file, out_dir_target, base_dir, options=()):
     output = subprocess.run(
-            ["./sb-main", base_dir + target_file, "-out-dir", out_dir_target],
+            [sys.executable, SB_MAIN, base_dir + target_file, "-out-dir", out_dir_target, *options],
             capture_output=True,
             text=True
         )